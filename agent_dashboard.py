@@ -0,0 +1,256 @@
+import os
+from datetime import datetime
+
+import dash
+from dash import dcc, html, Input, Output, State, ClientsideFunction, ALL
+from dash.dash_table import DataTable
+from dash.exceptions import PreventUpdate
+
+from client_store import count_payload
+from compression import install_compression
+from dashboard import WARMUP_POLL_INTERVAL, install_probes
+from date_range import DATE_INPUTS, date_controls, days_key, range_picker_props, register_date_mode, selected_days
+from figure_cache import FigureCache
+from lazy_pies import INITIAL_VISIBLE_PIES, PIE_TYPE, pie_slots, pie_stores, sheets_to_render
+from metrics import Metrics
+from pie_figures import pie_figure
+from table_export import export_hrefs, export_links, install_export
+
+
+def create_agent_app(source, dataset_holder, clientside_pies=None, metrics=None):
+    """Build the per-agent Category Distribution dashboard: one pie per agent
+    sheet for the picked day or range, and the rows of the agent and category
+    of the last slice clicked.
+
+    ``source`` loads the data into ``dataset_holder`` and keeps it current, as
+    a workbook_watcher.WorkbookWatcher or gsheet_source.SheetRefresher does:
+    ``source.load()`` runs on a background thread, then ``source.start()``.
+    The app serves a loading state meanwhile, fills in the pies, pickers and
+    table columns once the dataset arrives, and answers ``/ready`` with 503
+    until then. The thread is kept as ``app.warmup``.
+
+    As in dashboard.create_app, callbacks read ``dataset_holder.get()`` once,
+    ``clientside_pies`` defaults to the CLIENTSIDE_PIES setting, timings are
+    served on ``/metrics`` and the table's selection can be exported.
+    """
+    if clientside_pies is None:
+        # Set CLIENTSIDE_PIES=1 to send the per-date category counts to the browser
+        # once and redraw the pie charts there; only the table then calls the server
+        clientside_pies = os.environ.get('CLIENTSIDE_PIES') == '1'
+
+    # Serialized pie figures keyed by (dataset version, view, sheet, day); a
+    # reload bumps the version, which drops the figures built from older data
+    figure_cache = FigureCache()
+
+    # Initialize the Dash app
+    app = dash.Dash(__name__)
+    app.figure_cache = figure_cache
+
+    if metrics is None:
+        metrics = Metrics()
+    metrics.install(app.server, dataset_holder, figure_cache)
+    app.metrics = metrics
+    # gzip or brotli for the callback responses, the layout and the assets
+    install_compression(app.server)
+    # Streamed CSV and XLSX downloads of every row of the table's selection
+    install_export(app.server, dataset_holder)
+
+    def date_picker_props(dataset):
+        first, last = dataset.date_bounds()
+        return {
+            'min_date_allowed': first,
+            'max_date_allowed': last,
+            'initial_visible_month': last,
+            'date': datetime.now().date(),  # Default to today's date
+        }
+
+    def table_columns(dataset):
+        return [{"name": i, "id": i} for i in dataset.table_columns()]
+
+    def pie_counts(dataset):
+        # Per-date category counts for the client-side pie charts
+        return count_payload(dataset.count_cube) if clientside_pies else None
+
+    # Define the layout of the Dash app, rebuilt on each page load so the date
+    # range and the agent pies follow the reloaded data
+    def serve_layout():
+        dataset = dataset_holder.get()
+        # Before the first dataset arrives the page is served without data and
+        # polls until it can be filled in
+        loading = dataset is None
+        sheet_names = [] if loading else dataset.sheets
+        return html.Div([
+            html.H1("Category Distribution"),
+            html.Div("Loading call entries...", id='loading-banner',
+                     style={} if loading else {'display': 'none'}),
+            dcc.Interval(id='warmup-poll', interval=WARMUP_POLL_INTERVAL, disabled=not loading),
+            # Date Picker, with a range picker for weekly and monthly breakdowns
+            date_controls(
+                None if loading else date_picker_props(dataset),
+                None if loading else range_picker_props(*dataset.date_bounds())
+            ),
+            # Per-date category counts for the client-side pie charts
+            dcc.Store(id='pie-counts', data=None if loading else pie_counts(dataset)),
+            # Display pie charts for each sheet; a pie is only drawn once it scrolls into view
+            html.Div(id='pie-charts', className='pie-chart-container', children=pie_slots(sheet_names)),
+            *pie_stores(sheet_names),
+            # Sheet and category picked by the last pie chart click
+            dcc.Store(id='table-selection'),
+            # Display the interactive table
+            html.Div([
+                html.H2("Category Wise Data"),
+                # The server streams every matching row, not just the page on screen
+                export_links(),
+                DataTable(
+                    id='table',
+                    columns=[] if loading else table_columns(dataset),
+                    data=[],
+                    sort_action='custom',  # Sort on the server
+                    filter_action='custom',  # Filter on the server
+                    page_action='custom',  # Only the visible page is sent to the browser
+                    page_current=0,
+                    page_size=10,  # Set number of rows per page
+                )
+            ])
+        ])
+
+    app.layout = serve_layout
+    install_probes(app.server, dataset_holder)
+
+    # Fill in a page served during the load once the dataset is there
+    @app.callback(
+        [Output('date-picker', 'min_date_allowed'),
+         Output('date-picker', 'max_date_allowed'),
+         Output('date-picker', 'initial_visible_month'),
+         Output('date-picker', 'date'),
+         Output('date-range', 'min_date_allowed'),
+         Output('date-range', 'max_date_allowed'),
+         Output('date-range', 'initial_visible_month'),
+         Output('date-range', 'start_date'),
+         Output('date-range', 'end_date'),
+         Output('table', 'columns', allow_duplicate=True),
+         Output('pie-counts', 'data'),
+         Output('pie-charts', 'children'),
+         Output('pie-visibility', 'data'),
+         Output('loading-banner', 'children'),
+         Output('loading-banner', 'style'),
+         Output('warmup-poll', 'disabled')],
+        [Input('warmup-poll', 'n_intervals')],
+        prevent_initial_call=True
+    )
+    def hydrate(n_intervals):
+        dataset = dataset_holder.get()
+        if dataset is None:
+            if dataset_holder.error is None:
+                raise PreventUpdate
+            # Stop polling and say why the data will not appear
+            return [dash.no_update] * 13 + [f"Loading the data failed: {dataset_holder.error}", {}, True]
+        props = date_picker_props(dataset)
+        range_props = range_picker_props(*dataset.date_bounds())
+        return [props['min_date_allowed'], props['max_date_allowed'], props['initial_visible_month'],
+                props['date'], range_props['min_date_allowed'], range_props['max_date_allowed'],
+                range_props['initial_visible_month'], range_props['start_date'], range_props['end_date'],
+                table_columns(dataset), pie_counts(dataset), pie_slots(dataset.sheets),
+                dataset.sheets[:INITIAL_VISIBLE_PIES], dash.no_update, {'display': 'none'}, True]
+
+    register_date_mode(app)
+
+    # Work out the table selection from the last clicked pie chart and go back to
+    # the first page whenever it or the dates change
+    @app.callback(
+        [Output('table-selection', 'data'), Output('table', 'page_current')],
+        [Input({'type': PIE_TYPE, 'sheet': ALL}, 'clickData')] + DATE_INPUTS)
+    def update_table_selection(clickData, date_mode, selected_date, start_date, end_date):
+        triggered_id = dash.callback_context.triggered_id
+        if not isinstance(triggered_id, dict):
+            return dash.no_update, 0
+        # Only the clicked pie's clickData is in the triggered value
+        data = dash.callback_context.triggered[0]['value']
+        if not data:
+            return dash.no_update, 0
+        return {'sheet': triggered_id['sheet'], 'category': data['points'][0]['label']}, 0
+
+    # Callback to update the table based on selected days and pie chart click;
+    # only the requested page is sorted, filtered and sent by the server
+    @app.callback(
+        [Output('table', 'data'), Output('table', 'columns'), Output('table', 'page_count')],
+        [Input('table-selection', 'data')] + DATE_INPUTS +
+        [Input('table', 'page_current'),
+         Input('table', 'page_size'),
+         Input('table', 'sort_by'),
+         Input('table', 'filter_query')])
+    @metrics.instrument('update_table')
+    def update_table(selection, date_mode, selected_date, start_date, end_date,
+                     page_current, page_size, sort_by, filter_query):
+        dataset = dataset_holder.get()
+        if dataset is None:
+            raise PreventUpdate
+        if selection is None or selection['sheet'] not in dataset.sheets:
+            return [], table_columns(dataset), 1
+
+        start, end = selected_days(date_mode, selected_date, start_date, end_date)
+        # The clicked category's rows come from the row index: on a single day one
+        # slice of the sheet's frame, and only the requested page becomes dicts
+        table_data, page_count = dataset.table_page(start, end, selection['category'], page_current, page_size,
+                                                    sort_by, filter_query, selection['sheet'])
+        return table_data, table_columns(dataset), page_count
+
+    # Point the export links at the table's current selection; there is nothing
+    # to export until a pie is clicked
+    @app.callback(
+        [Output('export-csv', 'href'), Output('export-xlsx', 'href')],
+        [Input('table-selection', 'data')] + DATE_INPUTS +
+        [Input('table', 'sort_by'), Input('table', 'filter_query')])
+    def update_export_links(selection, date_mode, selected_date, start_date, end_date, sort_by, filter_query):
+        if selection is None:
+            return None, None
+        return export_hrefs(app, date_mode, selected_date, start_date, end_date, selection['category'],
+                            selection['sheet'], sort_by, filter_query)
+
+    # Callback to draw the pie charts: one request for all agents, building
+    # figures only for the pies on screen that have not been drawn for these days
+    # and dataset version
+    @metrics.instrument('update_pie_charts')
+    def update_pie_charts(date_mode, selected_date, start_date, end_date, visible_sheets, rendered, pie_ids):
+        dataset = dataset_holder.get()
+        if dataset is None:
+            raise PreventUpdate
+        start, end = selected_days(date_mode, selected_date, start_date, end_date)
+        render, rendered = sheets_to_render(days_key(start, end) + [dataset.version], visible_sheets, rendered)
+        figures = []
+        for pie_id in pie_ids:
+            sheet_name = pie_id['sheet']
+            if sheet_name not in render or sheet_name not in dataset.sheets:
+                figures.append(dash.no_update)
+                continue
+            # Each pie is the difference of two running-total rows of the count
+            # cube instead of a scan of the sheet
+            sheet_counts = dataset.range_counts(start, end, sheet_name)
+            figures.append(figure_cache.figure(
+                dataset.version, 'sheet', sheet_name, (start, end),
+                lambda: pie_figure(dataset.categories, sheet_counts, f'Category Distribution - {sheet_name}')))
+        return figures, rendered
+
+    # Register the pie chart callback: in the browser from the preloaded counts
+    # when CLIENTSIDE_PIES is set, otherwise on the server
+    pie_chart_outputs = [Output({'type': PIE_TYPE, 'sheet': ALL}, 'figure'), Output('pie-rendered', 'data')]
+    pie_chart_inputs = DATE_INPUTS + [Input('pie-visibility', 'data')]
+    pie_chart_states = [State('pie-rendered', 'data'), State({'type': PIE_TYPE, 'sheet': ALL}, 'id')]
+    if clientside_pies:
+        app.clientside_callback(
+            ClientsideFunction(namespace='pies', function_name='sheets'),
+            pie_chart_outputs,
+            pie_chart_inputs,
+            pie_chart_states + [State('pie-counts', 'data')]
+        )
+    else:
+        app.callback(pie_chart_outputs, pie_chart_inputs, pie_chart_states)(update_pie_charts)
+
+    # Read the data in the background, then keep it current
+    def warm_up():
+        dataset = source.load()
+        source.start()
+        return dataset
+
+    app.warmup = dataset_holder.load_in_background(warm_up)
+    return app
@@ -0,0 +1,135 @@
+// Pie charts drawn in the browser from the count payload built by
+// client_store.count_payload, used when CLIENTSIDE_PIES is set
+(function () {
+    // Same colours as the plotly.express template, so the pies look unchanged
+    var COLORS = ['#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A',
+                  '#19d3f3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52'];
+    var dayNumbersCache = new WeakMap();
+
+    function dayNumber(date) {
+        var parts = String(date).slice(0, 10).split('-');
+        return Date.UTC(+parts[0], +parts[1] - 1, +parts[2]) / 86400000;
+    }
+
+    // Days of the payload as day numbers, in order
+    function dayNumbers(payload) {
+        var numbers = dayNumbersCache.get(payload);
+        if (!numbers) {
+            numbers = [];
+            var day = payload.day0;
+            for (var i = 0; i < payload.day_index.length - 1; i++) {
+                if (i > 0) {
+                    day += payload.day_gaps[i - 1];
+                }
+                numbers.push(day);
+            }
+            dayNumbersCache.set(payload, numbers);
+        }
+        return numbers;
+    }
+
+    // First position in the sorted numbers holding a value >= day (> day when after)
+    function bisect(numbers, day, after) {
+        var lo = 0;
+        var hi = numbers.length;
+        while (lo < hi) {
+            var mid = (lo + hi) >> 1;
+            if (numbers[mid] < day || (after && numbers[mid] === day)) {
+                lo = mid + 1;
+            } else {
+                hi = mid;
+            }
+        }
+        return lo;
+    }
+
+    // First and last day picked in the date controls, like
+    // date_range.selected_days; null leaves that side of a range open
+    function selectedDays(mode, date, start, end) {
+        if (mode === 'range') {
+            return [start ? dayNumber(start) : null, end ? dayNumber(end) : null];
+        }
+        if (!date) {
+            throw window.dash_clientside.PreventUpdate;
+        }
+        return [dayNumber(date), dayNumber(date)];
+    }
+
+    // Category counts for one sheet (or all when sheet is null) over a range
+    // of days (or over all time when days is null)
+    function categoryCounts(payload, days, sheet) {
+        var counts = payload.categories.map(function () { return 0; });
+        var start = 0;
+        var end = payload.count.length;
+        if (days !== null) {
+            var numbers = dayNumbers(payload);
+            start = payload.day_index[days[0] === null ? 0 : bisect(numbers, days[0], false)];
+            end = payload.day_index[days[1] === null ? numbers.length : bisect(numbers, days[1], true)];
+        }
+        for (var i = start; i < end; i++) {
+            if (sheet === null || payload.sheet[i] === sheet) {
+                counts[payload.category[i]] += payload.count[i];
+            }
+        }
+        return counts;
+    }
+
+    function pieFigure(payload, counts, title) {
+        var labels = [];
+        var values = [];
+        var colors = [];
+        counts.forEach(function (count, category) {
+            if (count > 0) {
+                labels.push(payload.categories[category]);
+                values.push(count);
+                colors.push(COLORS[category % COLORS.length]);
+            }
+        });
+        return {
+            data: [{type: 'pie', labels: labels, values: values, marker: {colors: colors}}],
+            layout: {title: {text: title}, legend: {tracegroupgap: 0}, margin: {t: 60}}
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        pies: {
+            dynamic: function (mode, date, start, end, payload) {
+                if (!payload) {
+                    throw window.dash_clientside.PreventUpdate;  // Still loading
+                }
+                return pieFigure(payload, categoryCounts(payload, selectedDays(mode, date, start, end), null),
+                                 'Dynamic Category Distribution');
+            },
+            consolidated: function (mode, date, start, end, payload) {
+                if (!payload) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                return pieFigure(payload, categoryCounts(payload, null, null),
+                                 'Consolidated Category Distribution');
+            },
+            // Per-agent pies matched by id {type: 'sheet-pie', sheet: ALL}; like
+            // lazy_pies.sheets_to_render, only visible pies not yet drawn for
+            // these days get a figure
+            sheets: function (mode, date, start, end, visibleSheets, rendered, ids, payload) {
+                var days = selectedDays(mode, date, start, end);
+                var key = JSON.stringify(days);
+                var drawn = rendered && rendered.key === key ? rendered.sheets : [];
+                var render = (visibleSheets || []).filter(function (sheetName) {
+                    return drawn.indexOf(sheetName) < 0;
+                });
+                if (!render.length) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                var figures = ids.map(function (id) {
+                    var sheet = payload.sheets.indexOf(id.sheet);
+                    if (render.indexOf(id.sheet) < 0 || sheet < 0) {
+                        return window.dash_clientside.no_update;
+                    }
+                    return pieFigure(payload, categoryCounts(payload, days, sheet),
+                                     'Category Distribution - ' + id.sheet);
+                });
+                return [figures, {key: key, sheets: drawn.concat(render)}];
+            }
+        }
+    });
+})();
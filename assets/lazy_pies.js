@@ -0,0 +1,87 @@
+// Reports which per-agent pie slots (lazy_pies.pie_slots) are on screen by
+// writing their sheet names to the 'pie-visibility' store, so only those pies
+// are drawn
+(function () {
+    var visible = new Set();
+    var observer = null;
+    var published = null;
+    var pending = null;
+
+    function publish() {
+        pending = null;
+        var setProps = window.dash_clientside && window.dash_clientside.set_props;
+        if (!setProps) {
+            schedule();
+            return;
+        }
+        // Keep the page order of the slots
+        var sheets = [];
+        document.querySelectorAll('.pie-slot').forEach(function (slot) {
+            var sheet = slot.getAttribute('data-sheet');
+            if (visible.has(sheet)) {
+                sheets.push(sheet);
+            }
+        });
+        var key = JSON.stringify(sheets);
+        if (key !== published) {
+            published = key;
+            setProps('pie-visibility', {data: sheets});
+        }
+    }
+
+    function schedule() {
+        if (pending === null) {
+            pending = setTimeout(publish, 100);
+        }
+    }
+
+    function onIntersect(entries) {
+        entries.forEach(function (entry) {
+            var sheet = entry.target.getAttribute('data-sheet');
+            if (entry.isIntersecting) {
+                visible.add(sheet);
+            } else {
+                visible.delete(sheet);
+            }
+        });
+        schedule();
+    }
+
+    function watchSlots() {
+        document.querySelectorAll('.pie-slot:not([data-watched])').forEach(function (slot) {
+            slot.setAttribute('data-watched', '1');
+            if (observer) {
+                observer.observe(slot);
+            } else {
+                // Without IntersectionObserver every pie counts as visible
+                visible.add(slot.getAttribute('data-sheet'));
+                schedule();
+            }
+        });
+    }
+
+    function start() {
+        if ('IntersectionObserver' in window) {
+            // Start drawing a little before a slot scrolls in
+            observer = new IntersectionObserver(onIntersect, {rootMargin: '200px'});
+        }
+        // Dash renders the layout after the page loads, so watch for the slots
+        var queued = false;
+        new MutationObserver(function () {
+            if (!queued) {
+                queued = true;
+                requestAnimationFrame(function () {
+                    queued = false;
+                    watchSlots();
+                });
+            }
+        }).observe(document.body, {childList: true, subtree: true});
+        watchSlots();
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', start);
+    } else {
+        start();
+    }
+})();
@@ -0,0 +1,5 @@
+# Benchmarks for the call-entry dashboards.
+#
+#     python -m benchmarks.synthetic out.xlsx --sheets 8 --rows 20000
+#     python -m benchmarks.run --sheets 4 --rows 50000 --output results.json
+#     python -m benchmarks.startup 'Call Entries updated.xlsx'
@@ -0,0 +1,432 @@
+# Concurrent load test of the dashboard callbacks.
+#
+# Simulated supervisors replay what a browser sends while someone uses the
+# dashboard: the page load, date changes (day and range), pie clicks and table
+# pages, as `_dash-update-component` POSTs. Concurrency is ramped up in
+# stages, and each stage reports throughput, p50/p95/p99 latency and the error
+# rate, per callback and overall.
+#
+# By default a synthetic workbook is written to a temporary directory and
+# served by gunicorn, so the test runs fully offline:
+#
+#     python -m benchmarks.loadtest --users 1,10,25,50 --stage-seconds 30 --workers 4
+#     python -m benchmarks.loadtest --target withdate --output loadtest.json
+#
+# `--url` points it at an instance that is already running instead.
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import date as Date, timedelta
+from urllib.parse import urlsplit
+
+from benchmarks.run import (REPO_ROOT, WORKBOOK_NAME, git_commit, pie_charts_request, table_request,
+                            visuals_request, withdate_table_request)
+from benchmarks.synthetic import write_workbook
+from lazy_pies import INITIAL_VISIBLE_PIES, PIE_TYPE
+
+# Share of date changes made in range mode
+RANGE_SHARE = 0.3
+
+# Date changes per session, between two page loads
+DATES_PER_SESSION = 3
+
+# Longest a request may take before it counts as an error
+REQUEST_TIMEOUT = 30
+
+# How long to wait for a server started here to be ready
+SERVER_START_TIMEOUT = 120
+
+
+class StageOver(Exception):
+    """Raised in a simulated user once its stage has ended."""
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, reopened when the server closes it.
+
+    Requests say they accept gzip, as browsers do, so compressed responses
+    are part of what is measured.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        # (status, decoded body bytes) of one request; a connection the server
+        # dropped while idle is reopened once
+        reused = self.writer is not None
+        try:
+            return await self._request(method, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            if not reused:
+                raise
+            return await self._request(method, path, body)
+
+    async def _request(self, method, path, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = b'' if body is None else json.dumps(body).encode()
+        head = (f'{method} {path} HTTP/1.1\r\n'
+                f'Host: {self.host}:{self.port}\r\n'
+                f'Accept-Encoding: gzip\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(data)}\r\n\r\n')
+        self.writer.write(head.encode('latin-1') + data)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by the server')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            payload = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            payload = await self._read_chunked()
+        else:
+            payload = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        if headers.get('content-encoding') == 'gzip':
+            payload = gzip.decompress(payload)
+        return status, payload
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+
+class User:
+    """A simulated supervisor: one connection, requests one after another with
+    some think time in between, as a person clicking through the dashboard.
+
+    Every request is recorded in ``samples`` as (name, milliseconds, ok).
+    """
+
+    def __init__(self, host, port, samples, deadline, think, rng):
+        self.connection = Connection(host, port)
+        self.samples = samples
+        self.deadline = deadline
+        self.think = think
+        self.rng = rng
+
+    async def send(self, name, method, path, body=None):
+        if time.monotonic() >= self.deadline:
+            raise StageOver
+        start = time.perf_counter()
+        try:
+            status, payload = await asyncio.wait_for(self.connection.request(method, path, body), REQUEST_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            await self.connection.close()
+            status, payload = None, b''
+        ok = status in (200, 204)
+        self.samples.append((name, (time.perf_counter() - start) * 1000, ok))
+        if self.think:
+            await asyncio.sleep(self.think * self.rng.uniform(0.5, 1.5))
+        return json.loads(payload) if status == 200 and payload else None
+
+    async def callback(self, name, body):
+        return await self.send(name, 'POST', '/_dash-update-component', body)
+
+
+def pie_labels(payload):
+    # Category labels of every pie trace in a callback response
+    labels = []
+    if isinstance(payload, dict):
+        if payload.get('type') == 'pie':
+            labels.extend(payload.get('labels', []))
+        for value in payload.values():
+            labels.extend(pie_labels(value))
+    elif isinstance(payload, list):
+        for value in payload:
+            labels.extend(pie_labels(value))
+    return labels
+
+
+def picked_dates(rng, dates):
+    return [(rng.choice(dates), 'range' if rng.random() < RANGE_SHARE else 'day')
+            for _ in range(DATES_PER_SESSION)]
+
+
+async def consolidated_session(user, info):
+    # dashboard.create_app: both pies and the table follow each date change;
+    # a click on the dynamic pie narrows the table, which is then paged
+    await user.send('layout', 'GET', '/_dash-layout')
+    for date, mode in picked_dates(user.rng, info['dates']):
+        figure = await user.callback('update_visuals', visuals_request('dynamic-pie-chart', date, mode))
+        await user.callback('update_consolidated_pie_chart', visuals_request('consolidated-pie-chart', date, mode))
+        await user.callback('update_table', table_request(date, None, mode))
+        labels = pie_labels(figure)
+        if not labels:
+            continue
+        click = {'points': [{'label': user.rng.choice(labels)}]}
+        await user.callback('update_table', table_request(date, click, mode))
+        for page in range(1, user.rng.randint(1, 3)):
+            await user.callback('update_table', table_request(date, click, mode, page))
+
+
+async def withdate_session(user, info):
+    # withdate.py: the agent pies in view follow each date change; a click on
+    # one of them selects the agent and category the table shows
+    await user.send('layout', 'GET', '/_dash-layout')
+    sheet_names = info['sheets']
+    for date, mode in picked_dates(user.rng, info['dates']):
+        pies = await user.callback('update_pie_charts', pie_charts_request(
+            date, sheet_names, sheet_names[:INITIAL_VISIBLE_PIES], mode))
+        labels = pie_labels(pies)
+        if not labels:
+            continue
+        selection = {'sheet': user.rng.choice(sheet_names[:INITIAL_VISIBLE_PIES]),
+                     'category': user.rng.choice(labels)}
+        for page in range(user.rng.randint(1, 3)):
+            await user.callback('update_table', withdate_table_request(date, selection, mode, page))
+
+
+# What each dashboard is served by and how its users behave
+TARGETS = {
+    'consolidated': {'app': 'wsgi:application', 'ready': '/ready', 'session': consolidated_session},
+    'withdate': {'app': 'withdate:server', 'ready': '/ready', 'session': withdate_session},
+}
+
+
+def _components(node):
+    # Every component of a serialized Dash layout
+    if isinstance(node, dict):
+        if 'props' in node:
+            yield node
+            yield from _components(node['props'].get('children'))
+    elif isinstance(node, list):
+        for child in node:
+            yield from _components(child)
+
+
+def discover(url):
+    """Days and agent sheets to request, read from the served layout."""
+    with urllib.request.urlopen(url + '/_dash-layout', timeout=REQUEST_TIMEOUT) as response:
+        layout = json.loads(response.read())
+    first = last = None
+    sheets = []
+    for component in _components(layout):
+        props = component['props']
+        if props.get('id') == 'date-picker':
+            first, last = props.get('min_date_allowed'), props.get('max_date_allowed')
+        elif isinstance(props.get('id'), dict) and props['id'].get('type') == PIE_TYPE:
+            sheets.append(props['id']['sheet'])
+    if not first or not last:
+        raise RuntimeError(f'{url} served a layout without dates; is the data loaded?')
+    first, last = Date.fromisoformat(first[:10]), Date.fromisoformat(last[:10])
+    dates = [(first + timedelta(days=d)).isoformat() for d in range((last - first).days + 1)]
+    return {'dates': dates, 'sheets': sheets}
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an ascending list
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(ms for _, ms, _ in samples)
+    errors = sum(1 for _, _, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else None,
+        **{f'p{q}_ms': None if not latencies else round(percentile(latencies, q), 2) for q in (50, 95, 99)},
+        'max_ms': round(latencies[-1], 2) if latencies else None,
+    }
+
+
+async def run_stage(url, target, info, users, seconds, think, seed):
+    """``users`` simulated users replaying sessions for ``seconds``."""
+    parts = urlsplit(url)
+    session = TARGETS[target]['session']
+    samples = []
+    start = time.monotonic()
+    deadline = start + seconds
+
+    async def user_loop(i):
+        rng = random.Random(f'{seed}-{users}-{i}')
+        user = User(parts.hostname, parts.port or 80, samples, deadline, think, rng)
+        # Users arrive spread over the first think time rather than all at once
+        await asyncio.sleep(rng.uniform(0, think))
+        try:
+            while True:
+                await session(user, info)
+        except StageOver:
+            pass
+        finally:
+            await user.connection.close()
+
+    await asyncio.gather(*(user_loop(i) for i in range(users)))
+    elapsed = time.monotonic() - start
+    by_name = {}
+    for sample in samples:
+        by_name.setdefault(sample[0], []).append(sample)
+    return {
+        'users': users,
+        'seconds': round(elapsed, 2),
+        **summarize(samples, elapsed),
+        'callbacks': {name: summarize(named, elapsed) for name, named in sorted(by_name.items())},
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url, process, timeout=SERVER_START_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'the server exited with code {process.returncode}')
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'{url} was not ready after {timeout} s')
+
+
+def start_server(target, workdir, workers, sheets, rows, days, seed):
+    """Write a synthetic workbook to ``workdir`` and serve ``target`` on it
+    with gunicorn. Returns the process and its base URL.
+    """
+    write_workbook(os.path.join(workdir, WORKBOOK_NAME), sheets, rows, days, seed=seed)
+    port = _free_port()
+    url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, WORKBOOK_PATH=os.path.join(workdir, WORKBOOK_NAME),
+               BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers), WATCH_WORKBOOK='0', CLIENTSIDE_PIES='0')
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+    if target == 'consolidated':
+        command += ['-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py')]
+    command.append(TARGETS[target]['app'])
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        _wait_ready(url + TARGETS[target]['ready'], process)
+    except Exception:
+        process.terminate()
+        raise RuntimeError(process.communicate(timeout=30)[1].decode(errors='replace')[-2000:])
+    return process, url
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def print_report(results, file=sys.stderr):
+    print(f"{'users':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}", file=file)
+    for stage in results['stages']:
+        print(f"{stage['users']:>5} {stage['throughput_rps']:>8} {stage['p50_ms'] or '-':>8} "
+              f"{stage['p95_ms'] or '-':>8} {stage['p99_ms'] or '-':>8} {stage['error_rate']:>7.2%}", file=file)
+
+
+def run(target, url, users, stage_seconds, think, seed, workers, sheets, rows, days):
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': git_commit(),
+            'python': sys.version.split()[0],
+        },
+        'params': {'target': target, 'url': url, 'users': users, 'stage_seconds': stage_seconds,
+                   'think_s': think, 'seed': seed, 'workers': workers, 'sheets': sheets,
+                   'rows_per_sheet': rows, 'days': days},
+        'stages': [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        if url is None:
+            process, url = start_server(target, workdir, workers, sheets, rows, days, seed)
+        try:
+            info = discover(url)
+            for n_users in users:
+                stage = asyncio.run(run_stage(url, target, info, n_users, stage_seconds, think, seed))
+                results['stages'].append(stage)
+                print(f"{n_users} users: {stage['throughput_rps']} req/s, p95 {stage['p95_ms']} ms, "
+                      f"{stage['error_rate']:.2%} errors", file=sys.stderr)
+        finally:
+            if process is not None:
+                stop_server(process)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ramp up simulated users against the dashboard callbacks.')
+    parser.add_argument('--target', choices=TARGETS, default='consolidated', help='dashboard to load')
+    parser.add_argument('--url',
+                        help='base URL of a running instance (default: start one on a synthetic workbook)')
+    parser.add_argument('--users', default='1,5,10,25,50',
+                        help='concurrent users of each stage, comma-separated')
+    parser.add_argument('--stage-seconds', type=float, default=20)
+    parser.add_argument('--think', type=float, default=0.5, help='mean seconds a user waits between requests')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='gunicorn workers to start')
+    parser.add_argument('--sheets', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=5000, help='rows per sheet')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    users = [int(n) for n in args.users.split(',')]
+    results = run(args.target, args.url, users, args.stage_seconds, args.think, args.seed, args.workers,
+                  args.sheets, args.rows, args.days)
+    print_report(results)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
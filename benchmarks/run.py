@@ -0,0 +1,572 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# The dashboards are top-level scripts; make them importable after chdir
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic import append_calls, write_workbook  # noqa: E402
+from lazy_pies import INITIAL_VISIBLE_PIES, PIE_TYPE  # noqa: E402
+
+# Name the Excel dashboards read from the working directory
+WORKBOOK_NAME = 'Call Entries updated.xlsx'
+
+# Longest acceptable time (ms) from start-up to the first byte of the page
+TTFB_BUDGET_MS = 3000
+
+# Length of the date ranges queried in range mode, a month ending on each date
+RANGE_DAYS = 30
+
+# Simulated round trip (ms) of each Google Sheets request in bench_gsheet
+SHEETS_LATENCY_MS = 50
+
+
+def callback_request(outputs, inputs):
+    """Body of a _dash-update-component POST.
+
+    ``outputs`` is a list of (id, property); ``inputs`` a list of
+    (id, property, value). The first input is reported as the one that changed.
+    """
+    if len(outputs) == 1:
+        output = f'{outputs[0][0]}.{outputs[0][1]}'
+        outputs_spec = {'id': outputs[0][0], 'property': outputs[0][1]}
+    else:
+        output = '..' + '...'.join(f'{id_}.{prop}' for id_, prop in outputs) + '..'
+        outputs_spec = [{'id': id_, 'property': prop} for id_, prop in outputs]
+    return {
+        'output': output,
+        'outputs': outputs_spec,
+        'inputs': [{'id': id_, 'property': prop, 'value': value} for id_, prop, value in inputs],
+        'changedPropIds': [f'{inputs[0][0]}.{inputs[0][1]}'],
+    }
+
+
+def date_inputs(date, mode='day'):
+    # Inputs of the date controls: ``date`` alone, or in range mode the
+    # RANGE_DAYS ending on it
+    start = (datetime.fromisoformat(date) - timedelta(days=RANGE_DAYS - 1)).date().isoformat()
+    return [('date-mode', 'value', mode), ('date-picker', 'date', date),
+            ('date-range', 'start_date', start), ('date-range', 'end_date', date)]
+
+
+def post_callback(client, body):
+    # Wall time (ms) and response size (bytes) of one callback round trip
+    start = time.perf_counter()
+    response = client.post('/_dash-update-component', json=body)
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code not in (200, 204):
+        raise RuntimeError(f"{body['output']} returned {response.status_code}: {response.data[:200]!r}")
+    return elapsed, len(response.data)
+
+
+def measure(client, bodies, repeat):
+    """Time each request body once cold and then ``repeat`` more times.
+
+    Different bodies usually mean different dates, so the first call of each
+    shows the uncached cost and the repeats show what a revisit costs.
+    """
+    first, again, sizes = [], [], []
+    for body in bodies:
+        elapsed, size = post_callback(client, body)
+        first.append(elapsed)
+        sizes.append(size)
+        for _ in range(repeat):
+            again.append(post_callback(client, body)[0])
+    return {
+        'calls': len(first) + len(again),
+        'first_ms': round(statistics.median(first), 3),
+        'repeat_ms': round(statistics.median(again), 3) if again else None,
+        'max_ms': round(max(first + again), 3),
+        'payload_bytes': int(statistics.median(sizes)),
+        'max_payload_bytes': max(sizes),
+    }
+
+
+def pick_dates(consolidated_data, n_dates, seed):
+    days = sorted(consolidated_data['Date'].dropna().dt.strftime('%Y-%m-%d').unique())
+    return random.Random(seed).sample(days, min(n_dates, len(days)))
+
+
+def bench_startup(ttfb_budget_ms):
+    # A fresh interpreter with its own (empty) snapshot cache, so the imports
+    # and a cold workbook parse are both in play
+    env = dict(os.environ, INGEST_CACHE_DIR=os.path.abspath('startup_cache'))
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', os.path.abspath(WORKBOOK_NAME)],
+                            cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    startup = json.loads(output.strip().splitlines()[-1])
+    startup['ttfb_budget_ms'] = ttfb_budget_ms
+    startup['within_budget'] = startup['ttfb_ms'] <= ttfb_budget_ms
+    return startup
+
+
+def bench_ingest():
+    from ingest_cache import load_call_entries
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    load_call_entries(WORKBOOK_NAME)
+    cold = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    category_data, consolidated_data = load_call_entries(WORKBOOK_NAME)
+    warm = time.perf_counter() - start
+    return {
+        'cold_s': round(cold, 4),
+        'warm_s': round(warm, 4),
+        'cold_peak_alloc_mb': round(peak / 2 ** 20, 2),
+        'rows': len(consolidated_data),
+    }, category_data, consolidated_data
+
+
+def bench_multi_ingest(sheets, rows, days, n_workbooks, seed):
+    # Cold parse of a directory of ``n_workbooks`` monthly workbooks (the same
+    # rows as the single workbook, split between them) with 1, 2, 4, ... worker
+    # processes up to the number of CPUs
+    from multi_ingest import load_workbooks
+
+    os.makedirs('workbooks')
+    for i in range(n_workbooks):
+        write_workbook(os.path.join('workbooks', f'calls-{i + 1:02d}.xlsx'), sheets, max(1, rows // n_workbooks),
+                       max(1, days // n_workbooks), start=datetime(2024, 1, 1) + timedelta(days=i * 31),
+                       seed=seed + i)
+
+    cpus = os.cpu_count() or 1
+    worker_counts = sorted({min(2 ** i, cpus) for i in range(cpus.bit_length() + 1)} | {1, cpus})
+    scaling = {}
+    for workers in worker_counts:
+        start = time.perf_counter()
+        _, consolidated_data = load_workbooks('workbooks', cache_dir=f'multi_cache_{workers}', workers=workers)
+        scaling[str(workers)] = round(time.perf_counter() - start, 4)
+    return {
+        'workbooks': n_workbooks,
+        'rows': len(consolidated_data),
+        'cpus': cpus,
+        'cold_s_by_workers': scaling,
+        'speedup': round(scaling['1'] / scaling[str(cpus)], 2),
+    }
+
+
+def bench_sqlite_store(category_data, consolidated_data):
+    # Write the rows to a SQLite store, as DATASET_STORE does, and compare its
+    # size with the memory the in-memory frames hold
+    from dataset import Dataset
+    from sqlite_store import SqliteStore
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    dataset = SqliteStore(os.path.abspath('store.sqlite3')).dataset(category_data, consolidated_data)
+    write = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'write_s': round(write, 4),
+        'write_peak_alloc_mb': round(peak / 2 ** 20, 2),
+        'store_bytes': dataset.describe()['bytes'],
+        'frame_bytes': Dataset(category_data, consolidated_data=consolidated_data).describe()['bytes'],
+    }, dataset
+
+
+def table_request(date, clickData, mode='day', page_current=0):
+    # The consolidated dashboard's table, narrowed to the pie slice clicked
+    return callback_request(
+        [('table', 'data'), ('table', 'page_count')],
+        date_inputs(date, mode) +
+        [('dynamic-pie-chart', 'clickData', clickData),
+         ('table', 'page_current', page_current), ('table', 'page_size', 10),
+         ('table', 'sort_by', []), ('table', 'filter_query', '')])
+
+
+def visuals_request(output, date, mode='day'):
+    return callback_request([(output, 'figure')], date_inputs(date, mode))
+
+
+def trend_request(date, bucket='week', kind='heatmap', mode='range'):
+    return callback_request([('trend-chart', 'figure')], date_inputs(date, mode) + [
+        ('trend-bucket', 'value', bucket), ('trend-kind', 'value', kind), ('trend-sheet', 'value', None)])
+
+
+# Filters the SQLite store must answer exactly as the in-memory frames do
+CHECK_FILTERS = ['', '{Category} > A', '{Category} < Enquiry', '{Category} = Billing', '{Category} != Billing',
+                 '{Category} >= 1', '{Category} contains o', '{Date} datestartswith 2024-0',
+                 '{Remarks} contains call && {Category} <= F']
+
+
+def check_backends_agree(memory, sqlite, dates):
+    # Raise unless both datasets serve the same table pages for CHECK_FILTERS
+    sort_by = [{'column_id': 'Category', 'direction': 'desc'}]
+    for filter_query in CHECK_FILTERS:
+        for start, end in [(None, None)] + [(date, date) for date in dates]:
+            pages = [dataset.table_page(start, end, None, 0, 25, sort_by, filter_query)
+                     for dataset in (memory, sqlite)]
+            if pages[0] != pages[1]:
+                raise RuntimeError(f"in-memory and SQLite pages differ for '{filter_query}' from {start} to {end}")
+    return {'filters': len(CHECK_FILTERS), 'agree': True}
+
+
+def bench_sqlite_reload(sheets, rows, days, seed):
+    # Edit one agent's sheet of a workbook served from a SQLite store and check
+    # that the watcher re-reads just that sheet and the new rows are served
+    from dataset import DatasetHolder
+    from sqlite_store import SqliteStore
+    from workbook_watcher import WorkbookWatcher
+
+    path = os.path.abspath('reload.xlsx')
+    sheet_names = write_workbook(path, sheets, rows, days, seed=seed)
+    holder = DatasetHolder()
+    watcher = WorkbookWatcher(path, holder, settle=0, cache_dir=os.path.abspath('reload_cache'),
+                              store=SqliteStore(os.path.abspath('reload.sqlite3')))
+    watcher.load()
+    before = holder.get()
+    edited = sheet_names[-1]
+    day = datetime(2030, 1, 1)
+    append_calls(path, edited, [(day, f'Reload check {i}', '9000000000', 'Billing', '') for i in range(3)])
+
+    start = time.perf_counter()
+    if not watcher.check():
+        raise RuntimeError(f"editing '{edited}' did not publish a new version")
+    reload_s = time.perf_counter() - start
+    dataset = holder.get()
+    records, _ = dataset.table_page(day, day, None, 0, 10, sheet_name=edited)
+    if ([record['Customer Name'] for record in records] != [f'Reload check {i}' for i in range(3)]
+            or dataset.describe()['rows'] != before.describe()['rows'] + 3):
+        raise RuntimeError(f"the rows added to '{edited}' are not served after the reload: {records}")
+    return {'reload_s': round(reload_s, 4), 'rows': dataset.describe()['rows']}
+
+
+def _sheet_values(df):
+    # A frame as the Sheets API returns it: a header row, then rows of text
+    # with dates written day first
+    columns = [df[name].dt.strftime('%d/%m/%Y') if name == 'Date' else df[name].astype(object)
+               for name in df.columns]
+    rows = [['' if value is None or value != value else str(value) for value in row] for row in zip(*columns)]
+    return [list(df.columns)] + rows
+
+
+def bench_gsheet(category_data, latency_ms=SHEETS_LATENCY_MS):
+    # The Google Sheets loader and refresher against fake_gspread's in-memory
+    # spreadsheet, each request costing ``latency_ms``: requests and time of
+    # reading the worksheets one by one versus SheetRefresher's batched load,
+    # of an incremental refresh, and of a refresh that hits rate limiting (429)
+    from dataset import Dataset, DatasetHolder
+    from fake_gspread import FakeSpreadsheet
+    from gsheet_source import SheetRefresher, frame_from_values
+
+    spreadsheet = FakeSpreadsheet({name: _sheet_values(df) for name, df in category_data.items()},
+                                  latency=latency_ms / 1000)
+
+    def timed(load, repeat=3):
+        # Requests of one load and its best time over ``repeat`` runs
+        times = []
+        for _ in range(repeat):
+            spreadsheet.requests = 0
+            start = time.perf_counter()
+            load()
+            times.append(time.perf_counter() - start)
+        return {'requests': spreadsheet.requests, 's': round(min(times), 4)}
+
+    def per_sheet_load():
+        # One request per worksheet, as the dashboards made before batching, then
+        # the same frames and Dataset as SheetRefresher.load builds
+        frames = {}
+        for name in category_data:
+            values = spreadsheet.worksheet(name).get_all_values()
+            frames[name] = frame_from_values(values[0], values[1:], name)
+        return Dataset(frames)
+
+    delays = []
+    holder = DatasetHolder()
+    refresher = SheetRefresher(spreadsheet, list(category_data), holder, sleep=delays.append)
+    per_sheet = timed(per_sheet_load)
+    batched = timed(refresher.load)
+
+    def append_rows(count):
+        day = datetime(2030, 1, 1).strftime('%d/%m/%Y')
+        for name in list(category_data)[:2]:
+            worksheet = spreadsheet.worksheet(name)
+            for i in range(count):
+                worksheet.append_row([day if column == 'Date' else 'Billing' if column == 'Category'
+                                      else f'Refresh check {i}' for column in worksheet.values[0]])
+        return 2 * count
+
+    rows = holder.get().describe()['rows']
+    added = append_rows(5)
+    spreadsheet.requests = 0
+    start = time.perf_counter()
+    refresher.refresh()
+    refresh = {'requests': spreadsheet.requests, 's': round(time.perf_counter() - start, 4)}
+
+    # Two 429s in a row; the refresh backs off (without actually sleeping) and then succeeds
+    added += append_rows(5)
+    spreadsheet.fail_next(2, status=429)
+    spreadsheet.requests = 0
+    start = time.perf_counter()
+    refresher.refresh()
+    throttled = {'requests': spreadsheet.requests, 's': round(time.perf_counter() - start, 4),
+                 'retries': len(delays), 'backoff_s': round(sum(delays), 3)}
+    if holder.get().describe()['rows'] != rows + added:
+        raise RuntimeError('the rows appended to the fake spreadsheet are not served after the refreshes')
+
+    return {
+        'latency_ms': latency_ms,
+        'worksheets': len(category_data),
+        'per_sheet_load': per_sheet,
+        'batched_load': batched,
+        'refresh': refresh,
+        'refresh_after_429': throttled,
+    }
+
+
+def bench_consolidated(dataset, dates, repeat, prefix='consolidated'):
+    # The consolidated dashboard's callbacks over ``dataset``, in memory or in SQLite
+    from dashboard import create_app
+    from dataset import DatasetHolder
+
+    app = create_app(DatasetHolder(dataset), clientside_pies=False)
+    client = app.server.test_client()
+
+    # Click the most common category so the narrowed table is not empty
+    counts = dataset.category_counts()
+    category = counts['Category'][counts['Count'].idxmax()]
+    click = {'points': [{'label': category}]}
+
+    return {
+        f'{prefix}.update_visuals': measure(client, [
+            visuals_request('dynamic-pie-chart', date) for date in dates], repeat),
+        f'{prefix}.update_visuals_range': measure(client, [
+            visuals_request('dynamic-pie-chart', date, 'range') for date in dates], repeat),
+        f'{prefix}.update_consolidated_pie_chart': measure(client, [
+            visuals_request('consolidated-pie-chart', date) for date in dates], repeat),
+        f'{prefix}.update_table': measure(client, [table_request(date, None) for date in dates], repeat),
+        f'{prefix}.update_table_click': measure(client, [table_request(date, click) for date in dates], repeat),
+        f'{prefix}.update_table_range': measure(client, [
+            table_request(date, None, 'range') for date in dates], repeat),
+    }
+
+
+def bench_payload_bytes(dataset, date):
+    # Bytes each consolidated-dashboard response takes on the wire, as encoded
+    # and compressed with each encoding the server offers
+    from compression import brotli
+    from dashboard import create_app
+    from dataset import DatasetHolder
+
+    app = create_app(DatasetHolder(dataset), clientside_pies=False)
+    client = app.server.test_client()
+    counts = dataset.category_counts()
+    click = {'points': [{'label': counts['Category'][counts['Count'].idxmax()]}]}
+    bodies = {
+        'update_visuals': visuals_request('dynamic-pie-chart', date),
+        'update_visuals_range': visuals_request('dynamic-pie-chart', date, 'range'),
+        'update_consolidated_pie_chart': visuals_request('consolidated-pie-chart', date),
+        'update_table': table_request(date, None),
+        'update_table_click': table_request(date, click),
+        'update_trend': trend_request(date, 'day', 'heatmap', 'day'),
+        'update_trend_lines': trend_request(date, 'day', 'lines', 'day'),
+    }
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    results = {}
+    for name, body in bodies.items():
+        results[name] = {encoding: len(client.post('/_dash-update-component', json=body,
+                                                   headers={'Accept-Encoding': encoding}).data)
+                         for encoding in encodings}
+    for path in ('/_dash-layout', '/_dash-dependencies'):
+        results[path] = {encoding: len(client.get(path, headers={'Accept-Encoding': encoding}).data)
+                         for encoding in encodings}
+    return results
+
+
+def bench_pie_figures(category_data, consolidated_data, repeat):
+    # Cost of one pie figure, ready to send, from a day's counts: px.pie over a
+    # Category/Count frame (as the callbacks used to build them) against
+    # pie_figures.pie_figure over the count array
+    import plotly.express as px
+    import plotly.io as pio
+
+    from dataset import Dataset
+    from pie_figures import base_layout, pie_figure
+
+    count_cube = Dataset(category_data, consolidated_data=consolidated_data).count_cube
+    slices = [count_cube.counts[sheet, day] for sheet in range(len(count_cube.sheets))
+              for day in range(len(count_cube.days))][:200]
+    base_layout()  # Built once per process, on the first pie
+
+    def px_pie(counts):
+        figure = px.pie(count_cube.counts_frame(counts), values='Count', names='Category', title='Pie')
+        return json.loads(pio.to_json(figure, validate=False))
+
+    def lightweight(counts):
+        return pie_figure(count_cube.categories, counts, 'Pie')
+
+    results = {}
+    for name, build in (('px_pie', px_pie), ('pie_figure', lightweight)):
+        times = []
+        for _ in range(repeat):
+            for counts in slices:
+                start = time.perf_counter()
+                build(counts)
+                times.append(time.perf_counter() - start)
+        results[name] = {
+            'figures': len(times),
+            'mean_us': round(statistics.mean(times) * 1e6, 1),
+            'median_us': round(statistics.median(times) * 1e6, 1),
+            'json_bytes': len(json.dumps(build(slices[0]), separators=(',', ':'))),
+        }
+    results['speedup'] = round(results['px_pie']['mean_us'] / results['pie_figure']['mean_us'], 1)
+    return results
+
+
+def pie_charts_request(date, sheet_names, visible_sheets, mode='day'):
+    # The per-agent pies are one callback with pattern-matching (ALL) ids
+    pie_ids = [{'type': PIE_TYPE, 'sheet': sheet_name} for sheet_name in sheet_names]
+    pattern = json.dumps({'sheet': ['ALL'], 'type': PIE_TYPE}, separators=(',', ':'))
+    return {
+        'output': f'..{pattern}.figure...pie-rendered.data..',
+        'outputs': [[{'id': pie_id, 'property': 'figure'} for pie_id in pie_ids],
+                    {'id': 'pie-rendered', 'property': 'data'}],
+        'inputs': [{'id': id_, 'property': prop, 'value': value} for id_, prop, value in date_inputs(date, mode)] +
+                  [{'id': 'pie-visibility', 'property': 'data', 'value': visible_sheets}],
+        'state': [{'id': 'pie-rendered', 'property': 'data', 'value': None},
+                  [{'id': pie_id, 'property': 'id', 'value': pie_id} for pie_id in pie_ids]],
+        'changedPropIds': ['date-mode.value'],
+    }
+
+
+def withdate_table_request(date, selection, mode='day', page_current=0):
+    # withdate.py's table, for the agent and category of the pie slice clicked
+    return callback_request(
+        [('table', 'data'), ('table', 'columns'), ('table', 'page_count')],
+        [('table-selection', 'data', selection)] + date_inputs(date, mode) +
+        [('table', 'page_current', page_current), ('table', 'page_size', 10),
+         ('table', 'sort_by', []), ('table', 'filter_query', '')])
+
+
+def bench_withdate(dates, repeat):
+    # withdate.py starts loading the workbook from the working directory at import
+    withdate = importlib.import_module('withdate')
+    client = withdate.app.server.test_client()
+    withdate.app.warmup.join()
+    withdate.workbook_watcher.stop()
+    count_cube = withdate.dataset_holder.get().count_cube
+    sheet_names = list(count_cube.sheets)
+    # A screenful of pies, as drawn before the browser reports what is visible
+    visible_sheets = sheet_names[:INITIAL_VISIBLE_PIES]
+
+    category = count_cube.categories[count_cube.totals.argmax()]
+    selection = {'sheet': sheet_names[0], 'category': category}
+
+    return {
+        'withdate.update_pie_charts': measure(client, [
+            pie_charts_request(date, sheet_names, visible_sheets) for date in dates], repeat),
+        'withdate.update_pie_charts_range': measure(client, [
+            pie_charts_request(date, sheet_names, visible_sheets, 'range') for date in dates], repeat),
+        'withdate.update_table': measure(client, [
+            withdate_table_request(date, selection) for date in dates], repeat),
+        'withdate.update_table_range': measure(client, [
+            withdate_table_request(date, selection, 'range') for date in dates], repeat),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sheets, rows, days, dates, repeat, seed, ttfb_budget_ms=TTFB_BUDGET_MS, workbooks=4):
+    import dash
+    import pandas as pd
+    import plotly
+
+    from dataset import Dataset
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'dash': dash.__version__,
+            'plotly': plotly.__version__,
+        },
+        'params': {'sheets': sheets, 'rows_per_sheet': rows, 'days': days, 'dates': dates,
+                   'repeat': repeat, 'seed': seed, 'ttfb_budget_ms': ttfb_budget_ms, 'workbooks': workbooks},
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.environ['CLIENTSIDE_PIES'] = '0'
+        try:
+            start = time.perf_counter()
+            write_workbook(WORKBOOK_NAME, sheets, rows, days, seed=seed)
+            results['generate_s'] = round(time.perf_counter() - start, 3)
+            results['workbook_bytes'] = os.path.getsize(WORKBOOK_NAME)
+
+            results['startup'] = bench_startup(ttfb_budget_ms)
+            results['ingest'], category_data, consolidated_data = bench_ingest()
+            results['multi_ingest'] = bench_multi_ingest(sheets, rows, days, workbooks, seed)
+            selected_dates = pick_dates(consolidated_data, dates, seed)
+            results['pie_figures'] = bench_pie_figures(category_data, consolidated_data, repeat)
+            dataset = Dataset(category_data, consolidated_data=consolidated_data)
+            results['callbacks'] = bench_consolidated(dataset, selected_dates, repeat)
+            results['payload_bytes'] = bench_payload_bytes(dataset, selected_dates[0])
+            results['sqlite_store'], sqlite_dataset = bench_sqlite_store(category_data, consolidated_data)
+            results['callbacks'].update(bench_consolidated(sqlite_dataset, selected_dates, repeat, prefix='sqlite'))
+            results['sqlite_store']['check'] = check_backends_agree(dataset, sqlite_dataset, selected_dates)
+            results['sqlite_reload'] = bench_sqlite_reload(sheets, rows, days, seed)
+            results['gsheet'] = bench_gsheet(category_data)
+            results['callbacks'].update(bench_withdate(selected_dates, repeat))
+        finally:
+            os.chdir(cwd)
+
+    results['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ingest and callbacks on a synthetic workbook.')
+    parser.add_argument('--sheets', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=5000, help='rows per sheet')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--dates', type=int, default=5, help='distinct dates to query')
+    parser.add_argument('--repeat', type=int, default=5, help='repeat calls per date')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ttfb-budget-ms', type=float, default=TTFB_BUDGET_MS,
+                        help='fail when the first byte of the page takes longer')
+    parser.add_argument('--workbooks', type=int, default=4, help='workbooks for the multi-workbook ingest')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    results = run(args.sheets, args.rows, args.days, args.dates, args.repeat, args.seed, args.ttfb_budget_ms,
+                  args.workbooks)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    startup = results['startup']
+    if not startup['within_budget']:
+        sys.exit(f"Time to first byte {startup['ttfb_ms']} ms is over the {startup['ttfb_budget_ms']} ms budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Time to first byte of a freshly started consolidated dashboard. Run in a new
+# interpreter so the imports are part of the measurement:
+#
+#     python -m benchmarks.startup 'Call Entries updated.xlsx'
+#
+# Prints one JSON object with the times (ms) since this module started.
+import time
+
+STARTED = time.perf_counter()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import urllib.request  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def elapsed_ms():
+    return round((time.perf_counter() - STARTED) * 1000, 1)
+
+
+def get(url):
+    # Time until the first byte of the response body arrives
+    with urllib.request.urlopen(url) as response:
+        response.read(1)
+        first_byte = elapsed_ms()
+        size = 1 + len(response.read())
+    return first_byte, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the start-up time of the consolidated dashboard.')
+    parser.add_argument('workbook')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for the dataset')
+    args = parser.parse_args(argv)
+
+    from werkzeug.serving import make_server
+
+    from dashboard import create_app
+    from dataset import Dataset, DatasetHolder
+    imported = elapsed_ms()
+
+    def load_dataset():
+        from ingest_cache import load_call_entries
+        category_data, consolidated_data = load_call_entries(args.workbook)
+        return Dataset(category_data, consolidated_data=consolidated_data)
+
+    dataset_holder = DatasetHolder()
+    dataset_holder.load_in_background(load_dataset)
+    app = create_app(dataset_holder, clientside_pies=False)
+
+    server = make_server('127.0.0.1', 0, app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    listening = elapsed_ms()
+
+    index_ms, index_bytes = get(base + '/')
+    layout_ms, layout_bytes = get(base + '/_dash-layout')
+    loading = dataset_holder.get() is None
+
+    deadline = time.perf_counter() + args.timeout
+    while dataset_holder.get() is None and dataset_holder.error is None and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    ready = elapsed_ms() if dataset_holder.get() is not None else None
+    server.shutdown()
+
+    print(json.dumps({
+        'imported_ms': imported,
+        'listening_ms': listening,
+        'ttfb_ms': index_ms,
+        'layout_ms': layout_ms,
+        'index_bytes': index_bytes,
+        'loading_layout_bytes': layout_bytes,
+        'served_while_loading': loading,
+        'ready_ms': ready,
+    }))
+
+
+if __name__ == '__main__':
+    main()
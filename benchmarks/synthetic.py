@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import re
+import zipfile
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape, unescape
+
+import openpyxl
+
+# Agent sheets the dashboards expect, followed by generated names
+DEFAULT_SHEETS = ["Kavitha", "Meenu", "Ajanya", "AJITH"]
+
+# The category header is spelled differently across the real sheets
+HEADER_VARIANTS = ['Category', 'Category ', 'Category:']
+
+# Call categories with their relative frequency
+CATEGORIES = [
+    ('Enquiry', 30),
+    ('Follow up', 22),
+    ('Complaint', 12),
+    ('Service request', 10),
+    ('Billing', 8),
+    ('Demo booked', 6),
+    ('Not reachable', 6),
+    ('Wrong number', 3),
+    ('Other', 3),
+]
+
+REMARKS = ['', '', '', 'Call back later', 'Shared brochure', 'Escalated', 'Busy', 'Resolved on call']
+
+
+def sheet_names_for(n_sheets):
+    return DEFAULT_SHEETS[:n_sheets] + [f'Agent {i}' for i in range(len(DEFAULT_SHEETS) + 1, n_sheets + 1)]
+
+
+def _call_dates(rng, n_rows, start, days):
+    # Weekdays are busier than weekends; calls are logged in date order
+    weights = [1.0 if (start + timedelta(days=d)).weekday() < 5 else 0.3 for d in range(days)]
+    offsets = sorted(rng.choices(range(days), weights=weights, k=n_rows))
+    return [start + timedelta(days=offset) for offset in offsets]
+
+
+def write_workbook(path, n_sheets=4, n_rows=1000, days=365, start=datetime(2024, 1, 1), seed=0):
+    """Write a synthetic "Call Entries" workbook with ``n_sheets`` x ``n_rows`` calls.
+
+    Returns the sheet names, in workbook order.
+    """
+    rng = random.Random(seed)
+    names, weights = zip(*CATEGORIES)
+    sheet_names = sheet_names_for(n_sheets)
+
+    workbook = openpyxl.Workbook(write_only=True)
+    for i, sheet_name in enumerate(sheet_names):
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(['Date', 'Customer Name', 'Phone', HEADER_VARIANTS[i % len(HEADER_VARIANTS)], 'Remarks'])
+        categories = rng.choices(names, weights=weights, k=n_rows)
+        for n, (call_date, category) in enumerate(zip(_call_dates(rng, n_rows, start, days), categories)):
+            worksheet.append([
+                call_date,
+                f'Customer {rng.randrange(n_rows * 2)}',
+                f'9{rng.randrange(10 ** 9):09d}',
+                category,
+                rng.choice(REMARKS),
+            ])
+    workbook.save(path)
+    return sheet_names
+
+
+def _cell(ref, value):
+    # Cell of a call row: a date with the date style write_workbook used, or inline text
+    if isinstance(value, datetime):
+        return f'<c r="{ref}" s="1" t="n"><v>{(value - datetime(1899, 12, 30)).days}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def append_calls(path, sheet_name, calls):
+    """Append ``calls`` (date, customer, phone, category, remarks) to one sheet
+    of a workbook written by write_workbook.
+
+    Only that sheet's part of the file changes, as when one agent's sheet is
+    edited and saved, so a watcher re-reads just that sheet.
+    """
+    with zipfile.ZipFile(path) as archive:
+        names = [unescape(name, {'&quot;': '"'})
+                 for name in re.findall(r'<sheet [^>]*name="([^"]*)"', archive.read('xl/workbook.xml').decode())]
+        parts = [(info, archive.read(info)) for info in archive.infolist()]
+    part = f'xl/worksheets/sheet{names.index(sheet_name) + 1}.xml'
+    tmp_path = path + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for info, data in parts:
+            if info.filename == part:
+                xml = data.decode('utf-8')
+                last = int(re.findall(r'<row r="(\d+)"', xml)[-1])
+                rows = ''.join(
+                    f'<row r="{last + n}">' +
+                    ''.join(_cell(f'{column}{last + n}', value) for column, value in zip('ABCDE', call)) +
+                    '</row>'
+                    for n, call in enumerate(calls, start=1))
+                data = xml.replace('</sheetData>', rows + '</sheetData>').encode('utf-8')
+            archive.writestr(info, data)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic call-entry workbook.')
+    parser.add_argument('path')
+    parser.add_argument('--sheets', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=1000, help='rows per sheet')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    write_workbook(args.path, args.sheets, args.rows, args.days, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+import numpy as np
+
+
+def count_payload(count_cube):
+    """Per-date category counts for the browser, in a compact columnar form.
+
+    Only non-zero (day, sheet, category) cells are sent, ordered by day. Days
+    are delta-encoded from ``day0`` (days since 1970-01-01) and ``day_index``
+    points at the first cell of each day, so the browser can slice one day's
+    cells without scanning the history. Sheet and category are sent as codes
+    into the ``sheets`` and ``categories`` lists.
+    """
+    counts = count_cube.counts.transpose(1, 0, 2)
+    day, sheet, category = np.nonzero(counts)
+    day_numbers = count_cube.days.values.astype('datetime64[D]').astype(np.int64)
+    day_index = np.searchsorted(day, np.arange(len(day_numbers) + 1))
+    return {
+        'sheets': [str(sheet_name) for sheet_name in count_cube.sheets],
+        'categories': [str(name) for name in count_cube.categories],
+        'day0': int(day_numbers[0]) if len(day_numbers) else 0,
+        'day_gaps': np.diff(day_numbers).tolist(),
+        'day_index': day_index.tolist(),
+        'sheet': sheet.tolist(),
+        'category': category.tolist(),
+        'count': counts[day, sheet, category].tolist(),
+    }
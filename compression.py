@@ -0,0 +1,79 @@
+import gzip
+import os
+
+from flask import g, request
+
+try:
+    import brotli
+except ImportError:  # Without the brotli package responses are gzipped only
+    brotli = None
+
+# Responses smaller than this go out as they are; compressing them saves less
+# than the headers cost
+COMPRESS_MIN_BYTES = 500
+
+# Set COMPRESS_RESPONSES=0 to leave compression to a proxy in front of the app
+COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') != '0'
+
+# Fast settings: callback responses are compressed on every request
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/')
+
+
+def _encoding(accept_encodings):
+    # The best encoding the client accepts: brotli where available, then gzip
+    offered = (['br'] if brotli is not None else []) + ['gzip']
+    return accept_encodings.best_match(offered) if accept_encodings else None
+
+
+def _compressible(response):
+    # Generated bodies of unknown length (the exports) are streamed; files from
+    # disk are iterated too, but know their length
+    mimetype = response.mimetype or ''
+    return (response.status_code == 200
+            and (response.content_length is not None or not response.is_streamed)
+            and 'Content-Encoding' not in response.headers
+            and any(mimetype.startswith(kind) for kind in COMPRESSIBLE_TYPES))
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def install_compression(server, min_bytes=COMPRESS_MIN_BYTES):
+    """Compress the responses of ``server`` for clients that accept it.
+
+    Callback responses (``/_dash-update-component``), the layout, the Dash
+    scripts and the assets are sent with brotli when the brotli package is
+    installed and the browser accepts it, and gzipped otherwise. Responses
+    streamed as they are generated, such as the table exports, are left alone.
+
+    The size before compression is kept in ``flask.g.uncompressed_bytes`` for
+    Metrics, which therefore has to be installed first: Flask runs the
+    after-request hooks last-registered first.
+    """
+    @server.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if not COMPRESS_RESPONSES or not _compressible(response):
+            return response
+        encoding = _encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        # Static files are served straight from disk; read them in to compress them
+        response.direct_passthrough = False
+        body = response.get_data()
+        if len(body) < min_bytes:
+            return response
+        g.uncompressed_bytes = len(body)
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ from what the ETag names
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+# Calendar buckets the trend view rolls the days up into, as pandas period frequencies
+ROLLUPS = {'week': 'W', 'month': 'M'}
+
+
+# Text dates as the sheets write them; snapshots store text dates as ISO 8601
+DAY_FIRST_FORMAT = '%d/%m/%Y'
+
+
+def to_days(dates):
+    # Day-resolution timestamps; anything unparsable becomes NaT. Real dates are
+    # kept as they are. Text is read as DD/MM/YYYY or as ISO 8601, each with its
+    # own format, so an ISO date is never taken day-first
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        is_text = dates.map(lambda value: isinstance(value, str)).astype(bool)
+        text = dates[is_text].str.strip()
+        parsed = pd.to_datetime(dates.where(~is_text), errors='coerce')
+        if len(text):
+            day_first = pd.to_datetime(text, format=DAY_FIRST_FORMAT, errors='coerce')
+            iso = pd.to_datetime(text, format='ISO8601', errors='coerce')
+            parsed = parsed.astype(day_first.dtype)
+            parsed[is_text] = day_first.fillna(iso)
+        dates = parsed
+    return dates.dt.normalize()
+
+
+def to_day(date):
+    # Normalize a DatePicker value ('YYYY-MM-DD', date or datetime) to a day
+    if date is None:
+        return None
+    try:
+        day = pd.Timestamp(date)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(day) else day.normalize()
+
+
+class CountCube:
+    """Category counts per (sheet, day, category), built once at ingest.
+
+    ``counts[s, d, c]`` is the number of rows of sheet ``sheets[s]`` dated
+    ``days[d]`` with category ``categories[c]``. A pie for one sheet or for all
+    sheets on one day is a slice of that array, so its cost does not depend on
+    how much history is loaded. Running totals over the days make any day
+    range a difference of two slices as well. Rows without a date or category
+    are left out, as ``groupby('Category')`` and the date filter did.
+    """
+
+    def __init__(self, sheets, days, categories, counts):
+        self.sheets = list(sheets)
+        self.days = pd.DatetimeIndex(days)
+        self.categories = np.asarray(categories, dtype=object)
+        self.counts = counts
+        self._sheet_pos = {sheet: i for i, sheet in enumerate(self.sheets)}
+        self._day_pos = {day: i for i, day in enumerate(self.days)}
+        # All-time totals are precomputed so the consolidated chart is a lookup too
+        self.sheet_totals = counts.sum(axis=1)
+        self.totals = self.sheet_totals.sum(axis=0)
+        # cumulative[s, d] counts the days before days[d]; the leading zero row
+        # makes the counts of days[lo:hi] cumulative[s, hi] - cumulative[s, lo]
+        self.cumulative = np.concatenate(
+            [np.zeros((counts.shape[0], 1, counts.shape[2]), dtype=counts.dtype), counts.cumsum(axis=1)], axis=1)
+        self.total_cumulative = self.cumulative.sum(axis=0)
+
+    @classmethod
+    def from_frames(cls, category_data):
+        sheets = list(category_data)
+        frames = list(category_data.values())
+        sheet_codes = np.repeat(np.arange(len(frames)), [len(df) for df in frames])
+        days = to_days(pd.concat([df['Date'] for df in frames], ignore_index=True))
+        category = pd.concat([df['Category'] for df in frames], ignore_index=True)
+
+        day_codes, day_values = pd.factorize(days, sort=True)
+        category_codes, categories = pd.factorize(category)
+
+        valid = (day_codes >= 0) & (category_codes >= 0)
+        shape = (len(sheets), len(day_values), len(categories))
+        flat = np.ravel_multi_index(
+            (sheet_codes[valid], day_codes[valid], category_codes[valid]), shape)
+        counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+        return cls(sheets, day_values, categories, counts)
+
+    def merged(self, other):
+        """Cube holding the counts of both cubes, e.g. existing rows plus newly appended ones.
+
+        Only the count arrays are combined, so the cost depends on the number of
+        sheets, days and categories, not on how many rows were ever loaded.
+        """
+        sheets = self.sheets + [sheet for sheet in other.sheets if sheet not in self._sheet_pos]
+        days = self.days.union(other.days)
+        known = set(self.categories)
+        categories = list(self.categories) + [c for c in other.categories if c not in known]
+
+        sheet_pos = {sheet: i for i, sheet in enumerate(sheets)}
+        category_pos = {category: i for i, category in enumerate(categories)}
+        counts = np.zeros((len(sheets), len(days), len(categories)), dtype=self.counts.dtype)
+        for cube in (self, other):
+            index = np.ix_(np.array([sheet_pos[sheet] for sheet in cube.sheets], dtype=np.intp),
+                           days.get_indexer(cube.days),
+                           np.array([category_pos[category] for category in cube.categories], dtype=np.intp))
+            counts[index] += cube.counts
+        return CountCube(sheets, days, categories, counts)
+
+    def rolled(self, freq):
+        """Cube of the counts per calendar ``freq`` ('W' or 'M') bucket instead of
+        per day; its ``days`` are the first days of the buckets with calls.
+
+        Like ``merged``, the cost depends on the days and categories only, so
+        rollups are cheap to rebuild or merge on every refresh.
+        """
+        if not len(self.days):
+            return CountCube(self.sheets, self.days, self.categories, self.counts)
+        buckets = self.days.to_period(freq).start_time
+        # The days are sorted, so each bucket's days are a contiguous run
+        firsts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        counts = np.add.reduceat(self.counts, firsts, axis=1)
+        return CountCube(self.sheets, buckets[firsts], self.categories, counts)
+
+    def day_position(self, date):
+        day = to_day(date)
+        return None if day is None else self._day_pos.get(day)
+
+    def sheet_counts(self, sheet_name, date=None):
+        # Category counts of one sheet on ``date``, or over all time when None
+        sheet = self._sheet_pos[sheet_name]
+        if date is None:
+            return self.sheet_totals[sheet]
+        day = self.day_position(date)
+        if day is None:
+            return np.zeros(len(self.categories), dtype=self.counts.dtype)
+        return self.counts[sheet, day]
+
+    def consolidated_counts(self, date=None):
+        # Category counts of all sheets on ``date``, or over all time when None
+        if date is None:
+            return self.totals
+        day = self.day_position(date)
+        if day is None:
+            return np.zeros(len(self.categories), dtype=self.counts.dtype)
+        return self.counts[:, day].sum(axis=0)
+
+    def day_span(self, start=None, end=None):
+        # Positions [lo, hi) of the days from ``start`` to ``end``, both included;
+        # None leaves that end of the range open
+        lo = 0 if start is None else int(self.days.searchsorted(to_day(start), side='left'))
+        hi = len(self.days) if end is None else int(self.days.searchsorted(to_day(end), side='right'))
+        return lo, max(lo, hi)
+
+    def sheet_range_counts(self, sheet_name, start=None, end=None):
+        # Category counts of one sheet from ``start`` to ``end``
+        sheet = self._sheet_pos[sheet_name]
+        lo, hi = self.day_span(start, end)
+        return self.cumulative[sheet, hi] - self.cumulative[sheet, lo]
+
+    def consolidated_range_counts(self, start=None, end=None):
+        # Category counts of all sheets from ``start`` to ``end``
+        lo, hi = self.day_span(start, end)
+        return self.total_cumulative[hi] - self.total_cumulative[lo]
+
+    def counts_frame(self, counts):
+        # Category/Count frame in the shape px.pie was fed before
+        present = counts > 0
+        return pd.DataFrame({'Category': self.categories[present], 'Count': counts[present]})
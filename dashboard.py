@@ -0,0 +1,294 @@
+import os
+from datetime import datetime
+
+import dash
+from dash import dcc, html, Input, Output, State, ClientsideFunction
+from dash.dash_table import DataTable
+from dash.exceptions import PreventUpdate
+
+from client_store import count_payload
+from compression import install_compression
+from date_range import DATE_INPUTS, date_controls, range_picker_props, register_date_mode, selected_days
+from figure_cache import FigureCache
+from metrics import Metrics
+from pie_figures import pie_figure
+from table_export import export_hrefs, export_links, install_export
+from trends import register_trends, sheet_options, trend_controls
+
+# How often (ms) a page served before the dataset was loaded checks for it
+WARMUP_POLL_INTERVAL = 1000
+
+
+def install_probes(server, dataset_holder):
+    # Liveness and readiness probes, so load balancers only route to workers
+    # that have a dataset to serve
+    @server.route('/healthz')
+    def healthz():
+        return 'ok'
+
+    @server.route('/ready')
+    def ready():
+        if dataset_holder.get() is None:
+            return ('failed', 503) if dataset_holder.error is not None else ('loading', 503)
+        return 'ready'
+
+
+def create_app(dataset_holder, default_date='today', clientside_pies=None, metrics=None):
+    """Build the consolidated Category Distribution dashboard.
+
+    Every callback reads ``dataset_holder.get()`` once, so the app serves
+    whatever Dataset is current, and a swapped-in refresh is picked up on the
+    next request. The dataset may be an in-memory Dataset or a SqliteDataset;
+    the app only uses the methods both provide. ``default_date`` is 'today'
+    or 'latest' (the newest date in the data). ``clientside_pies`` defaults
+    to the CLIENTSIDE_PIES setting.
+    Callback timings are recorded in ``metrics`` (a new Metrics when not
+    given) and served on ``/metrics``. Responses are compressed for browsers
+    that accept it (see compression.install_compression). The table's whole
+    selection can be downloaded from ``/export.csv`` and ``/export.xlsx``.
+
+    The dynamic pie and the table follow either a single day or, in range
+    mode, every day from a start to an end date. The trend chart below them
+    shows the calls per category by day, week or month over the picked range
+    (the whole history in day mode), for one agent or for all.
+
+    The holder may still be empty, e.g. while ``load_in_background`` runs. The
+    app then serves a loading state at once and fills in the date pickers, the
+    table columns and the pie counts when the dataset arrives.
+    """
+    if clientside_pies is None:
+        # Set CLIENTSIDE_PIES=1 to send the per-date category counts to the browser
+        # once and redraw the pie charts there; only the table then calls the server
+        clientside_pies = os.environ.get('CLIENTSIDE_PIES') == '1'
+
+    # Serialized pie figures keyed by (dataset version, view, sheet, day); a
+    # refresh bumps the version, which drops the figures built from older data
+    figure_cache = FigureCache()
+
+    # Initialize the Dash app
+    app = dash.Dash(__name__)
+    app.figure_cache = figure_cache
+
+    # Per-callback timings, payload sizes and row counts for /metrics
+    if metrics is None:
+        metrics = Metrics()
+    metrics.install(app.server, dataset_holder, figure_cache)
+    app.metrics = metrics
+
+    # gzip or brotli for the callback responses, the layout and the assets;
+    # installed after the metrics so they see the size before and after
+    install_compression(app.server)
+
+    # Streamed downloads of every row of the table's selection
+    install_export(app.server, dataset_holder)
+
+    # Date range and default date of the picker for a dataset
+    def date_picker_props(dataset):
+        first, last = dataset.date_bounds()
+        if default_date == 'latest':
+            date = last  # Default to the latest date
+        else:
+            date = datetime.now().date()  # Default to today's date
+        return {
+            'min_date_allowed': first,
+            'max_date_allowed': last,
+            'initial_visible_month': last,
+            'date': date,
+        }
+
+    def table_columns(dataset):
+        return [{"name": i, "id": i} for i in dataset.table_columns()]
+
+    def pie_counts(dataset):
+        # Per-date category counts for the client-side pie charts
+        return count_payload(dataset.count_cube) if clientside_pies else None
+
+    # Define the layout of the Dash app, rebuilt on each page load so the date
+    # range follows the refreshed data
+    def serve_layout():
+        dataset = dataset_holder.get()
+        # Before the first dataset arrives the page is served without data and
+        # polls until it can be filled in
+        loading = dataset is None
+        return html.Div([
+            html.H1("Category Distribution"),
+            html.Div("Loading call entries...", id='loading-banner',
+                     style={} if loading else {'display': 'none'}),
+            dcc.Interval(id='warmup-poll', interval=WARMUP_POLL_INTERVAL, disabled=not loading),
+
+            # Date Picker for the dynamic pie chart, with a range picker for
+            # weekly and monthly breakdowns
+            date_controls(
+                None if loading else date_picker_props(dataset),
+                None if loading else range_picker_props(*dataset.date_bounds())
+            ),
+
+            # Per-date category counts for the client-side pie charts, taken from
+            # the dataset current at page load
+            dcc.Store(id='pie-counts', data=None if loading else pie_counts(dataset)),
+
+            # First pie chart showing consolidated data count for category column in all four sheets
+            dcc.Graph(id='consolidated-pie-chart'),
+
+            # Second pie chart which will be dynamic based on selected date
+            dcc.Graph(id='dynamic-pie-chart'),
+
+            # Display the interactive table
+            html.Div([
+                html.H2("Category Wise Data"),
+                # The server streams every matching row, not just the page on screen
+                export_links(),
+                DataTable(
+                    id='table',
+                    columns=[] if loading else table_columns(dataset),
+                    data=[],
+                    sort_action='custom',  # Sort on the server
+                    filter_action='custom',  # Filter on the server
+                    page_action='custom',  # Only the visible page is sent to the browser
+                    page_current=0,
+                    page_size=10,  # Set number of rows per page
+                    row_selectable='single'  # Allow selecting a single row
+                )
+            ]),
+
+            # Category trends by day, week or month, from the dataset's rollups
+            trend_controls(None if loading else dataset.sheets)
+        ])
+
+    app.layout = serve_layout
+    install_probes(app.server, dataset_holder)
+
+    # Fill in a page served during the load once the dataset is there
+    @app.callback(
+        [Output('date-picker', 'min_date_allowed'),
+         Output('date-picker', 'max_date_allowed'),
+         Output('date-picker', 'initial_visible_month'),
+         Output('date-picker', 'date'),
+         Output('date-range', 'min_date_allowed'),
+         Output('date-range', 'max_date_allowed'),
+         Output('date-range', 'initial_visible_month'),
+         Output('date-range', 'start_date'),
+         Output('date-range', 'end_date'),
+         Output('table', 'columns'),
+         Output('pie-counts', 'data'),
+         Output('trend-sheet', 'options'),
+         Output('loading-banner', 'children'),
+         Output('loading-banner', 'style'),
+         Output('warmup-poll', 'disabled')],
+        [Input('warmup-poll', 'n_intervals')],
+        prevent_initial_call=True
+    )
+    def hydrate(n_intervals):
+        dataset = dataset_holder.get()
+        if dataset is None:
+            if dataset_holder.error is None:
+                raise PreventUpdate
+            # Stop polling and say why the data will not appear
+            return [dash.no_update] * 12 + [f"Loading the data failed: {dataset_holder.error}", {}, True]
+        props = date_picker_props(dataset)
+        range_props = range_picker_props(*dataset.date_bounds())
+        return [props['min_date_allowed'], props['max_date_allowed'], props['initial_visible_month'],
+                props['date'], range_props['min_date_allowed'], range_props['max_date_allowed'],
+                range_props['initial_visible_month'], range_props['start_date'], range_props['end_date'],
+                table_columns(dataset), pie_counts(dataset), sheet_options(dataset.sheets), dash.no_update,
+                {'display': 'none'}, True]
+
+    register_date_mode(app)
+    register_trends(app, dataset_holder, figure_cache, metrics)
+
+    # Callback to update the second pie chart based on the selected day or range
+    @metrics.instrument('update_visuals')
+    def update_visuals(date_mode, selected_date, start_date, end_date):
+        dataset = dataset_holder.get()
+        if dataset is None:
+            raise PreventUpdate
+        start, end = selected_days(date_mode, selected_date, start_date, end_date)
+        # Dynamic pie chart for the selected days: the difference of two rows of
+        # the count cube's running totals (or one indexed query), however long the range
+        dynamic_pie_chart_figure = figure_cache.figure(
+            dataset.version, 'dynamic', None, (start, end),
+            lambda: pie_figure(dataset.categories, dataset.range_counts(start, end),
+                               'Dynamic Category Distribution'))
+        return dynamic_pie_chart_figure
+
+    # Go back to the first page whenever the table selection changes
+    @app.callback(
+        Output('table', 'page_current'),
+        DATE_INPUTS + [Input('dynamic-pie-chart', 'clickData')]
+    )
+    def reset_table_page(date_mode, selected_date, start_date, end_date, clickData):
+        return 0
+
+    # Callback to serve the visible page of the table for the selected days and
+    # clicked category; paging, sorting and filtering all happen on the server
+    @app.callback(
+        [Output('table', 'data'),
+         Output('table', 'page_count')],
+        DATE_INPUTS +
+        [Input('dynamic-pie-chart', 'clickData'),  # Add input for clickData
+         Input('table', 'page_current'),
+         Input('table', 'page_size'),
+         Input('table', 'sort_by'),
+         Input('table', 'filter_query')]
+    )
+    @metrics.instrument('update_table')
+    def update_table(date_mode, selected_date, start_date, end_date, clickData,
+                     page_current, page_size, sort_by, filter_query):
+        dataset = dataset_holder.get()
+        if dataset is None:
+            raise PreventUpdate
+        start, end = selected_days(date_mode, selected_date, start_date, end_date)
+        # Narrow the table to the clicked category
+        clicked_category = clickData['points'][0]['label'] if clickData else None
+        # Rows of the selected days, found by binary search in the day-sorted
+        # frames (or by an indexed query), then filtered, sorted and paged
+        return dataset.table_page(start, end, clicked_category, page_current, page_size, sort_by, filter_query)
+
+    # Point the export links at the table's current selection
+    @app.callback(
+        [Output('export-csv', 'href'),
+         Output('export-xlsx', 'href')],
+        DATE_INPUTS +
+        [Input('dynamic-pie-chart', 'clickData'),
+         Input('table', 'sort_by'),
+         Input('table', 'filter_query')]
+    )
+    def update_export_links(date_mode, selected_date, start_date, end_date, clickData, sort_by, filter_query):
+        clicked_category = clickData['points'][0]['label'] if clickData else None
+        return export_hrefs(app, date_mode, selected_date, start_date, end_date, clicked_category,
+                            sort_by=sort_by, filter_query=filter_query)
+
+    # Callback to update the first pie chart for consolidated data
+    @metrics.instrument('update_consolidated_pie_chart')
+    def update_consolidated_pie_chart(date_mode, selected_date, start_date, end_date):
+        # Static pie chart for consolidated data (total count)
+        # It does not depend on the date, so every date change after the first is a cache hit
+        dataset = dataset_holder.get()
+        if dataset is None:
+            raise PreventUpdate
+        consolidated_pie_chart_figure = figure_cache.figure(
+            dataset.version, 'consolidated', None, None,
+            lambda: pie_figure(dataset.categories, dataset.range_counts(),
+                               'Consolidated Category Distribution'))
+        return consolidated_pie_chart_figure
+
+    # Register the pie chart callbacks: in the browser from the preloaded counts
+    # when CLIENTSIDE_PIES is set, otherwise on the server
+    if clientside_pies:
+        app.clientside_callback(
+            ClientsideFunction(namespace='pies', function_name='dynamic'),
+            Output('dynamic-pie-chart', 'figure'),
+            DATE_INPUTS,
+            [State('pie-counts', 'data')]
+        )
+        app.clientside_callback(
+            ClientsideFunction(namespace='pies', function_name='consolidated'),
+            Output('consolidated-pie-chart', 'figure'),
+            DATE_INPUTS,
+            [State('pie-counts', 'data')]
+        )
+    else:
+        app.callback(Output('dynamic-pie-chart', 'figure'), DATE_INPUTS)(update_visuals)
+        app.callback(Output('consolidated-pie-chart', 'figure'), DATE_INPUTS)(update_consolidated_pie_chart)
+
+    return app
@@ -0,0 +1,357 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+import table_paging
+from count_cube import ROLLUPS, CountCube, to_days
+from excel_loader import SHEET_COLUMN, compact_call_entries, sheet_frames, sort_keys
+from metrics import phase, record_rows
+from row_index import RowIndex, span_positions
+
+logger = logging.getLogger(__name__)
+
+# Appended rows are merged into the loaded frame once they reach this share of
+# its rows; until then they are kept in segments of their own
+TAIL_MERGE_FRACTION = 0.1
+
+
+def _segment(frame, new_rows):
+    # The rows of ``new_rows`` (sheet name -> frame) as a segment: a frame with
+    # the columns, dtypes and sheets of ``frame``, sorted like
+    # compact_call_entries sorts, and its row index
+    sheets = frame[SHEET_COLUMN].cat.categories
+    sheet_names = list(new_rows)
+    new_frame = pd.concat([new_rows[name].reindex(columns=frame.columns.drop(SHEET_COLUMN))
+                           for name in sheet_names], ignore_index=True)
+    sheet_codes = np.repeat([sheets.get_loc(name) for name in sheet_names],
+                            [len(new_rows[name]) for name in sheet_names])
+    new_frame['Date'] = to_days(new_frame['Date']).astype(frame['Date'].dtype)
+    new_frame['Category'] = pd.Categorical(new_frame['Category'])
+    new_frame[SHEET_COLUMN] = pd.Categorical.from_codes(sheet_codes, categories=sheets)
+    new_frame = new_frame[frame.columns]
+    days, category_codes = sort_keys(new_frame['Date'], new_frame['Category'])
+    new_frame = new_frame.take(np.lexsort((category_codes, days, sheet_codes))).reset_index(drop=True)
+    return new_frame, RowIndex.from_frame(new_frame)
+
+
+def _merged(older, newer):
+    """One segment holding the rows of two, in compact_call_entries order.
+
+    The newer rows are inserted at the positions the older row index gives,
+    after the rows they tie with, and the row index is updated from their
+    counts. New categories join the others in name order.
+    """
+    frame, row_index = older
+    new_frame, _ = newer
+    categories = frame['Category'].cat.categories.union(new_frame['Category'].cat.categories)
+    if not categories.equals(frame['Category'].cat.categories):
+        frame = frame.assign(Category=frame['Category'].cat.set_categories(categories))
+    new_frame = new_frame.assign(Category=new_frame['Category'].cat.set_categories(categories))
+    sheet_codes = new_frame[SHEET_COLUMN].cat.codes.to_numpy()
+    positions = row_index.insert_positions(sheet_codes, new_frame['Date'], new_frame['Category'])
+    # Frame rows in their new order, the newer ones numbered after the older
+    order = np.insert(np.arange(len(frame)), positions, np.arange(len(frame), len(frame) + len(new_frame)))
+    merged = pd.concat([frame, new_frame], ignore_index=True).take(order).reset_index(drop=True)
+    return merged, row_index.with_rows(categories, sheet_codes, new_frame['Date'],
+                                       new_frame['Category'].cat.codes.to_numpy())
+
+
+def _coalesced(segment_ids, starts, ends):
+    # Runs with each run that continues the one before it joined to it
+    joins = (segment_ids[1:] == segment_ids[:-1]) & (starts[1:] == ends[:-1])
+    firsts = np.flatnonzero(np.concatenate([[True], ~joins]))
+    lasts = np.append(firsts[1:] - 1, len(starts) - 1)
+    return segment_ids[firsts], starts[firsts], ends[lasts]
+
+
+class Dataset:
+    """The call-entry frames and everything derived from them, as one version.
+
+    A Dataset is never modified once published; a refresh builds the next
+    version and swaps it into the DatasetHolder. The dashboard asks it
+    questions through ``sheets``, ``categories``, ``date_bounds``,
+    ``table_columns``, ``range_counts``, ``category_counts``, ``table_page``,
+    ``export_rows`` and ``describe``, which sqlite_store.SqliteDataset answers
+    the same way from disk. ``count_cube`` and its weekly and monthly
+    ``rollups`` feed the pies and the trend view.
+
+    The rows are held in segments: the loaded frame, then the rows appended
+    since (see ``appended``) in a few smaller frames. Each is sorted by sheet,
+    day and category and has its own RowIndex; queries gather the runs they
+    need from every segment in that order, so they answer as if all the rows
+    were in one frame. ``category_data`` and ``consolidated_data`` merge the
+    segments on first use.
+    """
+
+    def __init__(self, category_data, count_cube=None, version=0, consolidated_data=None, rollups=None,
+                 row_index=None, tail=()):
+        if consolidated_data is None:
+            category_data, consolidated_data = compact_call_entries(category_data)
+        self.sheets = list(category_data)
+        self.count_cube = count_cube if count_cube is not None else CountCube.from_frames(category_data)
+        # The count cube rolled up per calendar week and month, for the trend view
+        self.rollups = rollups if rollups is not None else {
+            bucket: self.count_cube.rolled(freq) for bucket, freq in ROLLUPS.items()}
+        self.version = version
+        # The loaded frame with its runs of rows per (sheet, day, category),
+        # then the segments of rows appended since, oldest first
+        if row_index is None:
+            row_index = RowIndex.from_frame(consolidated_data)
+        self._segments = [(consolidated_data, row_index)] + list(tail)
+        self._category_data = category_data
+        self._merged = None
+        self._all_categories = None
+
+    @property
+    def consolidated_data(self):
+        # Every row in one frame, in compact_call_entries order
+        return self._merged_segment()[0]
+
+    @property
+    def category_data(self):
+        # The frame of each sheet, without the Sheet column
+        if len(self._segments) > 1:
+            frame, row_index = self._merged_segment()
+            return sheet_frames(frame, self.sheets, row_index.sheet_lengths().tolist())
+        return self._category_data
+
+    def _merged_segment(self):
+        if len(self._segments) == 1:
+            return self._segments[0]
+        if self._merged is None:
+            merged = self._segments[0]
+            for segment in self._segments[1:]:
+                merged = _merged(merged, segment)
+            self._merged = merged
+        return self._merged
+
+    def _categories(self):
+        # Every segment's categories, in name order
+        if self._all_categories is None:
+            categories = self._segments[0][0]['Category'].cat.categories
+            for frame, _ in self._segments[1:]:
+                categories = categories.union(frame['Category'].cat.categories)
+            self._all_categories = categories
+        return self._all_categories
+
+    def _runs(self, start, end, category, sheet_name):
+        """Runs of the rows dated from ``start`` to ``end`` with ``category``
+        (any when None), of one sheet or of all, as arrays of segment numbers,
+        starts and ends, in the order the rows would have in one frame.
+
+        Undated rows are never included. With one segment these are the row
+        index's spans; otherwise every (sheet, day, category) run of each
+        segment is put in order, the older segment's first where they tie.
+        """
+        if len(self._segments) == 1:
+            row_index = self._segments[0][1]
+            if category is None:
+                starts, ends = row_index.day_spans(start, end, sheet_name)
+            else:
+                starts, ends = row_index.spans(start, end, category, sheet_name)
+            return np.zeros(len(starts), dtype=np.intp), starts, ends
+
+        categories = self._categories()
+        parts = []
+        for i, (_, row_index) in enumerate(self._segments):
+            starts, ends, sheet_codes, days, positions = row_index.runs(start, end, category, sheet_name)
+            # Rank of each run's category among all segments', none last
+            ranks = np.append(categories.get_indexer(row_index.categories), len(categories))[positions]
+            parts.append((np.full(len(starts), i), starts, ends, sheet_codes,
+                          days.to_numpy().astype(np.int64), ranks))
+        segment_ids, starts, ends, sheet_codes, days, ranks = (np.concatenate(column) for column in zip(*parts))
+        order = np.lexsort((segment_ids, ranks, days, sheet_codes))
+        if not len(order):
+            return segment_ids, starts, ends
+        return _coalesced(segment_ids[order], starts[order], ends[order])
+
+    def _frame(self, segment_ids, starts, ends):
+        # The rows of these runs, in run order. Within one segment a single run
+        # is a slice, so nothing is copied
+        frames = [frame for frame, _ in self._segments]
+        if len(starts) <= 1:
+            frame = frames[segment_ids[0]] if len(starts) else frames[0]
+            lo, hi = (starts[0], ends[0]) if len(starts) else (0, 0)
+            return frame.iloc[lo:hi]
+        used = np.unique(segment_ids)
+        if len(used) == 1:
+            return frames[used[0]].iloc[span_positions(starts, ends)]
+        # Gather each segment's rows, then put them in run order
+        lengths = ends - starts
+        firsts = np.cumsum(lengths) - lengths
+        categories = self._categories()
+        parts, targets = [], []
+        for i in used:
+            mine = segment_ids == i
+            part = frames[i].iloc[span_positions(starts[mine], ends[mine])]
+            parts.append(part.assign(Category=part['Category'].cat.set_categories(categories)))
+            targets.append(span_positions(firsts[mine], firsts[mine] + lengths[mine]))
+        gathered = pd.concat(parts)
+        inverse = np.empty(len(gathered), dtype=np.intp)
+        inverse[np.concatenate(targets)] = np.arange(len(gathered))
+        return gathered.iloc[inverse]
+
+    def rows_between(self, start=None, end=None, sheet_name=None):
+        """Rows dated from ``start`` to ``end`` (both included) of one sheet, or of all.
+
+        None leaves that end of the range open. Without appended segments a
+        single sheet's rows come back as a slice of the frame; the
+        consolidated rows are gathered sheet by sheet.
+        """
+        return self._frame(*self._runs(start, end, None, sheet_name))
+
+    def date_bounds(self):
+        # First and last day in the data
+        days = [row_index.days for _, row_index in self._segments if len(row_index.days)]
+        if not days:
+            return pd.NaT, pd.NaT
+        return min(day_index[0] for day_index in days), max(day_index[-1] for day_index in days)
+
+    def table_columns(self):
+        # Columns the tables show: those of the sheet frames
+        return [name for name in self._segments[0][0].columns if name != SHEET_COLUMN]
+
+    @property
+    def categories(self):
+        # Category names, in the order of the range_counts arrays
+        return self.count_cube.categories
+
+    def range_counts(self, start=None, end=None, sheet_name=None):
+        # Rows per category dated from ``start`` to ``end``, of one sheet or of all
+        if sheet_name is None:
+            return self.count_cube.consolidated_range_counts(start, end)
+        return self.count_cube.sheet_range_counts(sheet_name, start, end)
+
+    def category_counts(self, start=None, end=None, sheet_name=None):
+        # Category/Count frame of the rows dated from ``start`` to ``end``, of one sheet or of all
+        return self.count_cube.counts_frame(self.range_counts(start, end, sheet_name))
+
+    def _selection(self, start, end, category, sheet_name):
+        # Rows dated from ``start`` to ``end`` with ``category`` (any when None).
+        # A category's rows are looked up in the row indexes instead of masking
+        # the frame; on a single day they are one slice, so nothing is copied
+        return self._frame(*self._runs(start, end, category, sheet_name))
+
+    def table_page(self, start, end, category, page_current, page_size, sort_by=None, filter_query='',
+                   sheet_name=None):
+        """Answer a custom-paged DataTable request for the rows dated from
+        ``start`` to ``end`` with ``category`` (any when None), of one sheet or
+        of all. The records hold the ``table_columns`` only. Returns
+        ``(records, page_count)``.
+        """
+        with phase('pandas'):
+            table_frame = self._selection(start, end, category, sheet_name)
+            record_rows(len(table_frame))
+            return table_paging.table_page(table_frame, page_current, page_size, sort_by, filter_query,
+                                           self.table_columns())
+
+    def export_rows(self, start, end, category, sort_by=None, filter_query='', sheet_name=None, chunk_rows=10000):
+        """Every row ``table_page`` would page through, in the same order, as
+        lists of at most ``chunk_rows`` tuples of the ``table_columns`` values.
+
+        Without a filter or sort, each chunk is gathered from the row indexes'
+        runs on its own, so memory stays bounded however many rows match.
+        With either, the whole selection is filtered and sorted first (an
+        in-memory frame, unlike the SQLite backend's query), and only the
+        conversion to Python values goes a chunk at a time.
+        """
+        columns = self.table_columns()
+        if not filter_query and not sort_by:
+            segment_ids, starts, ends = self._runs(start, end, category, sheet_name)
+            # Where each run's rows start and end in the export
+            run_ends = np.cumsum(ends - starts)
+            run_firsts = run_ends - (ends - starts)
+            total = int(run_ends[-1]) if len(run_ends) else 0
+            for first in range(0, total, chunk_rows):
+                last = min(first + chunk_rows, total)
+                i = run_ends.searchsorted(first, side='right')
+                j = run_firsts.searchsorted(last, side='left')
+                # The runs overlapping this chunk, clipped to it
+                lo = starts[i:j] + np.maximum(0, first - run_firsts[i:j])
+                hi = ends[i:j] - np.maximum(0, run_ends[i:j] - last)
+                chunk = self._frame(segment_ids[i:j], lo, hi)[columns]
+                yield list(chunk.itertuples(index=False, name=None))
+            return
+        table_frame = self._selection(start, end, category, sheet_name)
+        table_frame = table_paging.sort_frame(table_paging.filter_frame(table_frame, filter_query), sort_by)
+        table_frame = table_frame[columns]
+        for first in range(0, len(table_frame), chunk_rows):
+            yield list(table_frame.iloc[first:first + chunk_rows].itertuples(index=False, name=None))
+
+    def describe(self):
+        # Size of the dataset for /metrics. Deep memory usage walks every
+        # string, so callers should ask once per version
+        return {
+            'rows': sum(len(frame) for frame, _ in self._segments),
+            'sheets': len(self.sheets),
+            'categories': len(self.count_cube.categories),
+            'bytes': sum(int(frame.memory_usage(index=True, deep=True).sum()) for frame, _ in self._segments),
+        }
+
+    def appended(self, new_rows):
+        """Next version with ``new_rows`` (sheet name -> frame) added to the end
+        of each sheet.
+
+        Only the new rows are parsed and sorted, into a segment of their own;
+        the frames already loaded are shared with this version, not copied.
+        The count cube and rollups are updated from the new rows' counts. To
+        keep queries from visiting many small segments, the newest segment is
+        merged into the one before it while that is at most twice its size,
+        and all of them into the loaded frame once they reach
+        TAIL_MERGE_FRACTION of its rows, so each row is copied a bounded number
+        of times however long the history grows.
+        """
+        base, tail = self._segments[0], self._segments[1:]
+        if sum(len(df) for df in new_rows.values()):
+            tail.append(_segment(base[0], new_rows))
+        while len(tail) > 1 and len(tail[-2][0]) <= 2 * len(tail[-1][0]):
+            tail[-2:] = [_merged(tail[-2], tail[-1])]
+        category_data = self._category_data
+        if tail and sum(len(frame) for frame, _ in tail) >= TAIL_MERGE_FRACTION * len(base[0]):
+            for segment in tail:
+                base = _merged(base, segment)
+            tail = []
+            category_data = sheet_frames(base[0], self.sheets, base[1].sheet_lengths().tolist())
+
+        new_counts = CountCube.from_frames(new_rows)
+        count_cube = self.count_cube.merged(new_counts)
+        # Only the new rows are rolled up; their buckets are added to the existing ones
+        rollups = {bucket: self.rollups[bucket].merged(new_counts.rolled(freq)) for bucket, freq in ROLLUPS.items()}
+        return Dataset(category_data, count_cube, self.version + 1, base[0], rollups, base[1], tail)
+
+
+class DatasetHolder:
+    """Points at the current Dataset.
+
+    Callbacks call ``get()`` once and use that object throughout, so a swap in
+    the middle of a callback never mixes two versions. ``get()`` returns None
+    until the first Dataset is published.
+    """
+
+    def __init__(self, dataset=None):
+        self._dataset = dataset
+        self._lock = threading.Lock()
+        # Set when a background load fails, so /ready can report it
+        self.error = None
+
+    def get(self):
+        return self._dataset
+
+    def swap(self, dataset):
+        with self._lock:
+            self._dataset = dataset
+
+    def load_in_background(self, load):
+        """Run ``load()`` on a daemon thread and publish the Dataset it returns."""
+        def run():
+            try:
+                self.swap(load())
+            except Exception as exc:
+                self.error = exc
+                logger.exception("Loading the dataset failed")
+
+        thread = threading.Thread(target=run, name='dataset-warmup', daemon=True)
+        thread.start()
+        return thread
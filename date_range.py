@@ -0,0 +1,75 @@
+import pandas as pd
+from dash import dcc, html, Input, Output
+from dash.exceptions import PreventUpdate
+
+from count_cube import to_day
+
+# Days the range picker covers when first shown: the last week of data
+DEFAULT_RANGE_DAYS = 7
+
+DATE_MODES = [{'label': 'Day', 'value': 'day'}, {'label': 'Range', 'value': 'range'}]
+
+# The date controls as callback inputs, in the order selected_days takes them
+DATE_INPUTS = [Input('date-mode', 'value'),
+               Input('date-picker', 'date'),
+               Input('date-range', 'start_date'),
+               Input('date-range', 'end_date')]
+
+
+def date_controls(picker_props=None, range_props=None):
+    """Day/Range switch over a single-date picker and a date-range picker.
+
+    Only the picker of the selected mode is shown; both keep their values, so
+    switching back and forth does not lose a selection.
+    """
+    return html.Div([
+        dcc.RadioItems(id='date-mode', options=DATE_MODES, value='day', inline=True),
+        html.Div(dcc.DatePickerSingle(id='date-picker', **(picker_props or {})), id='date-picker-box'),
+        html.Div(dcc.DatePickerRange(id='date-range', **(range_props or {})),
+                 id='date-range-box', style={'display': 'none'}),
+    ])
+
+
+def range_picker_props(first, last):
+    # Bounds of the range picker for data from ``first`` to ``last``, starting on the last week of data
+    return {
+        'min_date_allowed': first,
+        'max_date_allowed': last,
+        'initial_visible_month': last,
+        'start_date': last - pd.Timedelta(days=DEFAULT_RANGE_DAYS - 1),
+        'end_date': last,
+    }
+
+
+def register_date_mode(app):
+    # Show the picker of the selected mode; this only touches styles, so it runs in the browser
+    app.clientside_callback(
+        """
+        function (mode) {
+            var range = mode === 'range';
+            return [{display: range ? 'none' : 'block'}, {display: range ? 'block' : 'none'}];
+        }
+        """,
+        [Output('date-picker-box', 'style'), Output('date-range-box', 'style')],
+        [Input('date-mode', 'value')]
+    )
+
+
+def selected_days(date_mode, selected_date, start_date, end_date):
+    """First and last day (both included) picked in the date controls.
+
+    In range mode a missing end leaves that side of the range open. In day
+    mode both are the picked day; without one there is nothing to show, so
+    PreventUpdate is raised.
+    """
+    if date_mode == 'range':
+        return to_day(start_date), to_day(end_date)
+    day = to_day(selected_date)
+    if day is None:
+        raise PreventUpdate
+    return day, day
+
+
+def days_key(start, end):
+    # JSON-ready form of a day range, for the 'pie-rendered' store
+    return [None if day is None else day.strftime('%Y-%m-%d') for day in (start, end)]
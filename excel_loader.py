@@ -0,0 +1,188 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from count_cube import to_days
+
+# Header spellings used for the category column across the agent sheets
+CATEGORY_HEADERS = ['Category', 'Category ', 'Category:']
+
+# Columns every dashboard needs, whatever the table shows
+REQUIRED_COLUMNS = ['Date', 'Category']
+
+# Extra column of the consolidated frame naming the agent sheet of each row
+SHEET_COLUMN = 'Sheet'
+
+
+def standardize_category_column(df, sheet_name):
+    # Standardize column names to ensure consistency
+    for header in CATEGORY_HEADERS:
+        if header in df.columns:
+            if header != 'Category':
+                df.rename(columns={header: 'Category'}, inplace=True)
+            return df
+    raise ValueError(f"Category column not found in sheet '{sheet_name}'")
+
+
+def _has_category_header(header_row):
+    return any(value in CATEGORY_HEADERS for value in header_row)
+
+
+def _agent_sheets(workbook):
+    # Every worksheet whose header row has a category column is an agent sheet
+    return [worksheet.title for worksheet in workbook.worksheets
+            if _has_category_header(next(worksheet.iter_rows(max_row=1, values_only=True), ()))]
+
+
+def discover_sheet_names(file_path):
+    """Names of the agent sheets in a workbook, in workbook order."""
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        return _agent_sheets(workbook)
+    finally:
+        workbook.close()
+
+
+def _header_names(header_row, sheet_name):
+    # Same naming rules as pd.read_excel: blank headers become 'Unnamed: i' and
+    # repeated headers get a '.n' suffix
+    header_row = list(header_row)
+    while header_row and header_row[-1] is None:
+        header_row.pop()
+
+    names = []
+    seen = {}
+    for i, value in enumerate(header_row):
+        name = f'Unnamed: {i}' if value is None else value
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+
+    for header in CATEGORY_HEADERS:
+        if header in names:
+            names[names.index(header)] = 'Category'
+            return names
+    raise ValueError(f"Category column not found in sheet '{sheet_name}'")
+
+
+def _read_sheet(worksheet, sheet_name, wanted):
+    rows = worksheet.iter_rows(values_only=True)
+    names = _header_names(next(rows, ()), sheet_name)
+
+    # Keep only the wanted columns; ``wanted`` of None keeps them all
+    keep = [i for i, name in enumerate(names) if wanted is None or name in wanted]
+    columns = [[] for _ in keep]
+    for row in rows:
+        # Blank rows are skipped, as pd.read_excel does
+        if all(value is None for value in row):
+            continue
+        width = len(row)
+        for values, i in zip(columns, keep):
+            values.append(row[i] if i < width else None)
+
+    return pd.DataFrame({names[i]: values for i, values in zip(keep, columns)})
+
+
+def _blank_column(column, values):
+    # A column with neither a header ('Unnamed: n' from Excel, '' from Google
+    # Sheets) nor any values
+    if not isinstance(column, str) or not (column == '' or column.startswith('Unnamed: ')):
+        return False
+    return (values.isna() | (values.astype(str) == '')).all()
+
+
+def compact_call_entries(category_data):
+    """Typed, shared-buffer frames for the agent sheets in ``category_data``.
+
+    The consolidated frame keeps the columns the table shows (the first sheet's,
+    less blank unnamed ones) plus ``Date`` and ``Category``. ``Date`` becomes a
+    day-resolution datetime64, and ``Category`` and the added ``Sheet`` column
+    become categoricals. Within each sheet the rows are in day order (undated
+    rows last), so a date range is a contiguous run found by binary search, and
+    within a day in category order (rows without one last, ties in file order),
+    so the rows of one (sheet, day, category) are a contiguous run as well; see
+    row_index.RowIndex. Each per-sheet frame is a row slice of the consolidated
+    frame without ``Sheet``, so both share the same buffers.
+
+    Returns the per-sheet frames keyed by sheet name and the consolidated frame.
+    """
+    sheet_names = list(category_data)
+    frames = list(category_data.values())
+    columns = list(frames[0].columns)
+    columns += [column for column in REQUIRED_COLUMNS if column not in columns]
+
+    consolidated_data = pd.concat([df.reindex(columns=columns) for df in frames], ignore_index=True)
+    consolidated_data = consolidated_data[
+        [column for column in columns if not _blank_column(column, consolidated_data[column])]]
+    consolidated_data['Date'] = to_days(consolidated_data['Date'])
+    consolidated_data['Category'] = consolidated_data['Category'].astype('category')
+    lengths = [len(df) for df in frames]
+    sheet_codes = np.repeat(np.arange(len(frames)), lengths)
+
+    # One stable sort by (sheet, day, category code), with undated rows and
+    # rows without a category after the others
+    days, category_codes = sort_keys(consolidated_data['Date'], consolidated_data['Category'])
+    order = np.lexsort((category_codes, days, sheet_codes))
+    consolidated_data = consolidated_data.take(order).reset_index(drop=True)
+    consolidated_data[SHEET_COLUMN] = pd.Categorical.from_codes(sheet_codes, categories=sheet_names)
+
+    return sheet_frames(consolidated_data, sheet_names, lengths), consolidated_data
+
+
+def sort_keys(dates, categories):
+    # Day and category code of each row as sort keys, with missing days and
+    # categories after the others
+    days = dates.to_numpy().astype(np.int64)
+    days[dates.isna().to_numpy()] = np.iinfo(np.int64).max
+    category_codes = categories.cat.codes.to_numpy().astype(np.int64)
+    category_codes[category_codes < 0] = len(categories.cat.categories)
+    return days, category_codes
+
+
+def sheet_frames(consolidated_data, sheet_names, lengths):
+    # The per-sheet frames of a consolidated frame holding ``lengths`` rows of
+    # each sheet in turn
+    category_data = {}
+    start = 0
+    for sheet_name, n_rows in zip(sheet_names, lengths):
+        # Copy-on-write slices: no data is copied unless a slice is modified
+        category_data[sheet_name] = (consolidated_data.iloc[start:start + n_rows]
+                                     .drop(columns=SHEET_COLUMN).reset_index(drop=True))
+        start += n_rows
+    return category_data
+
+
+def read_call_entries(file_path, sheet_names=None, columns=None):
+    """Read the agent sheets of a call-entry workbook in one pass.
+
+    The workbook is opened once in read-only mode and each sheet's rows are
+    streamed straight into per-column lists. Only ``Date``, ``Category`` and
+    ``columns`` are kept; when ``columns`` is None the first sheet's columns are
+    used, since those are the ones the table shows. When ``sheet_names`` is
+    None every agent sheet of the workbook is read.
+
+    Returns the per-sheet frames keyed by sheet name and the consolidated frame,
+    compacted by ``compact_call_entries``.
+    """
+    wanted = None if columns is None else set(columns) | set(REQUIRED_COLUMNS)
+    category_data = {}
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        if sheet_names is None:
+            sheet_names = _agent_sheets(workbook)
+        for sheet_name in sheet_names:
+            if sheet_name not in workbook.sheetnames:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
+            df = _read_sheet(workbook[sheet_name], sheet_name, wanted)
+            if wanted is None:
+                wanted = set(df.columns) | set(REQUIRED_COLUMNS)
+            category_data[sheet_name] = df
+    finally:
+        workbook.close()
+
+    # A single concatenation once every sheet is read
+    return compact_call_entries(category_data)
@@ -0,0 +1,115 @@
+import re
+import threading
+import time
+
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol
+
+# Local stand-in for the parts of gspread the dashboards use, so loaders and
+# refreshers can be exercised without Google credentials or network access
+
+
+class FakeResponse:
+    # Just enough of requests.Response for gspread's APIError
+    def __init__(self, status_code, message='', headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = message
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': self.text, 'status': 'FAKE'}}
+
+
+def _split_range(range_name):
+    # "'Sheet'!A5:F" -> ('Sheet', 'A5:F'); "'Sheet'" -> ('Sheet', None)
+    title, _, cells = range_name.partition('!')
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title, cells or None
+
+
+class FakeWorksheet:
+    def __init__(self, title, values):
+        self.title = title
+        self.values = [list(row) for row in values]
+        # Cells handed out so far, to check that reads stay incremental
+        self.cells_read = 0
+
+    def _read(self, rows):
+        self.cells_read += sum(len(row) for row in rows)
+        return [list(row) for row in rows]
+
+    def get_all_values(self):
+        return self._read(self.values)
+
+    def get(self, range_name):
+        # Supports 'A5:F' (open-ended), 'A5:F9' and whole-row '1:1' ranges
+        start, _, end = range_name.partition(':')
+        if start.isdigit():
+            first_row, first_col = int(start), 1
+            last_row, last_col = int(end), max([len(row) for row in self.values], default=0)
+        else:
+            first_row, first_col = a1_to_rowcol(start)
+            match = re.fullmatch(r'([A-Z]+)(\d*)', end)
+            last_col = a1_to_rowcol(match.group(1) + '1')[1]
+            last_row = int(match.group(2)) if match.group(2) else len(self.values)
+        rows = [row[first_col - 1:last_col] for row in self.values[first_row - 1:last_row]]
+        # Like the Sheets API, trailing empty cells and rows are not returned
+        rows = [row[:max([i + 1 for i, value in enumerate(row) if value != ''], default=0)] for row in rows]
+        while rows and not rows[-1]:
+            rows.pop()
+        return self._read(rows)
+
+    def append_row(self, values):
+        self.values.append(list(values))
+
+
+class FakeSpreadsheet:
+    """In-memory spreadsheet with simulated round-trip latency and API errors.
+
+    Every request (``worksheet``, ``worksheets``, ``values_batch_get``) sleeps
+    ``latency`` seconds and is counted in ``requests``. ``fail_next`` makes the
+    following requests raise gspread's APIError with the given status.
+    """
+
+    def __init__(self, sheets, latency=0.0):
+        # sheets maps worksheet title to its rows, header row first
+        self._worksheets = {title: FakeWorksheet(title, values) for title, values in sheets.items()}
+        self.latency = latency
+        self.requests = 0
+        self._failures = []
+        self._lock = threading.Lock()
+
+    def fail_next(self, count, status=429, retry_after=None):
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        self._failures.extend([FakeResponse(status, 'Quota exceeded', headers)] * count)
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+            failure = self._failures.pop(0) if self._failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if failure is not None:
+            raise APIError(failure)
+
+    def worksheet(self, title):
+        self._request()
+        return self._worksheets[title]
+
+    def worksheets(self):
+        self._request()
+        return list(self._worksheets.values())
+
+    def values_batch_get(self, ranges, params=None):
+        self._request()
+        value_ranges = []
+        for range_name in ranges:
+            title, cells = _split_range(range_name)
+            worksheet = self._worksheets[title]
+            values = worksheet.get(cells) if cells else worksheet.get_all_values()
+            value_range = {'range': range_name, 'majorDimension': 'ROWS'}
+            if values:
+                value_range['values'] = values
+            value_ranges.append(value_range)
+        return {'spreadsheetId': 'fake', 'valueRanges': value_ranges}
@@ -0,0 +1,79 @@
+import json
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+from count_cube import to_day
+from metrics import phase
+
+# Enough for every agent's pie over a few weeks of commonly viewed days
+MAX_FIGURES = 512
+
+
+class FigureCache:
+    """Bounded LRU cache of serialized plotly figures.
+
+    Keys are ``(dataset version, view, sheet, day)``, where the day may also be
+    a ``(first, last)`` range. Figures are stored as plain JSON-ready dicts, so
+    a hit skips pandas, plotly and numpy encoding. A builder may return such a
+    dict itself (see pie_figures.pie_figure), which is then stored as it is.
+    When a key with a newer dataset version arrives, everything cached for older
+    versions is dropped, which invalidates the cache on every data refresh.
+    Versions must increase, as Dataset versions do.
+    """
+
+    def __init__(self, maxsize=MAX_FIGURES):
+        self.maxsize = maxsize
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _invalidate(self, version):
+        self.invalidations += len(self._figures)
+        self._figures.clear()
+        self.version = version
+
+    def figure(self, version, view, sheet, date, build):
+        # Cached figure for this key, calling ``build()`` to create it on a miss
+        day = tuple(to_day(end) for end in date) if isinstance(date, tuple) else to_day(date)
+        key = (version, view, sheet, day)
+        with self._lock:
+            if self.version is None or version > self.version:
+                self._invalidate(version)
+            # A callback still holding an older dataset gets an uncached figure
+            figure = self._figures.get(key) if version == self.version else None
+            if figure is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return figure
+            self.misses += 1
+
+        with phase('plotly'):
+            figure = build()
+        if not isinstance(figure, dict):
+            with phase('serialize'):
+                figure = json.loads(pio.to_json(figure, validate=False))
+
+        with self._lock:
+            if version == self.version:
+                self._figures[key] = figure
+                while len(self._figures) > self.maxsize:
+                    self._figures.popitem(last=False)
+                    self.evictions += 1
+        return figure
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._figures),
+                'maxsize': self.maxsize,
+            }
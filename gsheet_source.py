@@ -0,0 +1,211 @@
+import logging
+import random
+import threading
+import time
+
+import gspread
+import pandas as pd
+from gspread.exceptions import APIError
+from oauth2client.service_account import ServiceAccountCredentials
+from gspread.utils import rowcol_to_a1
+
+from dataset import Dataset
+from excel_loader import CATEGORY_HEADERS, compact_call_entries, standardize_category_column
+
+logger = logging.getLogger(__name__)
+
+# Google Sheets API scopes needed to read the spreadsheet
+SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+
+# Seconds between two checks for newly appended rows
+REFRESH_INTERVAL = 60
+
+# Quota (429) and transient server errors are retried with exponential backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 64.0
+
+
+def open_spreadsheet(credentials_file, sheet_url):
+    # Authenticate with a service-account key file and open the spreadsheet
+    credentials = ServiceAccountCredentials.from_json_keyfile_name(credentials_file, SCOPE)
+    return gspread.authorize(credentials).open_by_url(sheet_url)
+
+
+def with_backoff(request, retries=MAX_RETRIES, base=BACKOFF_BASE, sleep=time.sleep):
+    # Run ``request()``, retrying rate-limited and transient API errors
+    for attempt in range(retries + 1):
+        try:
+            return request()
+        except APIError as exc:
+            response = getattr(exc, 'response', None)
+            status = getattr(response, 'status_code', None)
+            if status not in RETRY_STATUSES or attempt == retries:
+                raise
+            delay = min(BACKOFF_MAX, base * 2 ** attempt) + random.uniform(0, base)
+            retry_after = (getattr(response, 'headers', None) or {}).get('Retry-After')
+            if retry_after is not None and retry_after.isdigit():
+                delay = float(retry_after)
+            logger.warning("Google Sheets API returned %s, retrying in %.1fs", status, delay)
+            sleep(delay)
+
+
+def _typed_column(values):
+    # Numeric columns become numbers (blank cells NaN), anything else stays text
+    column = pd.Series(values, dtype=object)
+    filled = column != ''
+    numbers = pd.to_numeric(column.where(filled), errors='coerce')
+    if filled.any() and numbers[filled].notna().all():
+        return numbers
+    return column
+
+
+def frame_from_values(header, rows, sheet_name):
+    """Typed frame from a raw value grid, one column at a time.
+
+    The Sheets API trims trailing empty cells, so rows are padded to the header
+    width before being transposed into columns.
+    """
+    width = len(header)
+    if rows:
+        columns = list(zip(*(row[:width] + [''] * (width - len(row)) for row in rows)))
+    else:
+        columns = [()] * width
+    df = pd.DataFrame({name: values for name, values in zip(header, columns)})
+    df = standardize_category_column(df, sheet_name)
+    for name in df.columns:
+        if name == 'Date':
+            df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
+        elif name != 'Category':
+            df[name] = _typed_column(df[name])
+    return df
+
+
+def _quote(sheet_name):
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def discover_sheet_names(spreadsheet, sleep=time.sleep):
+    """Titles of the agent worksheets: those whose header row has a category column.
+
+    Costs two requests however many worksheets there are: the spreadsheet
+    metadata, then every header row in one batched values request.
+    """
+    titles = [worksheet.title for worksheet in with_backoff(spreadsheet.worksheets, sleep=sleep)]
+    response = with_backoff(
+        lambda: spreadsheet.values_batch_get([f'{_quote(title)}!1:1' for title in titles]), sleep=sleep)
+    headers = [(value_range.get('values') or [[]])[0] for value_range in response['valueRanges']]
+    return [title for title, header in zip(titles, headers)
+            if any(value in CATEGORY_HEADERS for value in header)]
+
+
+class SheetRefresher:
+    """Keeps a DatasetHolder in sync with the agent worksheets of a spreadsheet.
+
+    ``load()`` reads every worksheet in a single batched values request. After
+    that, ``refresh()`` asks, again in one request, only for the rows below the
+    last row seen in each worksheet, so a refresh costs in proportion to the
+    rows appended since the previous one. Each refresh that finds rows
+    publishes a new Dataset version through ``holder.swap``. Load and refresh
+    timings are recorded in ``metrics`` when one is given. With ``sheet_names``
+    None the agent worksheets are discovered when loading. Worksheets that are
+    empty when loaded are left out. With a sqlite_store.SqliteStore as
+    ``store`` the rows are kept there instead of in memory. ``spreadsheet``
+    may also be a function opening it, called by the first ``load()``, so that
+    nothing is fetched before then.
+    """
+
+    def __init__(self, spreadsheet, sheet_names, holder, interval=REFRESH_INTERVAL, sleep=time.sleep,
+                 metrics=None, store=None):
+        self.spreadsheet = spreadsheet
+        self.sheet_names = list(sheet_names) if sheet_names is not None else None
+        self.holder = holder
+        self.interval = interval
+        self.sleep = sleep
+        self.metrics = metrics
+        self.store = store
+        self._headers = {}
+        # Number of rows (header included) already loaded from each worksheet
+        self._last_row = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _batch_get(self, ranges):
+        response = with_backoff(lambda: self.spreadsheet.values_batch_get(ranges), sleep=self.sleep)
+        return [value_range.get('values', []) for value_range in response['valueRanges']]
+
+    def load(self):
+        start = time.perf_counter()
+        if callable(self.spreadsheet):
+            self.spreadsheet = self.spreadsheet()
+        if self.sheet_names is None:
+            self.sheet_names = discover_sheet_names(self.spreadsheet, self.sleep)
+        grids = self._batch_get([_quote(sheet_name) for sheet_name in self.sheet_names])
+
+        category_data = {}
+        for sheet_name, values in zip(list(self.sheet_names), grids):
+            if not values:
+                # A blank worksheet has no header to read rows by; leave it out
+                logger.warning("Skipping worksheet '%s': it is empty", sheet_name)
+                self.sheet_names.remove(sheet_name)
+                continue
+            header, rows = values[0], values[1:]
+            self._headers[sheet_name] = header
+            self._last_row[sheet_name] = len(values)
+            category_data[sheet_name] = frame_from_values(header, rows, sheet_name)
+
+        category_data, consolidated_data = compact_call_entries(category_data)
+        if self.store is not None:
+            dataset = self.store.dataset(category_data, consolidated_data, previous=self.holder.get())
+        else:
+            dataset = Dataset(category_data, consolidated_data=consolidated_data)
+        self.holder.swap(dataset)
+        if self.metrics is not None:
+            self.metrics.observe_ingest(time.perf_counter() - start, 'load')
+        return dataset
+
+    def fetch_new_rows(self):
+        # Rows appended below the last row seen in each worksheet
+        ranges = []
+        for sheet_name in self.sheet_names:
+            start = self._last_row[sheet_name] + 1
+            last_column = rowcol_to_a1(1, len(self._headers[sheet_name])).rstrip('0123456789')
+            ranges.append(f'{_quote(sheet_name)}!A{start}:{last_column}')
+
+        grids = self._batch_get(ranges)
+        return {sheet_name: rows for sheet_name, rows in zip(self.sheet_names, grids) if rows}
+
+    def refresh(self):
+        start = time.perf_counter()
+        new_rows = self.fetch_new_rows()
+        if not new_rows:
+            return False
+
+        frames = {}
+        for sheet_name, rows in new_rows.items():
+            frames[sheet_name] = frame_from_values(self._headers[sheet_name], rows, sheet_name)
+        self.holder.swap(self.holder.get().appended(frames))
+        # Only advance once the new version is published
+        for sheet_name, rows in new_rows.items():
+            self._last_row[sheet_name] += len(rows)
+        if self.metrics is not None:
+            self.metrics.observe_ingest(time.perf_counter() - start, 'refresh')
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:  # Keep serving the last good version
+                logger.exception("Google Sheets refresh failed")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sheet-refresher', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
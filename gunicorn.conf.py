@@ -0,0 +1,15 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py wsgi:application
+bind = os.environ.get('BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# Load the app once in the master; with the default DATASET_WARMUP the dataset
+# is loaded there too and workers share it copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.start_worker()
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+
+from excel_loader import read_call_entries
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Without pyarrow every start parses the workbook
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the Feather snapshots and their manifests
+CACHE_DIR = os.environ.get('INGEST_CACHE_DIR', '.ingest_cache')
+
+# Bump when the layout of the snapshot or of the normalized frames changes
+SNAPSHOT_FORMAT = 6
+
+# Hit/miss counters so a restart that fell back to openpyxl is visible
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot_paths(cache_dir, file_path):
+    name = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{name}.json'), os.path.join(cache_dir, f'{name}.feather')
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest_path, manifest):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def arrow_safe(df):
+    # Excel columns often mix numbers and text; Arrow needs one type per column
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+
+def _write_snapshot(snapshot_path, consolidated_data):
+    tmp_path = snapshot_path + '.tmp'
+    consolidated_data = consolidated_data.rename(columns=str)
+    try:
+        feather.write_feather(consolidated_data, tmp_path)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        feather.write_feather(arrow_safe(consolidated_data), tmp_path)
+    os.replace(tmp_path, snapshot_path)
+
+
+def _frames_from_snapshot(snapshot_path, manifest):
+    consolidated_data = feather.read_feather(snapshot_path)
+    category_data = {}
+    start = 0
+    for sheet_name, n_rows, columns in manifest['sheets']:
+        category_data[sheet_name] = consolidated_data.iloc[start:start + n_rows][columns].reset_index(drop=True)
+        start += n_rows
+    return category_data, consolidated_data
+
+
+def previous_snapshot(file_path, cache_dir=CACHE_DIR):
+    # Frames of the last snapshot of ``file_path``, even if the workbook has
+    # changed since; None when there is no usable one
+    manifest_path, snapshot_path = _snapshot_paths(cache_dir, file_path)
+    manifest = _read_manifest(manifest_path) if pa is not None else None
+    if not manifest or manifest.get('format') != SNAPSHOT_FORMAT or not os.path.exists(snapshot_path):
+        return None
+    return _frames_from_snapshot(snapshot_path, manifest)[0]
+
+
+def load_call_entries(file_path, sheet_names=None, cache_dir=CACHE_DIR, reader=read_call_entries):
+    """Load the agent sheets through the on-disk snapshot cache.
+
+    The snapshot is reused while the workbook's size and mtime are unchanged, or
+    when they changed but the content hash did not (e.g. the file was touched).
+    Anything else falls back to ``reader`` and refreshes the snapshot. With
+    ``sheet_names`` None the agent sheets are discovered from the workbook; a
+    snapshot remembers the ones it found.
+    """
+    if sheet_names is not None:
+        sheet_names = list(sheet_names)
+    stat = os.stat(file_path)
+    manifest_path, snapshot_path = _snapshot_paths(cache_dir, file_path)
+    manifest = _read_manifest(manifest_path) if pa is not None else None
+
+    digest = None
+    if (manifest
+            and manifest.get('format') == SNAPSHOT_FORMAT
+            and (manifest.get('discovered') if sheet_names is None
+                 else manifest.get('sheet_names') == sheet_names)
+            and os.path.exists(snapshot_path)):
+        fresh = manifest['size'] == stat.st_size and manifest['mtime_ns'] == stat.st_mtime_ns
+        if not fresh and manifest['size'] == stat.st_size:
+            digest = file_digest(file_path)
+            fresh = manifest['sha256'] == digest
+            if fresh:
+                # Same content under a new mtime; remember it so the next start skips hashing
+                manifest['mtime_ns'] = stat.st_mtime_ns
+                _write_manifest(manifest_path, manifest)
+        if fresh:
+            category_data, consolidated_data = _frames_from_snapshot(snapshot_path, manifest)
+            cache_stats['hits'] += 1
+            logger.info("Ingest cache hit for '%s' (%d rows)", file_path, len(consolidated_data))
+            return category_data, consolidated_data
+
+    cache_stats['misses'] += 1
+    logger.info("Ingest cache miss for '%s', parsing workbook", file_path)
+    # Hash before parsing so an edit made while we read is caught on the next start
+    digest = digest or (file_digest(file_path) if pa is not None else None)
+    category_data, consolidated_data = reader(file_path, sheet_names)
+
+    if pa is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_snapshot(snapshot_path, consolidated_data)
+        _write_manifest(manifest_path, {
+            'format': SNAPSHOT_FORMAT,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': digest,
+            'sheet_names': list(category_data),
+            'discovered': sheet_names is None,
+            'sheets': [[name, len(df), [str(c) for c in df.columns]] for name, df in category_data.items()],
+        })
+    return category_data, consolidated_data
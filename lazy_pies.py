@@ -0,0 +1,56 @@
+from dash import dcc, html
+from dash.exceptions import PreventUpdate
+
+# Pattern-matching id type of the per-agent pie charts
+PIE_TYPE = 'sheet-pie'
+
+# Pies drawn before the browser has reported which ones are on screen
+INITIAL_VISIBLE_PIES = 4
+
+# Height reserved for a pie that has not been drawn yet (dcc.Graph's default)
+PIE_HEIGHT = '450px'
+
+
+def pie_id(sheet_name):
+    return {'type': PIE_TYPE, 'sheet': sheet_name}
+
+
+def pie_slots(sheet_names):
+    """One placeholder per agent pie, watched by assets/lazy_pies.js.
+
+    The graphs start without a figure, so the layout stays small however many
+    agents there are; a pie gets its figure once its slot scrolls into view.
+    """
+    return [
+        html.Div(
+            dcc.Graph(id=pie_id(sheet_name), config={'displayModeBar': False}),
+            className='pie-slot',
+            style={'minHeight': PIE_HEIGHT},
+            **{'data-sheet': sheet_name}
+        )
+        for sheet_name in sheet_names
+    ]
+
+
+def pie_stores(sheet_names):
+    # 'pie-visibility' holds the sheets of the slots on screen, kept up to date
+    # by the browser; 'pie-rendered' records which pies have been drawn
+    return [
+        dcc.Store(id='pie-visibility', data=list(sheet_names)[:INITIAL_VISIBLE_PIES]),
+        dcc.Store(id='pie-rendered'),
+    ]
+
+
+def sheets_to_render(key, visible_sheets, rendered):
+    """Sheets whose pie needs a figure, and the new value of 'pie-rendered'.
+
+    ``key`` identifies what the pies show (the days, plus the dataset version
+    where the data changes). When it differs from the key the pies were drawn
+    for, every visible pie is drawn again; otherwise only the ones that just
+    came into view. Raises PreventUpdate when there is nothing to draw.
+    """
+    drawn = rendered['sheets'] if rendered and rendered['key'] == key else []
+    render = [sheet_name for sheet_name in visible_sheets or [] if sheet_name not in drawn]
+    if not render:
+        raise PreventUpdate
+    return set(render), {'key': key, 'sheets': drawn + render}
@@ -0,0 +1,355 @@
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from dash.exceptions import PreventUpdate
+from flask import Response, g, has_request_context
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets for callback wall time, response size and filtered rows
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+ROWS_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+# Where a callback's time goes; whatever the phases do not cover is 'other'
+PHASES = ('pandas', 'sqlite', 'plotly', 'serialize')
+
+# Set PROFILE_SLOW_MS to sample the stack of every callback and keep the
+# profile of those slower than that many milliseconds in PROFILE_DIR
+PROFILE_SLOW_MS = os.environ.get('PROFILE_SLOW_MS')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = 0.005
+
+# The invocation running on this thread, so phase() and record_rows() can be
+# called from helpers without passing it around
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram over fixed bucket bounds."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{_labels({**labels, "le": _number(bound)})} {cumulative}'
+        yield f'{name}_sum{_labels(labels)} {_number(float(self.sum))}'
+        yield f'{name}_count{_labels(labels)} {self.count}'
+
+
+class StackSampler:
+    """Sampling profiler for one thread.
+
+    A timer thread records the target thread's Python stack every ``interval``
+    seconds. ``folded()`` returns the samples in the collapsed-stack format
+    read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class _Invocation:
+    def __init__(self, metrics, callback):
+        self.metrics = metrics
+        self.callback = callback
+        self.start = time.perf_counter()
+        self.returned = None
+        self.phases = Counter()
+        self.current_phase = None
+        self.rows = None
+        self.sampler = None
+
+
+@contextmanager
+def phase(name):
+    """Charge the time spent in the block to ``name`` in the running callback.
+
+    Outside an instrumented callback this does nothing. Time spent in a phase
+    nested inside another is charged to the inner one only.
+    """
+    invocation = getattr(_local, 'invocation', None)
+    if invocation is None:
+        yield
+        return
+    outer, invocation.current_phase = invocation.current_phase, name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        invocation.current_phase = outer
+        invocation.phases[name] += elapsed
+        if outer is not None:
+            invocation.phases[outer] -= elapsed
+
+
+def record_rows(rows):
+    # Number of rows the running callback selected from the dataset
+    invocation = getattr(_local, 'invocation', None)
+    if invocation is not None:
+        invocation.rows = (invocation.rows or 0) + rows
+
+
+class Metrics:
+    """Hot-path metrics for the dashboard callbacks, served in Prometheus text format.
+
+    Each instrumented callback records its wall time, the part of it spent in
+    pandas, plotly and serialization, the size of its response (as encoded and
+    as sent, after compression) and the rows it selected. ``install`` adds the
+    ``/metrics`` route, which also reports the ingest timings and the size of
+    the current dataset. Every process keeps its own numbers, so under
+    gunicorn each worker is scraped separately.
+    """
+
+    def __init__(self, profile_slow_ms=PROFILE_SLOW_MS, profile_dir=PROFILE_DIR):
+        self.profile_slow = float(profile_slow_ms) / 1000 if profile_slow_ms else None
+        self.profile_dir = profile_dir
+        self.calls = Counter()
+        self.errors = Counter()
+        self.slow_profiles = Counter()
+        self.phase_seconds = Counter()
+        self.seconds = {}
+        self.payload_bytes = {}
+        self.wire_bytes = {}
+        self.rows = {}
+        self.ingests = Counter()
+        self.ingest_seconds_total = Counter()
+        self.last_ingest_seconds = {}
+        self._dataset_size = (None, None)
+        self._lock = threading.Lock()
+
+    def instrument(self, callback):
+        """Decorator recording every call of the decorated Dash callback under ``callback``."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                invocation = _Invocation(self, callback)
+                if self.profile_slow is not None:
+                    invocation.sampler = StackSampler(threading.get_ident())
+                    invocation.sampler.start()
+                _local.invocation = invocation
+                try:
+                    result = func(*args, **kwargs)
+                except PreventUpdate:
+                    self._finish(invocation)
+                    raise
+                except Exception:
+                    self._finish(invocation, error=True)
+                    raise
+                invocation.returned = time.perf_counter()
+                # Inside a request the response is still to be encoded; the
+                # after_request hook finishes the record once it has been
+                if not has_request_context():
+                    self._finish(invocation)
+                return result
+            return wrapper
+        return decorator
+
+    def _finish(self, invocation, payload_bytes=None, wire_bytes=None, error=False):
+        _local.invocation = None
+        end = time.perf_counter()
+        if invocation.returned is not None and payload_bytes is not None:
+            # Dash encodes the return value to JSON after the callback returns
+            invocation.phases['serialize'] += end - invocation.returned
+        wall = end - invocation.start
+        if invocation.sampler is not None:
+            invocation.sampler.stop()
+
+        callback = invocation.callback
+        with self._lock:
+            self.calls[callback] += 1
+            if error:
+                self.errors[callback] += 1
+            self.seconds.setdefault(callback, Histogram(SECONDS_BUCKETS)).observe(wall)
+            for name, seconds in invocation.phases.items():
+                self.phase_seconds[callback, name] += seconds
+            self.phase_seconds[callback, 'other'] += max(0.0, wall - sum(invocation.phases.values()))
+            if payload_bytes is not None:
+                self.payload_bytes.setdefault(callback, Histogram(BYTES_BUCKETS)).observe(payload_bytes)
+            if wire_bytes is not None:
+                self.wire_bytes.setdefault(callback, Histogram(BYTES_BUCKETS)).observe(wire_bytes)
+            if invocation.rows is not None:
+                self.rows.setdefault(callback, Histogram(ROWS_BUCKETS)).observe(invocation.rows)
+
+        if invocation.sampler is not None and wall >= self.profile_slow:
+            self._write_profile(invocation, wall)
+
+    def _write_profile(self, invocation, wall):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir,
+                            f'{invocation.callback}-{int(time.time() * 1000)}-{os.getpid()}.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(invocation.sampler.folded())
+        with self._lock:
+            self.slow_profiles[invocation.callback] += 1
+        logger.warning("Slow callback %s took %.0f ms, profile written to %s", invocation.callback, wall * 1000, path)
+
+    def observe_ingest(self, seconds, source='load'):
+        with self._lock:
+            self.ingests[source] += 1
+            self.ingest_seconds_total[source] += seconds
+            self.last_ingest_seconds[source] = seconds
+
+    @contextmanager
+    def ingest(self, source='load'):
+        # Time a load or refresh of the data
+        start = time.perf_counter()
+        yield
+        self.observe_ingest(time.perf_counter() - start, source)
+
+    def _dataset_lines(self, dataset):
+        if dataset is None:
+            yield from self._gauge('dashboard_dataset_ready', 'Whether a dataset is loaded', [({}, 0)])
+            return
+        # Measuring the dataset can be slow, so do it once per version. Two
+        # scrapes racing on a new version both measure it, which is harmless
+        version, size = self._dataset_size
+        if version != dataset.version:
+            size = dataset.describe()
+            self._dataset_size = (dataset.version, size)
+        yield from self._gauge('dashboard_dataset_ready', 'Whether a dataset is loaded', [({}, 1)])
+        yield from self._gauge('dashboard_dataset_version', 'Version of the dataset being served',
+                               [({}, dataset.version)])
+        yield from self._gauge('dashboard_dataset_rows', 'Call entries in the dataset',
+                               [({}, size['rows'])])
+        yield from self._gauge('dashboard_dataset_sheets', 'Agent sheets in the dataset',
+                               [({}, size['sheets'])])
+        yield from self._gauge('dashboard_dataset_categories', 'Distinct categories in the dataset',
+                               [({}, size['categories'])])
+        yield from self._gauge('dashboard_dataset_bytes',
+                               'Memory held by the consolidated frame, or the size of the SQLite store',
+                               [({}, size['bytes'])])
+
+    @staticmethod
+    def _header(name, help_text, kind):
+        yield f'# HELP {name} {help_text}'
+        yield f'# TYPE {name} {kind}'
+
+    def _gauge(self, name, help_text, samples, kind='gauge'):
+        yield from self._header(name, help_text, kind)
+        for labels, value in samples:
+            yield f'{name}{_labels(labels)} {_number(value)}'
+
+    def _histograms(self, name, help_text, histograms):
+        yield from self._header(name, help_text, 'histogram')
+        for callback, histogram in sorted(histograms.items()):
+            yield from histogram.samples(name, {'callback': callback})
+
+    def render(self, dataset=None, figure_cache=None):
+        """Prometheus text exposition of everything recorded so far."""
+        with self._lock:
+            lines = [
+                *self._gauge('dashboard_callback_calls_total', 'Callback invocations',
+                             [({'callback': c}, n) for c, n in sorted(self.calls.items())], 'counter'),
+                *self._gauge('dashboard_callback_errors_total', 'Callback invocations that raised',
+                             [({'callback': c}, n) for c, n in sorted(self.errors.items())], 'counter'),
+                *self._histograms('dashboard_callback_seconds', 'Callback wall time, response encoding included',
+                                  self.seconds),
+                *self._gauge('dashboard_callback_phase_seconds_total',
+                             'Callback time spent in pandas, plotly, serialization and elsewhere',
+                             [({'callback': c, 'phase': p}, s) for (c, p), s in sorted(self.phase_seconds.items())],
+                             'counter'),
+                *self._histograms('dashboard_callback_response_bytes', 'Size of the encoded callback response',
+                                  self.payload_bytes),
+                *self._histograms('dashboard_callback_wire_bytes',
+                                  'Size of the callback response as sent, after any compression',
+                                  self.wire_bytes),
+                *self._histograms('dashboard_callback_rows', 'Rows selected from the dataset by a callback',
+                                  self.rows),
+                *self._gauge('dashboard_slow_callback_profiles_total', 'Profiles written for slow callbacks',
+                             [({'callback': c}, n) for c, n in sorted(self.slow_profiles.items())], 'counter'),
+                *self._gauge('dashboard_ingests_total', 'Data loads and refreshes',
+                             [({'source': s}, n) for s, n in sorted(self.ingests.items())], 'counter'),
+                *self._gauge('dashboard_ingest_seconds_total', 'Time spent loading and refreshing data',
+                             [({'source': s}, t) for s, t in sorted(self.ingest_seconds_total.items())], 'counter'),
+                *self._gauge('dashboard_last_ingest_seconds', 'Duration of the latest load or refresh',
+                             [({'source': s}, t) for s, t in sorted(self.last_ingest_seconds.items())]),
+            ]
+        # Outside the lock: measuring a new dataset version can take a while,
+        # and callbacks finishing meanwhile must not wait for it
+        lines.extend(self._dataset_lines(dataset))
+        if figure_cache is not None:
+            stats = figure_cache.stats()
+            for key in ('hits', 'misses', 'evictions', 'invalidations'):
+                lines.extend(self._gauge(f'dashboard_figure_cache_{key}_total', f'Figure cache {key}',
+                                         [({}, stats[key])], 'counter'))
+            lines.extend(self._gauge('dashboard_figure_cache_size', 'Figures held in the cache',
+                                     [({}, stats['size'])]))
+        return '\n'.join(lines) + '\n'
+
+    def install(self, server, dataset_holder=None, figure_cache=None):
+        """Finish callback records after each response and serve ``/metrics`` on ``server``."""
+        @server.after_request
+        def record_callback_response(response):
+            invocation = getattr(_local, 'invocation', None)
+            if invocation is not None and invocation.metrics is self:
+                # compression.install_compression notes the size it compressed from
+                wire_bytes = response.calculate_content_length() or 0
+                self._finish(invocation, payload_bytes=g.get('uncompressed_bytes', wire_bytes),
+                             wire_bytes=wire_bytes)
+            return response
+
+        @server.route('/metrics')
+        def metrics():
+            dataset = dataset_holder.get() if dataset_holder is not None else None
+            return Response(self.render(dataset, figure_cache), mimetype='text/plain; version=0.0.4')
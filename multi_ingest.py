@@ -0,0 +1,107 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from excel_loader import SHEET_COLUMN, compact_call_entries
+from ingest_cache import CACHE_DIR, arrow_safe, load_call_entries
+
+try:
+    import pyarrow as pa
+except ImportError:  # Without pyarrow the workers send back pickled frames
+    pa = None
+
+# Column of the merged frames naming the workbook each row came from
+WORKBOOK_COLUMN = 'Workbook'
+
+
+def is_workbook_set(path):
+    # A directory or a glob pattern rather than the path of one workbook
+    return os.path.isdir(path) or any(char in path for char in '*?[')
+
+
+def workbook_paths(path):
+    """The workbooks a path names: every .xlsx file of a directory, the matches
+    of a glob pattern, or the path itself. Excel's ``~$`` lock files are left out.
+    """
+    if os.path.isdir(path):
+        paths = glob.glob(os.path.join(path, '*.xlsx'))
+    elif is_workbook_set(path):
+        paths = glob.glob(path)
+    else:
+        paths = [path]
+    return sorted(p for p in paths if not os.path.basename(p).startswith('~$'))
+
+
+def _to_ipc(consolidated_data):
+    # The frame as an Arrow IPC stream: typed columns, categoricals as dictionaries
+    try:
+        table = pa.Table.from_pandas(consolidated_data, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        table = pa.Table.from_pandas(arrow_safe(consolidated_data), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _read_workbook(task):
+    # Runs in a worker: parse one workbook (through its snapshot) and send the
+    # consolidated frame back in columnar form, with each sheet's row count
+    path, sheet_names, cache_dir = task
+    category_data, consolidated_data = load_call_entries(path, sheet_names, cache_dir)
+    sheets = [(sheet_name, len(df)) for sheet_name, df in category_data.items()]
+    if pa is None:
+        return sheets, consolidated_data
+    return sheets, _to_ipc(consolidated_data.rename(columns=str))
+
+
+def _from_ipc(payload):
+    if pa is None:
+        return payload
+    return pa.ipc.open_stream(payload).read_all().to_pandas()
+
+
+def _labels(paths):
+    # Short names for the workbooks: their file names, unless two share one
+    names = [os.path.basename(path) for path in paths]
+    return names if len(set(names)) == len(names) else [os.path.normpath(path) for path in paths]
+
+
+def load_workbooks(path, sheet_names=None, cache_dir=CACHE_DIR, workers=None):
+    """Load the agent sheets of every workbook ``path`` names (see workbook_paths).
+
+    The workbooks are parsed in parallel by ``workers`` processes (one per CPU
+    when None), each through its own snapshot in ``cache_dir``. Workers send
+    their rows back as Arrow IPC streams rather than pickled frames. Sheets of
+    the same name are merged across workbooks, and a ``Workbook`` column tells
+    which file each row came from.
+
+    Returns the per-sheet frames and the consolidated frame, compacted by
+    excel_loader.compact_call_entries.
+    """
+    paths = workbook_paths(path)
+    if not paths:
+        raise FileNotFoundError(f"No workbooks found at '{path}'")
+    tasks = [(workbook, sheet_names, cache_dir) for workbook in paths]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        results = [_read_workbook(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_read_workbook, tasks))
+
+    labels = _labels(paths)
+    frames = {}
+    for i, (sheets, payload) in enumerate(results):
+        consolidated_data = _from_ipc(payload).drop(columns=SHEET_COLUMN)
+        consolidated_data[WORKBOOK_COLUMN] = pd.Categorical.from_codes(
+            np.full(len(consolidated_data), i), categories=labels)
+        start = 0
+        for sheet_name, n_rows in sheets:
+            frames.setdefault(sheet_name, []).append(consolidated_data.iloc[start:start + n_rows])
+            start += n_rows
+    return compact_call_entries({sheet_name: pd.concat(sheet_frames, ignore_index=True)
+                                 for sheet_name, sheet_frames in frames.items()})
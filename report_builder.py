@@ -0,0 +1,218 @@
+# Batch Excel reports of the call entries, one workbook per date range:
+#
+#     python report_builder.py 'Call Entries updated.xlsx' --period month --output-dir reports
+#     python report_builder.py 'Call Entries updated.xlsx' --range 2024-01-01:2024-03-31 --range 2024-04-01:
+#
+# Each report has a Totals sheet (category counts per agent), a daily category
+# pivot per agent and the raw entries of each category.
+import argparse
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from count_cube import to_day
+from dataset import Dataset
+from ingest_cache import CACHE_DIR, load_call_entries
+from table_export import xlsx_value
+
+# Excel sheet names are at most 31 characters, without any of []:*?/\
+SHEET_NAME_LENGTH = 31
+SHEET_NAME_FORBIDDEN = re.compile(r'[\[\]:*?/\\]')
+
+# Rows fetched and written at a time for the raw entry sheets
+ENTRY_CHUNK_ROWS = 10000
+
+# Calendar periods --period splits the history into
+PERIODS = {'week': 'W', 'month': 'M'}
+
+HEADER_FONT = Font(bold=True)
+COLUMN_WIDTH = 16
+
+# The dataset of a worker process, set once by the pool initializer
+_dataset = None
+
+
+def parse_range(text):
+    # 'START:END' -> (start, end) days; either side may be left empty for an open end
+    start, sep, end = text.partition(':')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected START:END, got '{text}'")
+    days = (to_day(start) if start else None, to_day(end) if end else None)
+    if (start and days[0] is None) or (end and days[1] is None):
+        raise argparse.ArgumentTypeError(f"not a date range: '{text}'")
+    return days
+
+
+def period_ranges(first, last, period):
+    # (start, end) of each calendar week or month from ``first`` to ``last``
+    if pd.isna(first) or pd.isna(last):
+        return []
+    return [(p.start_time.normalize(), p.end_time.normalize())
+            for p in pd.period_range(first, last, freq=PERIODS[period])]
+
+
+def report_path(output_dir, start, end):
+    first, last = ('all' if day is None else day.strftime('%Y-%m-%d') for day in (start, end))
+    return os.path.join(output_dir, f'call-report-{first}-to-{last}.xlsx')
+
+
+def _sheet_title(name, used):
+    # A valid sheet name for ``name``, unique among ``used`` (which it is added to)
+    base = SHEET_NAME_FORBIDDEN.sub('_', str(name)).strip("'") or 'Sheet'
+    title = base[:SHEET_NAME_LENGTH]
+    n = 1
+    while title.lower() in used:
+        n += 1
+        suffix = f' ({n})'
+        title = base[:SHEET_NAME_LENGTH - len(suffix)] + suffix
+    used.add(title.lower())
+    return title
+
+
+def _new_sheet(workbook, title, header):
+    # Write-only sheet with a bold, frozen header row
+    worksheet = workbook.create_sheet(title)
+    worksheet.freeze_panes = 'A2'
+    for i in range(len(header)):
+        worksheet.column_dimensions[get_column_letter(i + 1)].width = COLUMN_WIDTH
+    cells = []
+    for name in header:
+        cell = WriteOnlyCell(worksheet, value=xlsx_value(name))
+        cell.font = HEADER_FONT
+        cells.append(cell)
+    worksheet.append(cells)
+    return worksheet
+
+
+def _total_row(worksheet, values):
+    cells = []
+    for value in ['Total'] + values:
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.font = HEADER_FONT
+        cells.append(cell)
+    worksheet.append(cells)
+
+
+def _write_totals(workbook, dataset, start, end, present, used):
+    # Category counts of the range per agent and over all agents
+    count_cube = dataset.count_cube
+    worksheet = _new_sheet(workbook, _sheet_title('Totals', used), ['Category'] + dataset.sheets + ['Total'])
+    per_sheet = [count_cube.sheet_range_counts(sheet_name, start, end)[present] for sheet_name in dataset.sheets]
+    totals = count_cube.consolidated_range_counts(start, end)[present]
+    for i, category in enumerate(count_cube.categories[present]):
+        worksheet.append([xlsx_value(category)] + [int(counts[i]) for counts in per_sheet] + [int(totals[i])])
+    _total_row(worksheet, [int(counts.sum()) for counts in per_sheet] + [int(totals.sum())])
+
+
+def _write_agent_pivot(workbook, dataset, sheet_name, start, end, present, used):
+    # One row per day the agent logged calls on, one column per category
+    count_cube = dataset.count_cube
+    categories = [xlsx_value(category) for category in count_cube.categories[present]]
+    worksheet = _new_sheet(workbook, _sheet_title(sheet_name, used), ['Date'] + categories + ['Total'])
+    lo, hi = count_cube.day_span(start, end)
+    days = count_cube.counts[dataset.sheets.index(sheet_name), lo:hi][:, present]
+    for day, counts in zip(count_cube.days[lo:hi], days):
+        total = int(counts.sum())
+        if total:
+            worksheet.append([day.date()] + counts.tolist() + [total])
+    _total_row(worksheet, days.sum(axis=0).tolist() + [int(days.sum())])
+
+
+def _write_entries(workbook, dataset, category, start, end, used):
+    # Every row of ``category`` in the range, agent by agent, streamed a chunk at a time
+    columns = [column for column in dataset.table_columns() if column != 'Category']
+    position = [dataset.table_columns().index(column) for column in columns]
+    worksheet = _new_sheet(workbook, _sheet_title(f'Entries - {category}', used), ['Agent'] + columns)
+    n_rows = 0
+    for sheet_name in dataset.sheets:
+        for rows in dataset.export_rows(start, end, category, sheet_name=sheet_name, chunk_rows=ENTRY_CHUNK_ROWS):
+            for row in rows:
+                worksheet.append([xlsx_value(sheet_name)] + [xlsx_value(row[i]) for i in position])
+            n_rows += len(rows)
+    return n_rows
+
+
+def write_report(dataset, start, end, path):
+    """Write the report for the days from ``start`` to ``end`` to ``path``.
+
+    The workbook is written in openpyxl's write-only mode, which streams rows
+    to disk as they are appended, so memory use does not grow with the number
+    of entries. Returns the number of raw entries written.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    used = set()
+    # Only the categories with calls in the range get columns and entry sheets
+    present = dataset.count_cube.consolidated_range_counts(start, end) > 0
+    _write_totals(workbook, dataset, start, end, present, used)
+    for sheet_name in dataset.sheets:
+        _write_agent_pivot(workbook, dataset, sheet_name, start, end, present, used)
+    n_rows = sum(_write_entries(workbook, dataset, category, start, end, used)
+                 for category in dataset.count_cube.categories[present])
+    workbook.save(path)
+    return n_rows
+
+
+def _init_worker(dataset):
+    global _dataset
+    _dataset = dataset
+
+
+def _build_report(task):
+    start, end, path = task
+    return path, write_report(_dataset, start, end, path)
+
+
+def build_reports(dataset, ranges, output_dir, workers=None):
+    """Write one report per (start, end) in ``ranges`` to ``output_dir``.
+
+    The reports are written in parallel by a pool of ``workers`` processes
+    (one per CPU when None). Each worker gets the dataset once when it starts;
+    where processes are forked it is shared with the parent, not copied.
+    Returns (path, raw entries) per report, in ``ranges`` order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(start, end, report_path(output_dir, start, end)) for start, end in ranges]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        _init_worker(dataset)
+        return [_build_report(task) for task in tasks]
+    start_methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in start_methods else None)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(dataset,)) as pool:
+        return list(pool.map(_build_report, tasks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write formatted Excel reports of the call entries.')
+    parser.add_argument('workbook', nargs='?', default='Call Entries updated.xlsx')
+    parser.add_argument('--sheets', nargs='*', help='agent sheets to report on (default: every agent sheet)')
+    parser.add_argument('--range', dest='ranges', action='append', type=parse_range, default=[],
+                        metavar='START:END', help='days to report on, both included; may be repeated')
+    parser.add_argument('--period', choices=PERIODS, help='also write one report per calendar week or month')
+    parser.add_argument('--output-dir', default='reports')
+    parser.add_argument('--workers', type=int, help='report-writing processes (default: one per CPU)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    args = parser.parse_args(argv)
+
+    category_data, consolidated_data = load_call_entries(args.workbook, args.sheets, args.cache_dir)
+    dataset = Dataset(category_data, consolidated_data=consolidated_data)
+    ranges = list(args.ranges)
+    if args.period:
+        ranges += period_ranges(*dataset.date_bounds(), args.period)
+    if not ranges:
+        ranges = [(None, None)]  # The whole history
+
+    for path, n_rows in build_reports(dataset, ranges, args.output_dir, args.workers):
+        print(f"Wrote '{path}' ({n_rows} entries)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+from count_cube import to_day
+from excel_loader import SHEET_COLUMN
+
+
+class RowIndex:
+    """Where the rows of each (sheet, day, category) are in the consolidated frame.
+
+    compact_call_entries orders the rows by sheet, day and category code, so
+    the rows of one (sheet, day, category) are a contiguous run. The runs are
+    laid out in that order over a ``(sheets, days + 1, categories + 1)`` grid,
+    whose last day slot holds a sheet's undated rows and whose last category
+    slot holds a day's rows without a category. ``bounds[i]`` is where run
+    ``i`` of the flattened grid starts and ``bounds[i + 1]`` where it ends.
+
+    A drill-down to one day and category is then a single positional slice,
+    and one over a range of days a few such slices, whatever the size of the
+    frame. The grid has the size of the count cube's, not of the data.
+    """
+
+    def __init__(self, sheets, days, categories, bounds):
+        self.sheets = list(sheets)
+        self.days = pd.DatetimeIndex(days)
+        self.categories = pd.Index(categories)
+        self.bounds = bounds
+        self._sheet_pos = {sheet: i for i, sheet in enumerate(self.sheets)}
+        self._shape = (len(self.sheets), len(self.days) + 1, len(self.categories) + 1)
+
+    @classmethod
+    def from_frame(cls, consolidated_data):
+        sheets = consolidated_data[SHEET_COLUMN].cat.categories
+        categories = consolidated_data['Category'].cat.categories
+        dates = consolidated_data['Date']
+        days = pd.DatetimeIndex(dates.dropna().unique()).sort_values()
+
+        day_codes = days.get_indexer(dates)
+        day_codes[day_codes < 0] = len(days)
+        category_codes = consolidated_data['Category'].cat.codes.to_numpy().astype(np.intp)
+        category_codes[category_codes < 0] = len(categories)
+        shape = (len(sheets), len(days) + 1, len(categories) + 1)
+        flat = np.ravel_multi_index(
+            (consolidated_data[SHEET_COLUMN].cat.codes.to_numpy().astype(np.intp), day_codes, category_codes), shape)
+        counts = np.bincount(flat, minlength=int(np.prod(shape)))
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        return cls(sheets, days, categories, bounds)
+
+    def _day_range(self, start, end):
+        # Day slots [lo, hi) of the days from ``start`` to ``end``
+        lo = 0 if start is None else int(self.days.searchsorted(to_day(start), side='left'))
+        hi = len(self.days) if end is None else int(self.days.searchsorted(to_day(end), side='right'))
+        return lo, max(lo, hi)
+
+    def _sheet_codes(self, sheet_name):
+        return np.arange(len(self.sheets)) if sheet_name is None else np.array([self._sheet_pos[sheet_name]])
+
+    def spans(self, start, end, category, sheet_name=None):
+        """Runs ``(lo, hi)`` of the rows with ``category`` dated from ``start``
+        to ``end`` (None leaves that end open), of one sheet or of all.
+
+        Returns two arrays of frame positions, in frame order, without empty runs.
+        """
+        empty = np.zeros(0, dtype=np.intp)
+        try:
+            category = self.categories.get_loc(category)
+        except KeyError:
+            return empty, empty
+        lo, hi = self._day_range(start, end)
+        sheets = self._sheet_codes(sheet_name)
+        runs = ((sheets[:, None] * self._shape[1] + np.arange(lo, hi)) * self._shape[2] + category).ravel()
+        starts, ends = self.bounds[runs], self.bounds[runs + 1]
+        present = ends > starts
+        return starts[present], ends[present]
+
+    def day_spans(self, start, end, sheet_name=None):
+        # Runs (lo, hi) of the rows of any category dated from ``start`` to
+        # ``end``: one per sheet, as a sheet's rows are in day order
+        lo, hi = self._day_range(start, end)
+        sheets = self._sheet_codes(sheet_name)
+        starts = self.bounds[(sheets * self._shape[1] + lo) * self._shape[2]]
+        ends = self.bounds[(sheets * self._shape[1] + hi) * self._shape[2]]
+        present = ends > starts
+        return starts[present], ends[present]
+
+    def runs(self, start, end, category=None, sheet_name=None):
+        """Every non-empty run of the rows dated from ``start`` to ``end`` with
+        ``category`` (any, or none, when None), of one sheet or of all, in
+        frame order.
+
+        Returns the runs' starts and ends, and each run's sheet code, day and
+        position in ``categories`` (-1 for the rows without a category), so
+        that runs of several indexes can be put in one order.
+        """
+        if category is None:
+            slots = np.arange(self._shape[2])
+        elif category in self.categories:
+            slots = np.array([self.categories.get_loc(category)])
+        else:
+            slots = np.zeros(0, dtype=np.intp)
+        lo, hi = self._day_range(start, end)
+        sheets, days, slots = (grid.ravel() for grid in np.meshgrid(
+            self._sheet_codes(sheet_name), np.arange(lo, hi), slots, indexing='ij'))
+        runs = (sheets * self._shape[1] + days) * self._shape[2] + slots
+        starts, ends = self.bounds[runs], self.bounds[runs + 1]
+        present = ends > starts
+        slots = slots[present]
+        slots[slots == len(self.categories)] = -1
+        return starts[present], ends[present], sheets[present], self.days[days[present]], slots
+
+    def sheet_lengths(self):
+        # Rows of each sheet
+        return np.diff(self.bounds[::self._shape[1] * self._shape[2]])
+
+    def insert_positions(self, sheet_codes, days, categories):
+        """Frame positions at which rows of sheets ``sheet_codes`` dated
+        ``days`` (NaT when undated) with ``categories`` (names, missing when
+        none) go to keep the frame in order: after the rows with the same
+        sheet, day and category, and before any later ones.
+
+        The categories need not be known to the index; the categories it
+        knows must be in name order, as compact_call_entries leaves them.
+        """
+        days = pd.DatetimeIndex(days)
+        categories = pd.Series(categories, dtype=object)
+        n_days, n_categories = self._shape[1] - 1, self._shape[2] - 1
+        day_pos = self.days.searchsorted(days)
+        known_day = np.zeros(len(days), dtype=bool)
+        inside = day_pos < n_days
+        known_day[inside] = self.days[day_pos[inside]] == days[inside]
+        # Undated rows go in the undated slot, which every sheet has
+        undated = days.isna()
+        day_pos[undated] = n_days
+        known_day[undated] = True
+        # Category slots up to and including the row's own; a missing category
+        # goes after every slot of its day
+        missing = categories.isna().to_numpy()
+        slots = np.full(len(days), n_categories + 1, dtype=np.intp)
+        if (~missing).any():
+            slots[~missing] = self.categories.searchsorted(categories[~missing].to_numpy(), side='right')
+        # A day without rows yet goes before the first later day
+        slots[~known_day] = 0
+        runs = (np.asarray(sheet_codes, dtype=np.intp) * self._shape[1] + day_pos) * self._shape[2] + slots
+        return self.bounds[runs]
+
+    def with_rows(self, categories, sheet_codes, days, category_codes):
+        """Index of the frame after rows with these sheet codes, days (NaT when
+        undated) and codes into ``categories`` (-1 when none) were inserted at
+        their ``insert_positions``.
+
+        ``categories`` must include the index's own. Only the per-run counts
+        are updated, so the cost depends on the grid and the new rows, not on
+        the rows already indexed.
+        """
+        categories = pd.Index(categories)
+        days = pd.DatetimeIndex(days)
+        all_days = self.days.union(days.dropna().unique())
+        shape = (len(self.sheets), len(all_days) + 1, len(categories) + 1)
+        counts = np.zeros(shape, dtype=self.bounds.dtype)
+        day_map = np.append(all_days.get_indexer(self.days), len(all_days))
+        category_map = np.append(categories.get_indexer(self.categories), len(categories))
+        counts[np.ix_(np.arange(len(self.sheets)), day_map, category_map)] = np.diff(self.bounds).reshape(self._shape)
+
+        day_codes = all_days.get_indexer(days)
+        day_codes[day_codes < 0] = len(all_days)
+        category_codes = np.asarray(category_codes, dtype=np.intp).copy()
+        category_codes[category_codes < 0] = len(categories)
+        flat = np.ravel_multi_index((np.asarray(sheet_codes, dtype=np.intp), day_codes, category_codes), shape)
+        counts = counts.ravel() + np.bincount(flat, minlength=counts.size)
+        return RowIndex(self.sheets, all_days, categories, np.concatenate([[0], np.cumsum(counts)]))
+
+
+def span_positions(starts, ends):
+    # Frame positions covered by the runs [starts[i], ends[i])
+    lengths = ends - starts
+    return np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
@@ -0,0 +1,465 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from count_cube import ROLLUPS, CountCube, to_day
+from excel_loader import SHEET_COLUMN, compact_call_entries
+from metrics import phase, record_rows
+from table_paging import compact_records, filter_mask, split_filter_part
+
+# Set DATASET_STORE to a file path to keep the call entries in a SQLite
+# database there instead of in memory
+DATASET_STORE = os.environ.get('DATASET_STORE')
+
+# Rows converted and inserted per statement batch while writing a version
+INSERT_CHUNK_ROWS = 50000
+
+# Seconds a retired table is kept after its version was replaced, for the
+# callbacks that read the dataset just before the swap and query it after
+RETIRED_TABLE_GRACE = 300
+
+
+def _sql_value(value):
+    # Something sqlite3 can bind; missing values become NULL
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return None if isinstance(value, float) and math.isnan(value) else value
+    if isinstance(value, pd.Timestamp):
+        return None if pd.isna(value) else value.isoformat()
+    if isinstance(value, np.generic):
+        return _sql_value(value.item())
+    return None if pd.isna(value) else str(value)
+
+
+def _day_numbers(dates):
+    # Days since 1970-01-01, None where undated
+    days = dates.to_numpy().astype('datetime64[D]').astype(np.int64).astype(object)
+    days[dates.isna().to_numpy()] = None
+    return days
+
+
+def _day_number(date):
+    day = to_day(date)
+    return None if day is None else int(day.value // 86_400_000_000_000)
+
+
+def _stored_columns(columns):
+    # Table columns kept as they are; Date and Category get their own coded columns
+    return [column for column in columns if column not in ('Date', 'Category')]
+
+
+def _codes(values, names):
+    # Codes of ``values`` in ``names``, appending names not seen before; None where missing
+    positions = {name: i for i, name in enumerate(names)}
+    codes = []
+    for value in values:
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            codes.append(None)
+            continue
+        if value not in positions:
+            positions[value] = len(names)
+            names.append(value)
+        codes.append(positions[value])
+    return codes
+
+
+class SqliteStore:
+    """A SQLite database file holding the call entries of SqliteDatasets.
+
+    Each row is stored normalized: integer codes for its sheet and category,
+    its day as a number, and the other table columns as they are. The file is
+    recreated when the store is opened. Every thread (and every process after
+    a fork) gets its own connection; the database runs in WAL mode, so reads
+    are never blocked by a version being written. The table of a replaced
+    version is dropped on a later retirement, once RETIRED_TABLE_GRACE has
+    passed and no query or export reads it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        self._local = threading.local()
+        self._generation = 0
+        # Retired tables of this process by when they were retired, and the
+        # queries and exports reading each table right now
+        self._retired = {}
+        self._readers = Counter()
+        self._lock = threading.Lock()
+        self.connection().execute('PRAGMA journal_mode=WAL')
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def remove(self):
+        # Delete the database file, for a store private to one process that is
+        # shutting down
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def _new_table(self, stored_columns):
+        # A table for a new generation of rows; the pid keeps the names of
+        # forked workers writing to the same file apart
+        with self._lock:
+            self._generation += 1
+            table = f'entries_{os.getpid()}_{self._generation}'
+        column_defs = ''.join(f', c{i}' for i in range(len(stored_columns)))
+        self.connection().execute(
+            f'CREATE TABLE {table} (sheet INTEGER NOT NULL, date INTEGER, category INTEGER{column_defs})')
+        return table
+
+    def _index(self, table):
+        # Indexes for per-sheet and consolidated range queries; both cover the
+        # category counts, so those never touch the table itself
+        connection = self.connection()
+        connection.execute(f'CREATE INDEX {table}_sheet_date_category ON {table} (sheet, date, category)')
+        connection.execute(f'CREATE INDEX {table}_date_category ON {table} (date, category)')
+        connection.execute(f'ANALYZE {table}')
+
+    def _insert(self, table, consolidated_data, stored_columns, sheets, categories):
+        # Append ``consolidated_data`` to ``table`` in batches; returns the last rowid
+        connection = self.connection()
+        placeholders = ', '.join('?' * (3 + len(stored_columns)))
+        statement = f'INSERT INTO {table} VALUES ({placeholders})'
+        for start in range(0, len(consolidated_data), INSERT_CHUNK_ROWS):
+            chunk = consolidated_data.iloc[start:start + INSERT_CHUNK_ROWS]
+            values = [
+                _codes(chunk[SHEET_COLUMN].astype(object).tolist(), sheets),
+                _day_numbers(chunk['Date']),
+                _codes(chunk['Category'].astype(object).tolist(), categories),
+            ]
+            for column in stored_columns:
+                if column in chunk.columns:
+                    values.append([_sql_value(value) for value in chunk[column].astype(object).tolist()])
+                else:
+                    values.append([None] * len(chunk))
+            connection.executemany(statement, zip(*values))
+        return connection.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0]
+
+    @contextmanager
+    def reading(self, table):
+        # Keep ``table`` from being dropped while a query or export reads it
+        with self._lock:
+            self._readers[table] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._readers[table] -= 1
+                if not self._readers[table]:
+                    del self._readers[table]
+
+    def retire(self, table):
+        # Mark ``table`` for dropping and drop the tables retired before it that
+        # are past their grace and that no query reads, so a slow callback or
+        # export holding an older dataset can finish. Tables written by another
+        # process (the master before a fork) are left alone
+        if not table.startswith(f'entries_{os.getpid()}_'):
+            return
+        with self._lock:
+            self._retired[table] = time.monotonic()
+        self._drop_retired()
+
+    def _drop_retired(self):
+        # Drop the retired tables past their grace that nothing reads
+        now = time.monotonic()
+        with self._lock:
+            expired = [table for table, retired_at in self._retired.items()
+                       if now - retired_at >= RETIRED_TABLE_GRACE and not self._readers[table]]
+            for table in expired:
+                del self._retired[table]
+        if expired:
+            with self.connection() as connection:
+                for table in expired:
+                    connection.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def dataset(self, category_data, consolidated_data, version=0, previous=None):
+        """Write the rows of ``consolidated_data`` as a new SqliteDataset.
+
+        ``previous`` is the SqliteDataset being replaced, if any; its table is
+        retired once the new one is written.
+        """
+        columns = [column for column in consolidated_data.columns if column != SHEET_COLUMN]
+        sheets = list(category_data)
+        categories = []
+        stored_columns = _stored_columns(columns)
+        table = self._new_table(stored_columns)
+        with phase('sqlite'), self.connection():
+            max_row = self._insert(table, consolidated_data, stored_columns, sheets, categories)
+        self._index(table)
+        if previous is not None:
+            self.retire(previous.table)
+        return SqliteDataset(self, table, version, max_row, len(consolidated_data), sheets, categories, columns)
+
+
+class SqliteDataset:
+    """A Dataset whose rows live in a SqliteStore instead of in memory.
+
+    It answers the dashboard's questions (``date_bounds``, ``table_columns``,
+    ``range_counts``, ``category_counts``, ``table_page``, ``export_rows``,
+    ``describe``) with indexed queries, so memory use does not grow with the
+    length of the history. A version sees the rows of its table up to
+    ``max_row``: rows appended for a later version get higher rowids, which
+    keeps published versions unchanged.
+    """
+
+    def __init__(self, store, table, version, max_row, n_rows, sheets, categories, columns):
+        self.store = store
+        self.table = table
+        self.version = version
+        self.max_row = max_row
+        self.n_rows = n_rows
+        self.sheets = list(sheets)
+        self.categories = list(categories)
+        self.columns = list(columns)
+        self._stored_columns = _stored_columns(columns)
+        self._count_cube = None
+        self._rollups = None
+
+    def _query(self, sql, params=()):
+        with phase('sqlite'), self.store.reading(self.table):
+            return self.store.connection().execute(sql, params).fetchall()
+
+    def _range_where(self, start, end, sheet_name):
+        # WHERE clause for this version's rows dated from ``start`` to ``end``
+        where = ['rowid <= ?', 'date IS NOT NULL']
+        params = [self.max_row]
+        if sheet_name is not None:
+            where.append('sheet = ?')
+            params.append(self.sheets.index(sheet_name))
+        if start is not None:
+            where.append('date >= ?')
+            params.append(_day_number(start))
+        if end is not None:
+            where.append('date <= ?')
+            params.append(_day_number(end))
+        return where, params
+
+    def date_bounds(self):
+        # First and last day in the data
+        first, last = self._query(f'SELECT MIN(date), MAX(date) FROM {self.table} WHERE rowid <= ?',
+                                  (self.max_row,))[0]
+        return tuple(pd.NaT if day is None else pd.Timestamp(day, unit='D') for day in (first, last))
+
+    def table_columns(self):
+        # Columns the tables show
+        return list(self.columns)
+
+    def range_counts(self, start=None, end=None, sheet_name=None):
+        # Rows per category (in ``categories`` order) dated from ``start`` to ``end``, of one sheet or of all
+        where, params = self._range_where(start, end, sheet_name)
+        rows = self._query(f'SELECT category, COUNT(*) FROM {self.table} WHERE {" AND ".join(where)} '
+                           f'AND category IS NOT NULL GROUP BY category', params)
+        counts = np.zeros(len(self.categories), dtype=np.int64)
+        for code, count in rows:
+            counts[code] = count
+        return counts
+
+    def category_counts(self, start=None, end=None, sheet_name=None):
+        # Category/Count frame of the rows dated from ``start`` to ``end``, of one sheet or of all
+        counts = self.range_counts(start, end, sheet_name)
+        present = np.flatnonzero(counts)
+        return pd.DataFrame({'Category': [self.categories[code] for code in present], 'Count': counts[present]})
+
+    def _column_sql(self, name):
+        if name in ('Date', 'Category'):
+            return name.lower()
+        return f'c{self._stored_columns.index(name)}'
+
+    def _filter_sql(self, name, operator, value):
+        # One DataTable filter term as SQL, with the semantics of table_paging.filter_frame
+        if name == 'Category':
+            # Few categories: match their names with pandas and filter on the
+            # codes; the extra None stands for rows without a category
+            names = pd.Series(pd.Categorical(self.categories + [None], categories=self.categories))
+            mask = filter_mask(names, operator, value).to_numpy()
+            codes = ', '.join(str(code) for code in np.flatnonzero(mask[:-1]))
+            return f'(category IN ({codes}){" OR category IS NULL" if mask[-1] else ""})', []
+        column = self._column_sql(name)
+        if name == 'Date':
+            text = "date(date * 86400, 'unixepoch')"
+            if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+                day = _day_number(value) if isinstance(value, str) else None
+                if day is None:
+                    return '0', []
+                column, value = 'date', day
+        else:
+            text = f'CAST({column} AS TEXT)'
+        if operator == 'contains':
+            return f'instr({text}, ?) > 0', [str(value)]
+        if operator == 'datestartswith':
+            return f'substr({text}, 1, ?) = ?', [len(str(value)), str(value)]
+        sql_operator = {'eq': '=', 'ne': 'IS NOT', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}[operator]
+        if name != 'Date':
+            # A number never matches text and the other way round, as in pandas
+            types = "('integer', 'real')" if isinstance(value, float) else "('text')"
+            if operator == 'ne':
+                return f'({column} IS NULL OR typeof({column}) NOT IN {types} OR {column} != ?)', [value]
+            return f'(typeof({column}) IN {types} AND {column} {sql_operator} ?)', [value]
+        return f'{column} {sql_operator} ?', [value]
+
+    def _category_rank_sql(self, direction='ASC'):
+        # Categories in name order, as in the in-memory frames' categoricals;
+        # the codes here are in order of first appearance
+        ranks = {code: rank for rank, code in enumerate(np.argsort(np.array(self.categories, dtype=str)))}
+        if not ranks:
+            return ['category IS NULL']
+        cases = ' '.join(f'WHEN {code} THEN {rank}' for code, rank in ranks.items())
+        return ['category IS NULL', f'CASE category {cases} END {direction}']
+
+    def _order_sql(self, sort_by):
+        # ORDER BY for a DataTable sort_by, missing values last and ties in
+        # sheet, day and category order, as the in-memory frames are
+        order = []
+        for col in sort_by or []:
+            name = col['column_id']
+            if name not in self.columns:
+                continue
+            direction = 'ASC' if col['direction'] == 'asc' else 'DESC'
+            if name == 'Category':
+                order += self._category_rank_sql(direction)
+            else:
+                column = self._column_sql(name)
+                order += [f'{column} IS NULL', f'{column} {direction}']
+        return ', '.join(order + ['sheet', 'date'] + self._category_rank_sql() + ['rowid'])
+
+    def _selection_where(self, start, end, category, filter_query, sheet_name):
+        # WHERE clause and parameters for the rows a table request selects
+        where, params = self._range_where(start, end, sheet_name)
+        if category is not None:
+            where.append('category = ?')
+            params.append(self.categories.index(category) if category in self.categories else -1)
+        for filter_part in (filter_query.split(' && ') if filter_query else []):
+            name, operator, value = split_filter_part(filter_part)
+            if name not in self.columns:
+                continue
+            sql, filter_params = self._filter_sql(name, operator, value)
+            where.append(sql)
+            params += filter_params
+        return ' AND '.join(where), params
+
+    def _row_values(self, row):
+        # A selected row with its day number and category code decoded
+        values = list(row)
+        for i, name in enumerate(self.columns):
+            if name == 'Date' and values[i] is not None:
+                values[i] = pd.Timestamp(values[i], unit='D')
+            elif name == 'Category' and values[i] is not None:
+                values[i] = self.categories[values[i]]
+        return values
+
+    def table_page(self, start, end, category, page_current, page_size, sort_by=None, filter_query='',
+                   sheet_name=None):
+        """Answer a custom-paged DataTable request for the rows dated from
+        ``start`` to ``end`` with ``category`` (any when None), like
+        table_paging.table_page does for a frame. Returns ``(records, page_count)``.
+        """
+        page_current = page_current or 0
+        page_size = page_size or 10
+        where_sql, params = self._selection_where(start, end, category, filter_query, sheet_name)
+        n_rows = self._query(f'SELECT COUNT(*) FROM {self.table} WHERE {where_sql}', params)[0][0]
+        record_rows(n_rows)
+        selected = ', '.join(self._column_sql(name) for name in self.columns)
+        rows = self._query(f'SELECT {selected} FROM {self.table} WHERE {where_sql} '
+                           f'ORDER BY {self._order_sql(sort_by)} LIMIT ? OFFSET ?',
+                           params + [page_size, page_current * page_size])
+
+        records = compact_records(self.columns, (self._row_values(row) for row in rows))
+        return records, max(1, math.ceil(n_rows / page_size))
+
+    def export_rows(self, start, end, category, sort_by=None, filter_query='', sheet_name=None, chunk_rows=10000):
+        """Every row ``table_page`` would page through, in the same order, as
+        lists of at most ``chunk_rows`` tuples of the ``table_columns`` values.
+
+        The rows are fetched from one cursor a chunk at a time, so only one
+        chunk is ever in memory. The table is not dropped while the rows are
+        being read, even if the dataset is replaced meanwhile.
+        """
+        where_sql, params = self._selection_where(start, end, category, filter_query, sheet_name)
+        selected = ', '.join(self._column_sql(name) for name in self.columns)
+        with self.store.reading(self.table):
+            cursor = self.store.connection().execute(
+                f'SELECT {selected} FROM {self.table} WHERE {where_sql} ORDER BY {self._order_sql(sort_by)}', params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    yield [tuple(self._row_values(row)) for row in rows]
+            finally:
+                cursor.close()
+
+    @property
+    def count_cube(self):
+        # Counts per (sheet, day, category), e.g. for the client-side pies; its
+        # size depends on the days and categories, not on the number of rows
+        if self._count_cube is None:
+            rows = self._query(f'SELECT sheet, date, category, COUNT(*) FROM {self.table} '
+                               f'WHERE rowid <= ? AND date IS NOT NULL AND category IS NOT NULL '
+                               f'GROUP BY sheet, date, category', (self.max_row,))
+            sheet, day, category, count = np.array(rows, dtype=np.int64).reshape(-1, 4).T
+            days, day_codes = np.unique(day, return_inverse=True)
+            counts = np.zeros((len(self.sheets), len(days), len(self.categories)), dtype=np.int64)
+            counts[sheet, day_codes, category] = count
+            self._count_cube = CountCube(self.sheets, pd.to_datetime(days, unit='D'), self.categories, counts)
+        return self._count_cube
+
+    @property
+    def rollups(self):
+        # The count cube rolled up per calendar week and month, for the trend view
+        if self._rollups is None:
+            self._rollups = {bucket: self.count_cube.rolled(freq) for bucket, freq in ROLLUPS.items()}
+        return self._rollups
+
+    def describe(self):
+        # Size of the dataset for /metrics; its rows are on disk, so report the database size
+        return {'rows': self.n_rows, 'sheets': len(self.sheets), 'categories': len(self.categories),
+                'bytes': sum(os.path.getsize(path) for path in (self.store.path, self.store.path + '-wal')
+                             if os.path.exists(path))}
+
+    def appended(self, new_rows):
+        # Next version with ``new_rows`` (sheet name -> frame) added to each sheet
+        category_data, consolidated_data = compact_call_entries(new_rows)
+        sheets = self.sheets + [name for name in category_data if name not in self.sheets]
+        categories = list(self.categories)
+        with phase('sqlite'), self.store.connection():
+            max_row = self.store._insert(self.table, consolidated_data, self._stored_columns, sheets, categories)
+        return SqliteDataset(self.store, self.table, self.version + 1, max_row, self.n_rows + len(consolidated_data),
+                             sheets, categories, self.columns)
+
+    def replaced(self, new_frames):
+        """Next version with the rows of the sheets in ``new_frames`` replaced.
+
+        The other sheets' rows are copied inside the database, so nothing but
+        the new frames passes through memory.
+        """
+        category_data, consolidated_data = compact_call_entries(new_frames)
+        categories = list(self.categories)
+        table = self.store._new_table(self._stored_columns)
+        replaced = ', '.join(str(self.sheets.index(name)) for name in category_data)
+        with phase('sqlite'), self.store.connection() as connection:
+            kept = connection.execute(f'INSERT INTO {table} SELECT * FROM {self.table} '
+                                      f'WHERE rowid <= ? AND sheet NOT IN ({replaced}) ORDER BY rowid',
+                                      (self.max_row,)).rowcount
+            max_row = self.store._insert(table, consolidated_data, self._stored_columns, self.sheets, categories)
+        self.store._index(table)
+        self.store.retire(self.table)
+        return SqliteDataset(self.store, table, self.version + 1, max_row, kept + len(consolidated_data),
+                             self.sheets, categories, self.columns)
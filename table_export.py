@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+import math
+import tempfile
+from urllib.parse import urlencode
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from dash import html
+from dash.exceptions import PreventUpdate
+from flask import Response, abort, request
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from date_range import days_key, selected_days
+
+# Rows fetched and converted at a time while an export is streamed
+EXPORT_CHUNK_ROWS = 10000
+
+# Bytes read at a time from a finished workbook file
+XLSX_READ_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _cell(value):
+    # A table value as a plain Python value; missing values become None and
+    # day timestamps become dates
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or value is pd.NaT or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.date() if value == value.normalize() else value.to_pydatetime()
+    return value
+
+
+def xlsx_value(value):
+    # A table value as openpyxl can write it; xlsx text cannot hold control characters
+    value = _cell(value)
+    return ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+
+
+def csv_chunks(columns, row_chunks):
+    """Encoded CSV text for ``columns`` and the rows in ``row_chunks``, one piece per chunk.
+
+    The header goes out on its own first, so a download starts before any row
+    is read.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+    for rows in row_chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([['' if value is None else value for value in map(_cell, row)] for row in rows])
+        yield buffer.getvalue().encode('utf-8')
+
+
+def xlsx_chunks(columns, row_chunks):
+    """The bytes of an xlsx workbook holding ``columns`` and the rows in ``row_chunks``.
+
+    openpyxl's write-only mode streams each row to a temporary file instead of
+    keeping cells in memory. A workbook is a zip archive that can only be
+    finished once every row is written, so its bytes are read back from a
+    temporary file of its own after that.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Call Entries')
+    worksheet.append(columns)
+    for rows in row_chunks:
+        for row in rows:
+            worksheet.append([xlsx_value(value) for value in row])
+    with tempfile.TemporaryFile() as file:
+        workbook.save(file)
+        file.seek(0)
+        while True:
+            data = file.read(XLSX_READ_BYTES)
+            if not data:
+                break
+            yield data
+
+
+def export_hrefs(app, date_mode, selected_date, start_date, end_date, category=None, sheet_name=None,
+                 sort_by=None, filter_query=None):
+    """Links of the CSV and XLSX exports of a table selection, in EXPORT_FORMATS order."""
+    params = {'mode': date_mode, 'date': selected_date, 'start': start_date, 'end': end_date,
+              'category': category, 'sheet': sheet_name, 'filter': filter_query or None,
+              'sort': json.dumps(sort_by) if sort_by else None}
+    query = urlencode({name: value for name, value in params.items() if value is not None})
+    return [app.get_relative_path(f'/export.{export_format}') + '?' + query for export_format in EXPORT_FORMATS]
+
+
+def export_links():
+    # Download links for the whole selection; export_hrefs fills in their targets
+    return html.Div([
+        html.A(f"Export {export_format.upper()}", id=f'export-{export_format}', style={'marginRight': '1em'})
+        for export_format in EXPORT_FORMATS
+    ], className='table-export')
+
+
+def install_export(server, dataset_holder):
+    """Serve ``/export.csv`` and ``/export.xlsx`` on ``server``.
+
+    Both stream every row of the selection in the query string (the date
+    controls, the clicked category and sheet, the table's sort and filter)
+    from the current dataset, a chunk of EXPORT_CHUNK_ROWS rows at a time, so
+    memory use does not grow with the number of rows exported.
+    """
+    @server.route('/export.<export_format>')
+    def export(export_format):
+        if export_format not in EXPORT_FORMATS:
+            abort(404)
+        dataset = dataset_holder.get()
+        if dataset is None:
+            abort(503)
+        args = request.args
+        try:
+            start, end = selected_days(args.get('mode'), args.get('date'), args.get('start'), args.get('end'))
+            sort_by = json.loads(args['sort']) if args.get('sort') else None
+        except (PreventUpdate, ValueError):
+            abort(400)
+        sheet_name = args.get('sheet')
+        if sheet_name is not None and sheet_name not in dataset.sheets:
+            abort(404)
+
+        columns = dataset.table_columns()
+        row_chunks = dataset.export_rows(start, end, args.get('category'), sort_by, args.get('filter', ''),
+                                         sheet_name, EXPORT_CHUNK_ROWS)
+        chunks = csv_chunks(columns, row_chunks) if export_format == 'csv' else xlsx_chunks(columns, row_chunks)
+        first, last = (day or 'all' for day in days_key(start, end))
+        filename = f"call-entries-{first if first == last else f'{first}-{last}'}.{export_format}"
+        return Response(chunks, mimetype=EXPORT_FORMATS[export_format],
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
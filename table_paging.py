@@ -0,0 +1,129 @@
+import math
+from datetime import datetime
+
+import pandas as pd
+
+# DataTable filter operators, longest spelling first so '>=' wins over '>'
+OPERATORS = [['ge ', '>='],
+             ['le ', '<='],
+             ['lt ', '<'],
+             ['gt ', '>'],
+             ['ne ', '!='],
+             ['eq ', '='],
+             ['contains '],
+             ['datestartswith ']]
+
+
+def split_filter_part(filter_part):
+    # '{Category} contains Sales' -> ('Category', 'contains', 'Sales')
+    for operator_type in OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                elif operator_type[0] in ('contains ', 'datestartswith '):
+                    # Text matches keep the value as typed ('1' must not become '1.0')
+                    value = value_part
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # Word operators need spaces after them in the filter string,
+                # but we don't want these later
+                return name, operator_type[0].strip(), value
+
+    return [None] * 3
+
+
+def filter_mask(column, operator, value):
+    """Boolean mask of the values of ``column`` matching one filter term.
+
+    A categorical column is matched on its category names as text, so
+    ``{Category} > A`` compares names whether the categories are ordered or
+    not; sqlite_store matches its category codes through this too.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype(object)
+        column = column.where(column.isna(), column.astype(str)).astype(object)
+    if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+        try:
+            return getattr(column, operator)(value)
+        except TypeError:
+            # e.g. a number compared against a text column: nothing matches
+            return pd.Series(False, index=column.index)
+    if operator == 'contains':
+        return column.astype(str).str.contains(str(value), regex=False, na=False)
+    if operator == 'datestartswith':
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.strftime('%Y-%m-%d')
+        return column.astype(str).str.startswith(str(value), na=False)
+    return pd.Series(True, index=column.index)
+
+
+def filter_frame(df, filter_query):
+    # Apply a DataTable filter_query ('... && ...') as one combined boolean mask
+    if not filter_query:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for filter_part in filter_query.split(' && '):
+        col_name, operator, filter_value = split_filter_part(filter_part)
+        if col_name not in df.columns:
+            continue
+        mask &= filter_mask(df[col_name], operator, filter_value)
+    return df[mask]
+
+
+def sort_frame(df, sort_by):
+    # Apply a DataTable sort_by list; a stable sort keeps ties in file order
+    sort_by = [col for col in sort_by or [] if col['column_id'] in df.columns]
+    if not sort_by:
+        return df
+    return df.sort_values(
+        [col['column_id'] for col in sort_by],
+        ascending=[col['direction'] == 'asc' for col in sort_by],
+        kind='stable',
+        na_position='last',
+    )
+
+
+def _compact(value):
+    # Days go out as 'YYYY-MM-DD' rather than as full ISO timestamps
+    if isinstance(value, datetime):
+        if value.hour == value.minute == value.second == value.microsecond == 0:
+            return value.strftime('%Y-%m-%d')
+        return value.isoformat()
+    return value
+
+
+def compact_records(columns, rows):
+    """DataTable records of ``rows`` (sequences of ``columns`` values) in a
+    compact encoding: dates without a time of day, and missing values left
+    out, which the table shows as empty cells all the same.
+    """
+    return [{name: _compact(value) for name, value in zip(columns, row) if not pd.isna(value)}
+            for row in rows]
+
+
+def table_page(df, page_current, page_size, sort_by=None, filter_query='', columns=None):
+    """Answer a custom-paged DataTable request from ``df``.
+
+    Filtering and sorting run on the whole selection; only the rows of the
+    requested page are converted to records, holding just ``columns`` (all
+    of them when None), the columns the table declares. Returns
+    ``(records, page_count)``.
+    """
+    page_current = page_current or 0
+    page_size = page_size or 10
+    df = sort_frame(filter_frame(df, filter_query), sort_by)
+    page_count = max(1, math.ceil(len(df) / page_size))
+    start = page_current * page_size
+    columns = list(df.columns) if columns is None else columns
+    page = df.iloc[start:start + page_size][columns]
+    return compact_records(columns, page.itertuples(index=False, name=None)), page_count
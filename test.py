@@ -1,52 +1,49 @@
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State, ALL
 from dash.dash_table import DataTable
-import pandas as pd
-import plotly.express as px
-import openpyxl
+from compression import install_compression
+from count_cube import CountCube
+from dataset import Dataset, DatasetHolder
+from figure_cache import FigureCache
+from ingest_cache import load_call_entries
+from lazy_pies import PIE_TYPE, pie_slots, pie_stores, sheets_to_render
+from metrics import Metrics
+from pie_figures import pie_figure
 
 # Read Excel file into a pandas DataFrame
 file_path = 'Call Entries updated.xlsx'
 
-# Define specific sheet names
-sheet_names = ["Kavitha", "Meenu", "Ajanya", "AJITH"]
+# Callback and ingest timings, served on /metrics
+metrics = Metrics()
 
-# Create a dictionary to store category data for each sheet
-category_data = {}
+# Load the per-sheet frames and the consolidated frame, reusing the on-disk
+# snapshot when the workbook has not changed since the last start. Every sheet
+# with a Category column is an agent sheet
+with metrics.ingest():
+    category_data, consolidated_data = load_call_entries(file_path)
+sheet_names = list(category_data)
 
-# Consolidate data from all sheets into a single DataFrame
-consolidated_data = pd.DataFrame()
-for sheet_name in sheet_names:
-    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl')
+# Category counts per (sheet, day, category) for the pie charts
+count_cube = CountCube.from_frames(category_data)
 
-    # Standardize column names to ensure consistency
-    if 'Category' in df.columns:
-        df.rename(columns={'Category': 'Category'}, inplace=True)
-    elif 'Category ' in df.columns:
-        df.rename(columns={'Category ': 'Category'}, inplace=True)
-    elif 'Category:' in df.columns:
-        df.rename(columns={'Category:': 'Category'}, inplace=True)
-    else:
-        raise ValueError(f"Category column not found in sheet '{sheet_name}'")
-
-    category_data[sheet_name] = df
-    consolidated_data = pd.concat([consolidated_data, df], ignore_index=True)
+# Serialized pie figures keyed by (data version, view, sheet, day). The
+# workbook is read once per process, so its version never changes
+figure_cache = FigureCache()
+data_version = 0
+dataset = Dataset(category_data, count_cube, data_version, consolidated_data)
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
+metrics.install(app.server, DatasetHolder(dataset), figure_cache)
+install_compression(app.server)
 
 # Define the layout of the Dash app
 app.layout = html.Div([
     html.H1("Category Distribution"),
 
-    # Display pie charts for each sheet
-    html.Div([
-        dcc.Graph(id=f'pie-chart-{sheet_name}', figure=px.pie(
-            category_data[sheet_name].groupby('Category').size().reset_index(name='Count'),
-            values='Count', names='Category', title=f'Category Distribution - {sheet_name}'
-        ))
-        for sheet_name in category_data.keys()
-    ]),
+    # Display pie charts for each sheet; a pie is only drawn once it scrolls into view
+    html.Div(pie_slots(sheet_names)),
+    *pie_stores(sheet_names),
 
     # Display pie chart for consolidated data
     html.Div([
@@ -61,59 +58,97 @@ app.layout = html.Div([
             columns=[{"name": i, "id": i} for i in category_data[next(iter(category_data))].columns],
             data=[],
             export_format='csv',  # Enable exporting to CSV
-            sort_action='native',  # Enable native sorting
-            filter_action='native',  # Enable native filtering
-            page_action='native',  # Enable pagination
+            sort_action='custom',  # Sort on the server
+            filter_action='custom',  # Filter on the server
+            page_action='custom',  # Only the visible page is sent to the browser
+            page_current=0,
             page_size=10,  # Set number of rows per page
-        )
+        ),
+        # Sheet and category picked by the last pie chart click
+        dcc.Store(id='table-selection')
     ])
 ])
 
 
-# Define callback to update the table based on pie chart selection
+# Define callback to work out the table selection from the pie chart clicks
+# and go back to the first page whenever it changes
 @app.callback(
-    Output('table', 'data'),
-    [Input(f'pie-chart-{sheet_name}', 'clickData') for sheet_name in category_data.keys()] +
-    [Input('consolidated-pie-chart', 'clickData')]
+    [Output('table-selection', 'data'), Output('table', 'page_current')],
+    [Input({'type': PIE_TYPE, 'sheet': ALL}, 'clickData'),
+     Input('consolidated-pie-chart', 'clickData')]
 )
-def update_table(*clickData):
-    selected_category = None
-    for data in clickData:
-        if data:
-            selected_category = data['points'][0]['label']
-            break
+def update_table_selection(sheet_clicks, consolidated_click):
+    triggered_id = dash.callback_context.triggered_id
+    # Only the clicked pie's clickData is in the triggered value
+    data = dash.callback_context.triggered[0]['value'] if triggered_id else None
+    if not data:
+        return None, 0
 
-    if selected_category is None:
-        return []
+    selected_category = data['points'][0]['label']
+    if triggered_id == 'consolidated-pie-chart':
+        # Select the category across the consolidated data
+        return {'sheet': None, 'category': selected_category}, 0
 
-    if 'consolidated-pie-chart' in dash.callback_context.triggered_id:
-        # Filter data based on selected category for consolidated data
-        filtered_data = consolidated_data[consolidated_data['Category'] == selected_category]
-    else:
-        # Find the sheet name associated with the clicked pie chart
-        clicked_sheet = None
-        for sheet_name in category_data.keys():
-            if f'pie-chart-{sheet_name}' in dash.callback_context.triggered_id:
-                clicked_sheet = sheet_name
-                break
+    # The id of the clicked pie chart names its sheet
+    return {'sheet': triggered_id['sheet'], 'category': selected_category}, 0
 
-        if clicked_sheet is None:
-            return []
 
-        # Filter data based on selected category and clicked sheet
-        filtered_data = category_data[clicked_sheet][category_data[clicked_sheet]['Category'] == selected_category]
+# Define callback to update the table based on pie chart selection; only the
+# requested page is sorted, filtered and sent by the server
+@app.callback(
+    [Output('table', 'data'), Output('table', 'page_count')],
+    [Input('table-selection', 'data'),
+     Input('table', 'page_current'),
+     Input('table', 'page_size'),
+     Input('table', 'sort_by'),
+     Input('table', 'filter_query')]
+)
+@metrics.instrument('update_table')
+def update_table(selection, page_current, page_size, sort_by, filter_query):
+    if selection is None:
+        return [], 1
 
-    return filtered_data.to_dict('records')
+    # The selected category's rows, of the clicked sheet or of all sheets, are
+    # looked up in the row index instead of masking the whole frame
+    return dataset.table_page(None, None, selection['category'], page_current, page_size, sort_by, filter_query,
+                              selection['sheet'])
+
+
+# Callback to draw the per-sheet pie charts over all dates, building figures
+# only for the pies on screen that have not been drawn yet
+@app.callback(
+    [Output({'type': PIE_TYPE, 'sheet': ALL}, 'figure'), Output('pie-rendered', 'data')],
+    [Input('pie-visibility', 'data')],
+    [State('pie-rendered', 'data'), State({'type': PIE_TYPE, 'sheet': ALL}, 'id')]
+)
+@metrics.instrument('update_pie_charts')
+def update_pie_charts(visible_sheets, rendered, pie_ids):
+    render, rendered = sheets_to_render(data_version, visible_sheets, rendered)
+    figures = []
+    for pie_id in pie_ids:
+        sheet_name = pie_id['sheet']
+        if sheet_name not in render:
+            figures.append(dash.no_update)
+            continue
+        figures.append(figure_cache.figure(
+            data_version, 'sheet', sheet_name, None,
+            lambda: pie_figure(count_cube.categories, count_cube.sheet_counts(sheet_name),
+                               f'Category Distribution - {sheet_name}')))
+    return figures, rendered
 
 
 # Callback to update consolidated pie chart
 @app.callback(
     Output('consolidated-pie-chart', 'figure'),
-    [Input(f'pie-chart-{sheet_name}', 'clickData') for sheet_name in category_data.keys()]
+    [Input({'type': PIE_TYPE, 'sheet': ALL}, 'clickData')]
 )
-def update_consolidated_pie_chart(*clickData):
-    category_counts = consolidated_data.groupby('Category').size().reset_index(name='Count')
-    return px.pie(category_counts, values='Count', names='Category', title='Consolidated Category Distribution')
+@metrics.instrument('update_consolidated_pie_chart')
+def update_consolidated_pie_chart(clickData):
+    # The chart never changes with the clicks, so only the first call builds it
+    return figure_cache.figure(
+        data_version, 'consolidated', None, None,
+        lambda: pie_figure(count_cube.categories, count_cube.consolidated_counts(),
+                           'Consolidated Category Distribution'))
 
 
 # Run the Dash app
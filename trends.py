@@ -0,0 +1,192 @@
+import math
+
+import numpy as np
+import pandas as pd
+from dash import dcc, html, Input, Output
+from dash.exceptions import PreventUpdate
+
+from date_range import DATE_INPUTS, selected_days
+from pie_figures import base_layout, category_label
+
+# Trend buckets as pandas period frequencies; weeks and months come from the
+# dataset's rollups, days straight from its count cube
+BUCKET_FREQS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+TREND_BUCKETS = [{'label': 'Daily', 'value': 'day'},
+                 {'label': 'Weekly', 'value': 'week'},
+                 {'label': 'Monthly', 'value': 'month'}]
+TREND_KINDS = [{'label': 'Heatmap', 'value': 'heatmap'}, {'label': 'Lines', 'value': 'lines'}]
+
+# Most time buckets a trend figure shows; longer ranges are downsampled
+MAX_TREND_BUCKETS = 120
+
+
+def _cube_rows(cube, positions, sheet_name):
+    # Counts of the cube's days at ``positions``, of one sheet or summed over all
+    if sheet_name is None:
+        return cube.counts[:, positions].sum(axis=0)
+    return cube.counts[cube.sheets.index(sheet_name), positions]
+
+
+def _clipped_counts(cube, start, end, sheet_name):
+    # Counts of the days from ``start`` to ``end`` from the cube's running totals
+    if sheet_name is None:
+        return cube.consolidated_range_counts(start, end)
+    return cube.sheet_range_counts(sheet_name, start, end)
+
+
+def trend_counts(dataset, bucket, start=None, end=None, sheet_name=None):
+    """Category counts per ``bucket`` ('day', 'week' or 'month') from ``start``
+    to ``end`` (None leaves that end open), of one sheet or of all.
+
+    Whole weeks and months are rows of the rollups the dataset keeps per
+    calendar bucket, and the first and last buckets, which the range may cut,
+    come from the day cube's running totals, so the cost depends on the number
+    of buckets, not on the rows or days in the range. Buckets without calls
+    are kept as zeros.
+
+    Returns the first day of each bucket and a ``(buckets, categories)``
+    count array, its columns in ``dataset.categories`` order.
+    """
+    day_cube = dataset.count_cube
+    empty = (pd.DatetimeIndex([]), np.zeros((0, len(day_cube.categories)), dtype=day_cube.counts.dtype))
+    if not len(day_cube.days) or (sheet_name is not None and sheet_name not in day_cube.sheets):
+        return empty
+    start = day_cube.days[0] if start is None else max(start, day_cube.days[0])
+    end = day_cube.days[-1] if end is None else min(end, day_cube.days[-1])
+    if start > end:
+        return empty
+
+    periods = pd.period_range(start, end, freq=BUCKET_FREQS[bucket])
+    firsts = periods.start_time.normalize()
+    cube = day_cube if bucket == 'day' else dataset.rollups[bucket]
+    counts = np.zeros((len(periods), len(day_cube.categories)), dtype=day_cube.counts.dtype)
+    positions = cube.days.get_indexer(firsts)
+    found = positions >= 0
+    counts[found] = _cube_rows(cube, positions[found], sheet_name)
+    if bucket != 'day':
+        # Only the part of the first and last bucket inside the range is counted
+        lasts = periods.end_time.normalize()
+        for i in {0, len(periods) - 1}:
+            counts[i] = _clipped_counts(day_cube, max(firsts[i], start), min(lasts[i], end), sheet_name)
+    return firsts, counts
+
+
+def downsampled(firsts, counts, limit=MAX_TREND_BUCKETS):
+    # Sum runs of consecutive buckets so at most ``limit`` remain; each run is
+    # labelled with its first bucket
+    size = math.ceil(len(firsts) / limit) if len(firsts) > limit else 1
+    if size == 1:
+        return firsts, counts
+    runs = np.arange(0, len(firsts), size)
+    return firsts[runs], np.add.reduceat(counts, runs, axis=0)
+
+
+def trend_series(dataset, bucket, start=None, end=None, sheet_name=None):
+    """Counts for a trend figure of at most MAX_TREND_BUCKETS buckets.
+
+    A range too long for ``bucket`` is first shown in coarser calendar buckets
+    (days become weeks, weeks months), then, if still too long, in runs of
+    several buckets. Returns the bucket actually used with trend_counts' result.
+    """
+    buckets = list(BUCKET_FREQS)
+    firsts, counts = trend_counts(dataset, bucket, start, end, sheet_name)
+    while len(firsts) > MAX_TREND_BUCKETS and bucket != buckets[-1]:
+        bucket = buckets[buckets.index(bucket) + 1]
+        firsts, counts = trend_counts(dataset, bucket, start, end, sheet_name)
+    firsts, counts = downsampled(firsts, counts)
+    return bucket, firsts, counts
+
+
+def _layout(trace_type, title, **layout):
+    return {'template': base_layout(trace_type)['template'], 'title': {'text': title}, **layout}
+
+
+def heatmap_figure(categories, firsts, counts, title):
+    """Figure dict of a category by time heatmap of ``counts[bucket, category]``.
+
+    Like pie_figures.pie_figure it is built straight from the count array.
+    Categories without calls in the range are left out.
+    """
+    present = np.flatnonzero(counts.sum(axis=0))
+    return {
+        'data': [{
+            'type': 'heatmap',
+            'x': [first.strftime('%Y-%m-%d') for first in firsts],
+            'y': [category_label(categories[i]) for i in present],
+            'z': counts[:, present].T.tolist(),
+            'colorscale': 'Blues',
+            'hovertemplate': 'Category=%{y}<br>From=%{x}<br>Count=%{z}<extra></extra>',
+        }],
+        'layout': _layout('heatmap', title, xaxis={'type': 'date'}, yaxis={'type': 'category'}),
+    }
+
+
+def trend_figure(categories, firsts, counts, title):
+    """Figure dict with one line of calls per bucket for each category with calls.
+
+    Each line's colour follows the category's position in ``categories``, as
+    the pie slices' do.
+    """
+    colorway = base_layout('scatter')['template']['layout']['colorway']
+    x = [first.strftime('%Y-%m-%d') for first in firsts]
+    return {
+        'data': [{
+            'type': 'scatter',
+            'mode': 'lines+markers',
+            'name': category_label(categories[i]),
+            'x': x,
+            'y': counts[:, i].tolist(),
+            'line': {'color': colorway[i % len(colorway)]},
+            'hovertemplate': 'From=%{x}<br>Count=%{y}',
+        } for i in np.flatnonzero(counts.sum(axis=0)).tolist()],
+        'layout': _layout('scatter', title, xaxis={'type': 'date'}, yaxis={'title': {'text': 'Calls'}}),
+    }
+
+
+def trend_controls(sheet_names=None):
+    """Bucket, chart kind and agent pickers over the trend chart.
+
+    Leaving the agent empty shows all agents together.
+    """
+    return html.Div([
+        html.H2("Category Trends"),
+        dcc.RadioItems(id='trend-bucket', options=TREND_BUCKETS, value='week', inline=True),
+        dcc.RadioItems(id='trend-kind', options=TREND_KINDS, value='heatmap', inline=True),
+        dcc.Dropdown(id='trend-sheet', options=sheet_options(sheet_names or []), placeholder='All agents'),
+        dcc.Graph(id='trend-chart'),
+    ])
+
+
+def sheet_options(sheet_names):
+    return [{'label': sheet_name, 'value': sheet_name} for sheet_name in sheet_names]
+
+
+def register_trends(app, dataset_holder, figure_cache, metrics):
+    """Serve the trend chart of the selected days (the whole history in day mode)."""
+    @app.callback(
+        Output('trend-chart', 'figure'),
+        DATE_INPUTS +
+        [Input('trend-bucket', 'value'),
+         Input('trend-kind', 'value'),
+         Input('trend-sheet', 'value')]
+    )
+    @metrics.instrument('update_trend')
+    def update_trend(date_mode, selected_date, start_date, end_date, bucket, kind, sheet_name):
+        dataset = dataset_holder.get()
+        if dataset is None:
+            raise PreventUpdate
+        # A single day has no trend, so day mode shows every day loaded
+        start, end = (None, None)
+        if date_mode == 'range':
+            start, end = selected_days(date_mode, selected_date, start_date, end_date)
+
+        def build():
+            used, firsts, counts = trend_series(dataset, bucket, start, end, sheet_name)
+            title = f'Calls per Category by {used.capitalize()}'
+            if sheet_name is not None:
+                title += f' - {sheet_name}'
+            draw = heatmap_figure if kind == 'heatmap' else trend_figure
+            return draw(dataset.categories, firsts, counts, title)
+
+        return figure_cache.figure(dataset.version, f'trend-{kind}-{bucket}', sheet_name, (start, end), build)
@@ -0,0 +1,291 @@
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import posixpath
+import select
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+from dataset import Dataset
+from excel_loader import compact_call_entries, read_call_entries
+from ingest_cache import CACHE_DIR, load_call_entries, previous_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the workbook when inotify is unavailable, and the
+# longest a missed inotify event can go unnoticed otherwise
+POLL_INTERVAL = 5
+
+# Seconds the file must stay unchanged before it is read, so a save in progress
+# is not picked up half-written
+SETTLE_SECONDS = 1
+
+# Parts every worksheet depends on: the sheet list, where each sheet's part
+# lives, and the cell formats that make a number a date
+LAYOUT_PARTS = ['xl/workbook.xml', 'xl/_rels/workbook.xml.rels', 'xl/styles.xml']
+SHARED_STRINGS = 'xl/sharedStrings.xml'
+
+# inotify(7) events meaning a file in the directory was written or replaced
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+
+def _part_digest(info):
+    # CRC-32 and size of the uncompressed part, from the zip directory, so
+    # hashing a part costs no decompression
+    return [info.CRC, info.file_size]
+
+
+def _sheet_parts(archive):
+    # Worksheet name -> zip part name, in workbook order
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels if rel.tag.endswith('}Relationship')}
+    parts = {}
+    for sheet in workbook.iter():
+        if not sheet.tag.endswith('}sheet'):
+            continue
+        rel_id = next(value for key, value in sheet.attrib.items() if key.endswith('}id'))
+        target = targets[rel_id]
+        parts[sheet.get('name')] = (target.lstrip('/') if target.startswith('/')
+                                    else posixpath.normpath(posixpath.join('xl', target)))
+    return parts
+
+
+def _strings_digest(data, count=None):
+    # Item count of a shared strings part and the digest of its first ``count``
+    # items (all of them when None); the header is left out since it holds the count
+    ends = []
+    end = data.find(b'</si>')
+    while end >= 0:
+        ends.append(end + len(b'</si>'))
+        end = data.find(b'</si>', ends[-1])
+    count = len(ends) if count is None else min(count, len(ends))
+    first = data.find(b'<si')
+    items = data[first:ends[count - 1]] if count else b''
+    return len(ends), hashlib.sha256(items).hexdigest()
+
+
+def fingerprint(file_path, strings_prefix=0):
+    """Per-part hashes of an xlsx workbook.
+
+    ``sheets`` maps each worksheet name to the hash of its XML part and
+    ``layout`` holds the hashes of the parts every sheet depends on. Shared
+    strings are hashed by item: ``strings`` is the item count and the digest of
+    all items, and ``strings_prefix`` the digest of the first
+    ``strings_prefix`` items, so a caller can tell whether strings were only
+    appended. Raises zipfile.BadZipFile while the file is being rewritten.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        names = set(archive.namelist())
+        sheets = {name: _part_digest(archive.getinfo(part)) for name, part in _sheet_parts(archive).items()}
+        layout = [_part_digest(archive.getinfo(part)) for part in LAYOUT_PARTS if part in names]
+        data = archive.read(SHARED_STRINGS) if SHARED_STRINGS in names else b''
+    return {
+        'sheets': sheets,
+        'layout': layout,
+        'strings': list(_strings_digest(data)),
+        'strings_prefix': _strings_digest(data, strings_prefix)[1],
+    }
+
+
+def changed_sheets(previous, current):
+    """Worksheets whose part changed between two fingerprints, or None when
+    every sheet has to be read again.
+
+    That is the case when the sheet list or the cell styles changed, or when an
+    existing shared string did: any sheet may refer to it without its own part
+    changing. Strings added at the end only matter to the sheets using them,
+    whose parts change too.
+    """
+    if (previous is None or current['layout'] != previous['layout']
+            or list(current['sheets']) != list(previous['sheets'])):
+        return None
+    if current['strings'] != previous['strings'] and current['strings_prefix'] != previous['strings'][1]:
+        return None
+    return [name for name, digest in current['sheets'].items() if digest != previous['sheets'][name]]
+
+
+def _inotify(directory):
+    # Descriptor of an inotify instance watching ``directory``, or None where
+    # inotify is not available (not Linux, or out of watches)
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class WorkbookWatcher:
+    """Keeps a DatasetHolder in sync with the agent sheets of a workbook file.
+
+    ``load()`` reads the workbook through the snapshot cache and remembers a
+    fingerprint of its parts. After ``start()`` a daemon thread waits for the
+    file to change (inotify on its directory, falling back to polling every
+    ``interval`` seconds) and calls ``check()``, which compares fingerprints and
+    reads again only the worksheets whose parts changed. The other sheets'
+    frames are reused, the count cube and row index are rebuilt, and the new
+    Dataset version is published through ``holder.swap`` while requests keep
+    being served from the previous one. With ``sheet_names`` None the agent
+    sheets are discovered. Load and reload timings are recorded in ``metrics``
+    when one is given. With a sqlite_store.SqliteStore as ``store`` the rows
+    are kept there instead of in memory.
+    """
+
+    def __init__(self, file_path, holder, sheet_names=None, interval=POLL_INTERVAL, settle=SETTLE_SECONDS,
+                 metrics=None, cache_dir=CACHE_DIR, store=None):
+        self.file_path = file_path
+        self.holder = holder
+        self.sheet_names = list(sheet_names) if sheet_names is not None else None
+        self.interval = interval
+        self.settle = settle
+        self.metrics = metrics
+        self.cache_dir = cache_dir
+        self.store = store
+        self._fingerprint = None
+        self._stat = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _file_stat(self):
+        stat = os.stat(self.file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _publish(self, dataset, start, source):
+        self.holder.swap(dataset)
+        if self.metrics is not None:
+            self.metrics.observe_ingest(time.perf_counter() - start, source)
+        return dataset
+
+    def _dataset(self, category_data, consolidated_data):
+        # Next version holding the frames, in memory or written to the store
+        current = self.holder.get()
+        version = current.version + 1 if current is not None else 0
+        if self.store is not None:
+            return self.store.dataset(category_data, consolidated_data, version, previous=current)
+        return Dataset(category_data, version=version, consolidated_data=consolidated_data)
+
+    def load(self):
+        start = time.perf_counter()
+        # Fingerprint before reading, so a save made while we read is picked up
+        self._stat = self._file_stat()
+        self._fingerprint = fingerprint(self.file_path)
+        category_data, consolidated_data = load_call_entries(self.file_path, self.sheet_names, self.cache_dir)
+        return self._publish(self._dataset(category_data, consolidated_data), start, 'load')
+
+    def _sheets_to_read(self, current):
+        # Agent sheets to read again, or None to read the whole workbook
+        changed = changed_sheets(self._fingerprint, current)
+        dataset = self.holder.get()
+        if changed is None or dataset is None:
+            return None
+        agent_sheets = self.sheet_names if self.sheet_names is not None else dataset.sheets
+        if self.sheet_names is None and any(name not in agent_sheets for name in changed):
+            # Another sheet may have become an agent sheet, so discover them again
+            return None
+        return [name for name in changed if name in agent_sheets]
+
+    def _read_changed(self, changed, fresh):
+        # Reader for load_call_entries that parses only ``changed`` (into
+        # ``fresh``) and reuses the current frames of the other sheets. A
+        # dataset in a store holds no frames; the other sheets then come from
+        # the previous snapshot, so the snapshot is refreshed all the same
+        def read(file_path, sheet_names):
+            dataset = self.holder.get()
+            fresh.update(read_call_entries(file_path, changed, dataset.table_columns())[0])
+            logger.info("Re-read %d changed sheet(s) of '%s': %s", len(changed), file_path, ', '.join(changed))
+            if self.store is None:
+                others = dataset.category_data
+            else:
+                others = previous_snapshot(file_path, self.cache_dir)
+                if others is None or any(name not in others for name in dataset.sheets):
+                    # No snapshot to take them from: read the other sheets too
+                    others = read_call_entries(file_path, dataset.sheets, dataset.table_columns())[0]
+            return compact_call_entries({name: fresh.get(name, others[name]) for name in dataset.sheets})
+        return read
+
+    def check(self):
+        """Reload the sheets that changed since the last load; True when a new version was published."""
+        stat = self._file_stat()
+        if stat == self._stat:
+            return False
+        # Wait for the save to finish
+        while True:
+            time.sleep(self.settle)
+            settled = self._file_stat()
+            if settled == stat:
+                break
+            stat = settled
+
+        start = time.perf_counter()
+        previous = self._fingerprint
+        try:
+            current = fingerprint(self.file_path, previous['strings'][0] if previous else 0)
+        except (zipfile.BadZipFile, KeyError, ET.ParseError):
+            return False  # Still being written; the next change event or poll retries
+        changed = self._sheets_to_read(current)
+        self._stat = stat
+        self._fingerprint = current
+        if changed == []:
+            return False
+
+        if changed is None:
+            category_data, consolidated_data = load_call_entries(self.file_path, self.sheet_names, self.cache_dir)
+            self._publish(self._dataset(category_data, consolidated_data), start, 'reload')
+            return True
+
+        dataset = self.holder.get()
+        fresh = {}
+        category_data, consolidated_data = load_call_entries(
+            self.file_path, self.sheet_names, self.cache_dir, reader=self._read_changed(changed, fresh))
+        if self.store is not None and fresh:
+            # The other sheets' rows are copied inside the database
+            self._publish(dataset.replaced(fresh), start, 'reload')
+        else:
+            self._publish(self._dataset(category_data, consolidated_data), start, 'reload')
+        return True
+
+    def _wait(self, fd):
+        # Until the workbook's directory reports a change or ``interval`` passes
+        if fd is None:
+            self._stop.wait(self.interval)
+            return
+        readable, _, _ = select.select([fd], [], [], self.interval)
+        if readable:
+            os.read(fd, 64 * 1024)  # Drain the events; check() looks at the file itself
+
+    def _run(self):
+        fd = _inotify(os.path.dirname(os.path.abspath(self.file_path)))
+        try:
+            while not self._stop.is_set():
+                self._wait(fd)
+                if self._stop.is_set():
+                    break
+                try:
+                    self.check()
+                except Exception:  # Keep serving the last good version
+                    logger.exception("Reloading '%s' failed", self.file_path)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='workbook-watcher', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,108 @@
+import atexit
+import gc
+import os
+
+from dashboard import create_app
+from dataset import Dataset, DatasetHolder
+from metrics import Metrics
+from sqlite_store import DATASET_STORE, SqliteStore
+
+# Production entry point for a pre-forking WSGI server:
+#
+#     gunicorn -c gunicorn.conf.py wsgi:application
+#
+# With preload_app the dataset is loaded once in the master process and the
+# workers share its memory copy-on-write after the fork. Set
+# DATASET_WARMUP=background to bind straight away instead: each worker then
+# loads its own copy in a background thread and serves a loading state meanwhile.
+
+# Where the data comes from: 'excel' reads WORKBOOK_PATH, 'gsheet' reads the
+# spreadsheet at SHEET_URL with the service-account key in GOOGLE_CREDENTIALS_FILE.
+# WORKBOOK_PATH may also be a directory or glob of workbooks (one per month or
+# branch), which are parsed in parallel and merged
+DATA_SOURCE = os.environ.get('DASHBOARD_SOURCE', 'excel')
+WORKBOOK_PATH = os.environ.get('WORKBOOK_PATH', 'Call Entries updated.xlsx')
+# SHEET_NAMES (comma-separated) limits the agent sheets; by default every sheet
+# with a Category column is read
+SHEET_NAMES = os.environ['SHEET_NAMES'].split(',') if os.environ.get('SHEET_NAMES') else None
+DATASET_WARMUP = os.environ.get('DATASET_WARMUP', 'preload')
+# Each worker re-reads the sheets that changed whenever the workbook is saved;
+# set WATCH_WORKBOOK=0 to read it only at start-up
+WATCH_WORKBOOK = os.environ.get('WATCH_WORKBOOK', '1') == '1'
+
+sheet_refresher = None
+workbook_watcher = None
+
+
+def load_dataset():
+    global sheet_refresher, workbook_watcher
+    # Set DATASET_STORE to keep the rows in a SQLite file instead of in memory.
+    # Forked workers share the file the master wrote; workers loading their own
+    # data each get a file of their own, deleted when the worker exits
+    store = None
+    if DATASET_STORE and DATASET_WARMUP == 'background':
+        store = SqliteStore(f'{DATASET_STORE}.{os.getpid()}')
+        atexit.register(store.remove)
+    elif DATASET_STORE:
+        store = SqliteStore(DATASET_STORE)
+    if DATA_SOURCE == 'gsheet':
+        from gsheet_source import SheetRefresher, open_spreadsheet
+        spreadsheet = open_spreadsheet(os.environ['GOOGLE_CREDENTIALS_FILE'], os.environ['SHEET_URL'])
+        sheet_refresher = SheetRefresher(spreadsheet, SHEET_NAMES, dataset_holder, metrics=metrics, store=store)
+        return sheet_refresher.load()
+    from multi_ingest import is_workbook_set, load_workbooks
+    if is_workbook_set(WORKBOOK_PATH):
+        # Several workbooks are read once, at start-up
+        with metrics.ingest():
+            category_data, consolidated_data = load_workbooks(WORKBOOK_PATH, SHEET_NAMES)
+    elif WATCH_WORKBOOK:
+        from workbook_watcher import WorkbookWatcher
+        workbook_watcher = WorkbookWatcher(WORKBOOK_PATH, dataset_holder, SHEET_NAMES, metrics=metrics,
+                                           store=store)
+        return workbook_watcher.load()
+    else:
+        from ingest_cache import load_call_entries
+        with metrics.ingest():
+            category_data, consolidated_data = load_call_entries(WORKBOOK_PATH, SHEET_NAMES)
+    if store is not None:
+        return store.dataset(category_data, consolidated_data)
+    return Dataset(category_data, consolidated_data=consolidated_data)
+
+
+def start_refresher():
+    # A refresh builds new frames, which then belong to that worker alone
+    if sheet_refresher is not None:
+        sheet_refresher.start()
+    if workbook_watcher is not None:
+        workbook_watcher.start()
+
+
+def warm_up():
+    dataset = load_dataset()
+    start_refresher()
+    return dataset
+
+
+def start_worker():
+    # Threads do not survive a fork, so each worker starts its own
+    if DATASET_WARMUP == 'background':
+        dataset_holder.load_in_background(warm_up)
+    else:
+        start_refresher()
+
+
+# Callback and ingest timings, served on /metrics by every worker
+metrics = Metrics()
+
+dataset_holder = DatasetHolder()
+if DATASET_WARMUP != 'background':
+    dataset_holder.swap(load_dataset())
+
+app = create_app(dataset_holder, default_date='latest' if DATA_SOURCE == 'gsheet' else 'today',
+                 metrics=metrics)
+application = app.server
+
+# Everything allocated so far lives as long as the process. Moving it out of the
+# garbage collector's reach keeps collections in the workers from writing to,
+# and so un-sharing, the pages holding the dataset
+gc.freeze()